@@ -0,0 +1,461 @@
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+
+from change_log import head_seq
+from db_pool import get_pool
+
+# Columnar snapshots for analytics. export_snapshot() copies purchase lines,
+# sales and the dimension tables out of the live database in one read
+# transaction (a WAL reader: writers are never blocked) into typed NumPy
+# columns, one .npy file each, under <snapshot dir>/<version>/. Product and
+# store ids are dictionary-encoded as dense int32 codes (position in the
+# sorted id column of their dimension), so group-bys are bincounts over small
+# integer keys. load_snapshot() memory-maps the files; the OS page cache is
+# shared by every process that reads the same snapshot.
+
+# Directory holding each database's <db name>-snapshot (default: next to the database)
+SNAPSHOT_DIR = os.getenv("ANALYTICS_SNAPSHOT_DIR")
+# Seconds a snapshot is used before current_snapshot() exports a new one
+SNAPSHOT_MAX_AGE = float(os.getenv("ANALYTICS_SNAPSHOT_MAX_AGE", "300"))
+# Old snapshot versions kept on disk (readers may still have them mapped)
+SNAPSHOT_KEEP = int(os.getenv("ANALYTICS_SNAPSHOT_KEEP", "2"))
+# Rows fetched per fetchmany() while exporting
+EXPORT_BATCH = int(os.getenv("ANALYTICS_EXPORT_BATCH", "50000"))
+# Sales window (days, ending at the latest sale) when no dates are given
+DEFAULT_WINDOW_DAYS = int(os.getenv("ANALYTICS_WINDOW_DAYS", "30"))
+
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+
+# table -> (query, [(column, dtype)]); ids are encoded after loading
+EXPORT_TABLES = {
+    "products": ("SELECT ProductId, ProductName, Size FROM Products ORDER BY ProductId;",
+                 [("id", np.int64), ("name", str), ("size", str)]),
+    "stores": ("""
+        SELECT s.StoreId, COALESCE(c.CityName, '')
+        FROM Stores s LEFT JOIN Cities c ON s.CityId = c.CityId
+        ORDER BY s.StoreId;
+    """, [("id", np.int64), ("city", str)]),
+    # Archived lines are depleted (Quantity 0) but still count as purchases
+    "lines": ("""
+        SELECT il.ProductId, i.StoreId, i.InvoiceDate, il.Quantity,
+               CAST(il.PurchasePrice AS REAL), CAST(il.LineTotal AS REAL)
+        FROM InvoicesAll i
+        JOIN InvoiceLinesAll il ON il.InvoiceId = i.InvoiceId;
+    """, [("product", np.int64), ("store", np.int64), ("date", "datetime64[D]"),
+          ("quantity", np.int32), ("price", np.float64), ("total", np.float64)]),
+    "sales": ("""
+        SELECT ProductId, StoreId, SaleDate, Quantity, CAST(TotalAmount AS REAL)
+        FROM SalesAll;
+    """, [("product", np.int64), ("store", np.int64), ("date", "datetime64[D]"),
+          ("quantity", np.int32), ("amount", np.float64)]),
+}
+
+_loaded = {}
+_export_locks = {}
+_locks_lock = threading.Lock()
+
+
+def snapshot_dir(db_path):
+    """Snapshot directory of one database (each database, e.g. each shard, has its own)."""
+    if SNAPSHOT_DIR:
+        return os.path.join(SNAPSHOT_DIR, f"{os.path.basename(db_path)}-snapshot")
+    return f"{db_path}-snapshot"
+
+
+# ---------- Export ----------
+def _read_columns(cur, query, columns):
+    """Streams a query into one NumPy array per column, EXPORT_BATCH rows at a time."""
+    cur.execute(query)
+    chunks = [[] for _ in columns]
+    while True:
+        rows = cur.fetchmany(EXPORT_BATCH)
+        if not rows:
+            break
+        for chunk, values, (_, dtype) in zip(chunks, zip(*rows), columns):
+            chunk.append(np.array(values, dtype=dtype))
+    return {name: np.concatenate(chunk) if chunk else np.array([], dtype=dtype)
+            for chunk, (name, dtype) in zip(chunks, columns)}
+
+
+def _dictionary(values):
+    """(sorted distinct values, int32 code of each value)."""
+    distinct, codes = np.unique(values, return_inverse=True)
+    return distinct, codes.astype(np.int32)
+
+
+def _encode(ids, dimension_ids):
+    """Codes of ids in a sorted dimension id column; -1 for ids it lacks."""
+    codes = np.searchsorted(dimension_ids, ids).astype(np.int32)
+    inside = codes < len(dimension_ids)
+    codes[inside & (dimension_ids[np.minimum(codes, len(dimension_ids) - 1)] != ids)] = -1
+    codes[~inside] = -1
+    return codes
+
+
+def _columns(conn):
+    """
+    All snapshot columns, read in one transaction so the tables agree with
+    each other, and the ChangeLog head Seq they include. conn is a db_pool
+    connection.
+    """
+    cur = conn.cursor(tuples=True)
+    cur.execute("BEGIN;")
+    try:
+        change_seq = head_seq(cur)
+        tables = {name: _read_columns(cur, query, columns)
+                  for name, (query, columns) in EXPORT_TABLES.items()}
+    finally:
+        cur.execute("COMMIT;")
+
+    products, stores = tables["products"], tables["stores"]
+    names, name_codes = _dictionary(products["name"])
+    sizes, size_codes = _dictionary(products["size"])
+    cities, city_codes = _dictionary(stores["city"])
+    out = {
+        "product_id": products["id"], "product_name": name_codes, "product_size": size_codes,
+        "names": names, "sizes": sizes,
+        "store_id": stores["id"], "store_city": city_codes, "cities": cities,
+    }
+    for table in ("lines", "sales"):
+        for column, values in tables[table].items():
+            if column == "product":
+                values = _encode(values, products["id"])
+            elif column == "store":
+                values = _encode(values, stores["id"])
+            out[f"{table}_{column}"] = values
+    # Rows pointing at a product or store the dimensions lack cannot be grouped
+    for table in ("lines", "sales"):
+        keep = (out[f"{table}_product"] >= 0) & (out[f"{table}_store"] >= 0)
+        if not keep.all():
+            for column in tables[table]:
+                out[f"{table}_{column}"] = out[f"{table}_{column}"][keep]
+    return out, change_seq
+
+
+def export_snapshot(conn, directory):
+    """
+    Writes a new snapshot version under directory and makes it current.
+    Returns its manifest.
+    """
+    started = time.time()
+    columns, change_seq = _columns(conn)
+    version = time.strftime("%Y%m%dT%H%M%S", time.gmtime(started)) + f"-{int(started * 1000) % 1000:03d}"
+    target = os.path.join(directory, version)
+    staging = target + ".tmp"
+    os.makedirs(staging, exist_ok=True)
+    for name, values in columns.items():
+        np.save(os.path.join(staging, f"{name}.npy"), values, allow_pickle=False)
+    dates = columns["sales_date"]
+    manifest = {
+        "version": version,
+        "created_at": started,
+        "export_seconds": round(time.time() - started, 3),
+        "rows": {"products": len(columns["product_id"]), "stores": len(columns["store_id"]),
+                 "lines": len(columns["lines_product"]), "sales": len(columns["sales_product"])},
+        "sales_from": str(dates.min()) if len(dates) else None,
+        "sales_to": str(dates.max()) if len(dates) else None,
+        "change_seq": change_seq,
+    }
+    with open(os.path.join(staging, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(staging, target)
+    # CURRENT names the live version; replacing it is atomic for readers
+    pointer = os.path.join(directory, CURRENT_FILE)
+    with open(f"{pointer}.{version}.tmp", "w") as f:
+        f.write(version)
+    os.replace(f"{pointer}.{version}.tmp", pointer)
+    _prune(directory, version)
+    return manifest
+
+
+def _prune(directory, current):
+    versions = sorted(v for v in os.listdir(directory)
+                      if os.path.isdir(os.path.join(directory, v)) and not v.endswith(".tmp"))
+    for old in versions[:-max(SNAPSHOT_KEEP, 1)]:
+        if old != current:
+            shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+
+
+# ---------- Loading ----------
+class Snapshot:
+    """
+    A loaded snapshot: read-only memory-mapped columns by name
+    (snap["sales_quantity"]) plus the manifest.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        self.columns = {
+            name[:-4]: np.load(os.path.join(path, name), mmap_mode="r", allow_pickle=False)
+            for name in os.listdir(path) if name.endswith(".npy")
+        }
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def version(self):
+        return self.manifest["version"]
+
+    @property
+    def age(self):
+        return time.time() - self.manifest["created_at"]
+
+
+def _export_lock(directory):
+    with _locks_lock:
+        return _export_locks.setdefault(directory, threading.Lock())
+
+
+def load_snapshot(directory):
+    """The current snapshot in directory (mapped once per version), or None."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    snap = _loaded.get(directory)
+    if snap is None or snap.version != version:
+        snap = _loaded[directory] = Snapshot(os.path.join(directory, version))
+    return snap
+
+
+def _unchanged(conn, snap):
+    # Nothing was logged since the export: an older snapshot is still exact
+    seq = snap.manifest.get("change_seq")
+    return seq is not None and head_seq(conn) == seq
+
+
+def current_snapshot(conn, directory, max_age=SNAPSHOT_MAX_AGE):
+    """
+    The current snapshot, exporting a new one first if there is none or it
+    is older than max_age and ChangeLog has moved since it was taken.
+    """
+    snap = load_snapshot(directory)
+    if snap is not None and (snap.age <= max_age or _unchanged(conn, snap)):
+        return snap
+    # One export per directory at a time; waiters pick up its result
+    with _export_lock(directory):
+        snap = load_snapshot(directory)
+        if snap is None or (snap.age > max_age and not _unchanged(conn, snap)):
+            export_snapshot(conn, directory)
+            snap = load_snapshot(directory)
+    return snap
+
+
+# ---------- Group-by kernels ----------
+def group_keys(*codes_and_sizes):
+    """
+    Combines parallel code columns into one group key per row.
+    Returns (distinct combined keys, group index of each row).
+    """
+    combined = np.zeros(len(codes_and_sizes[0][0]), dtype=np.int64)
+    for codes, size in codes_and_sizes:
+        combined = combined * size + codes
+    return np.unique(combined, return_inverse=True)
+
+
+def group_sum(groups, values, count):
+    """Per-group sums of values (group index per row, 0 <= index < count)."""
+    return np.bincount(groups, weights=values, minlength=count)
+
+
+def split_keys(keys, *sizes):
+    """Inverse of group_keys: the code column of each key part."""
+    parts = []
+    for size in reversed(sizes):
+        parts.append(keys % size)
+        keys = keys // size
+    return parts[::-1]
+
+
+# ---------- Metrics ----------
+METRIC_GROUPS = ("product", "store", "city")
+
+METRIC_ORDERS = ("revenue", "margin", "turnover", "days_of_supply", "stock")
+
+
+def _day_range(snap, date_from, date_to):
+    to = np.datetime64(date_to) if date_to else (
+        np.datetime64(snap.manifest["sales_to"]) if snap.manifest["sales_to"] else np.datetime64("today"))
+    start = np.datetime64(date_from) if date_from else to - np.timedelta64(DEFAULT_WINDOW_DAYS - 1, "D")
+    return start, to
+
+
+def _row_groups(snap, table, group_by):
+    """Per-row code columns (and their cardinalities) for the grouping, for lines or sales."""
+    parts = []
+    for g in group_by:
+        if g == "product":
+            parts.append((snap[f"{table}_product"], len(snap["product_id"])))
+        elif g == "store":
+            parts.append((snap[f"{table}_store"], len(snap["store_id"])))
+        else:
+            parts.append((np.asarray(snap["store_city"])[snap[f"{table}_store"]], len(snap["cities"])))
+    return parts
+
+
+def inventory_metrics(snap, group_by=("product",), date_from=None, date_to=None, order="revenue", limit=100):
+    """
+    Turnover, days of supply and margin per group over a sales window
+    (ISO dates, inclusive; default the DEFAULT_WINDOW_DAYS ending at the
+    latest sale). Cost of goods sold is units sold at the group's average
+    purchase cost per unit; turnover is that cost over the stock on hand
+    at cost; days of supply is stock on hand over average daily units sold.
+    """
+    unknown = [g for g in group_by if g not in METRIC_GROUPS]
+    if unknown:
+        raise ValueError(f"Unknown group(s): {', '.join(unknown)}. Available: {', '.join(METRIC_GROUPS)}.")
+    if order not in METRIC_ORDERS:
+        raise ValueError(f"Unknown order: {order}. Available: {', '.join(METRIC_ORDERS)}.")
+    group_by = list(group_by)
+    start, end = _day_range(snap, date_from, date_to)
+    days = int((end - start).astype(int)) + 1
+    if days <= 0:
+        raise ValueError("date_from is after date_to.")
+
+    sales_date = snap["sales_date"]
+    in_window = (sales_date >= start) & (sales_date <= end)
+    line_parts = _row_groups(snap, "lines", group_by)
+    sale_parts = [(codes[in_window], size) for codes, size in _row_groups(snap, "sales", group_by)]
+    sizes = [size for _, size in line_parts]
+
+    # One key space for both tables so their groups line up
+    lines = len(snap["lines_product"])
+    if group_by:
+        keys, groups = group_keys(*[(np.concatenate([lc, sc]), size)
+                                    for (lc, size), (sc, _) in zip(line_parts, sale_parts)])
+    else:
+        keys, groups = np.zeros(1, dtype=np.int64), np.zeros(lines + int(in_window.sum()), dtype=np.int64)
+    line_groups, sale_groups = groups[:lines], groups[lines:]
+    n = len(keys)
+
+    price = np.asarray(snap["lines_price"])
+    total = np.asarray(snap["lines_total"])
+    quantity = np.asarray(snap["lines_quantity"], dtype=np.float64)
+    purchased_units = np.divide(total, price, out=np.zeros_like(total), where=price > 0)
+    purchased_cost = group_sum(line_groups, total, n)
+    purchased = group_sum(line_groups, purchased_units, n)
+    stock = group_sum(line_groups, quantity, n)
+    stock_value = group_sum(line_groups, quantity * price, n)
+    sold = group_sum(sale_groups, np.asarray(snap["sales_quantity"], dtype=np.float64)[in_window], n)
+    revenue = group_sum(sale_groups, np.asarray(snap["sales_amount"])[in_window], n)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        unit_cost = np.where(purchased > 0, purchased_cost / purchased, 0.0)
+        cogs = sold * unit_cost
+        margin = revenue - cogs
+        margin_pct = np.where(revenue > 0, margin / revenue * 100, np.nan)
+        turnover = np.where(stock_value > 0, cogs / stock_value, np.nan)
+        days_of_supply = np.where(sold > 0, stock / (sold / days), np.nan)
+
+    sort_by = {"revenue": -revenue, "margin": -margin, "stock": -stock,
+               # Fastest movers first; groups with no stock value / no sales last
+               "turnover": np.where(np.isnan(turnover), np.inf, -turnover),
+               "days_of_supply": np.where(np.isnan(days_of_supply), np.inf, days_of_supply)}[order]
+    top = np.argsort(sort_by, kind="stable")[:limit]
+
+    code_columns = split_keys(keys[top], *sizes) if group_by else []
+    labels = []
+    for g, codes in zip(group_by, code_columns):
+        if g == "product":
+            name = np.asarray(snap["names"])[np.asarray(snap["product_name"])[codes]]
+            size = np.asarray(snap["sizes"])[np.asarray(snap["product_size"])[codes]]
+            labels += [("ProductId", np.asarray(snap["product_id"])[codes].tolist()),
+                       ("ProductName", name.tolist()), ("Size", size.tolist())]
+        elif g == "store":
+            labels.append(("StoreId", np.asarray(snap["store_id"])[codes].tolist()))
+        else:
+            labels.append(("City", np.asarray(snap["cities"])[codes].tolist()))
+
+    def value(x):
+        return None if np.isnan(x) else round(float(x), 2)
+
+    rows = []
+    for position, i in enumerate(top):
+        row = {label: values[position] for label, values in labels}
+        row.update({
+            "Stock": int(stock[i]), "StockValue": round(float(stock_value[i]), 2),
+            "UnitsSold": int(sold[i]), "Revenue": round(float(revenue[i]), 2),
+            "COGS": round(float(cogs[i]), 2), "Margin": round(float(margin[i]), 2),
+            "MarginPct": value(margin_pct[i]), "Turnover": value(turnover[i]),
+            "DaysOfSupply": value(days_of_supply[i]),
+        })
+        rows.append(row)
+    return {"data": rows, "from": str(start), "to": str(end), "days": days,
+            "group_by": group_by, "snapshot": snap.version}
+
+
+# ---------- Dashboard aggregates ----------
+def dashboard_totals(snap):
+    """
+    The dashboard's per-database totals (the shapes dashboard.merged_data()
+    takes) computed from a snapshot: stock per product name, revenue per
+    product name, stock per city, and stock per (name, size). Products whose
+    lines are all archived show up with 0 units (StockLevels drops them).
+    """
+    names = np.asarray(snap["names"])
+    sizes = np.asarray(snap["sizes"])
+    product_name = np.asarray(snap["product_name"])
+    product_size = np.asarray(snap["product_size"])
+    store_city = np.asarray(snap["store_city"])
+    lines_product = np.asarray(snap["lines_product"])
+    quantity = np.asarray(snap["lines_quantity"], dtype=np.float64)
+
+    # Stock per product name, over names that have purchase lines
+    line_names = product_name[lines_product]
+    stock = group_sum(line_names, quantity, len(names))
+    stock_data = [{"ProductName": str(names[i]), "Stock": int(stock[i])} for i in np.unique(line_names)]
+
+    sale_names = product_name[np.asarray(snap["sales_product"])]
+    revenue = group_sum(sale_names, np.asarray(snap["sales_amount"]), len(names))
+    revenue_data = [{"ProductName": str(names[i]), "Revenue": float(revenue[i])} for i in np.unique(sale_names)]
+
+    line_cities = store_city[np.asarray(snap["lines_store"])]
+    city_stock = group_sum(line_cities, quantity, len(snap["cities"]))
+    city_data = [{"CityName": str(snap["cities"][i]), "Stock": int(city_stock[i])}
+                 for i in np.unique(line_cities)]
+
+    keys, groups = group_keys((line_names, len(names)), (product_size[lines_product], len(sizes)))
+    remaining = group_sum(groups, quantity, len(keys))
+    name_codes, size_codes = split_keys(keys, len(names), len(sizes))
+    size_data = [{"ProductName": str(names[name_codes[i]]), "Size": str(sizes[size_codes[i]]),
+                  "Remaining": int(remaining[i])}
+                 for i in range(len(keys))]
+
+    return [stock_data, revenue_data, city_data, size_data]
+
+
+# ---------- CLI ----------
+if __name__ == "__main__":
+    # python analytics.py export [path/to/inventory.db]
+    #        python analytics.py metrics [product|store|city[,...]] [order] [path/to/inventory.db]
+    command = sys.argv[1] if len(sys.argv) > 1 else "export"
+    if command not in ("export", "metrics"):
+        raise SystemExit("usage: python analytics.py (export [db_path] | metrics [group_by] [order] [db_path])")
+    if command == "export":
+        db = sys.argv[2] if len(sys.argv) > 2 else "inventory.db"
+        conn = get_pool(db).acquire(readonly=True)
+        manifest = export_snapshot(conn, snapshot_dir(db))
+        conn.close()
+        print(f"Snapshot {manifest['version']}: {manifest['rows']} in {manifest['export_seconds']}s")
+    else:
+        group_by = sys.argv[2].split(",") if len(sys.argv) > 2 else ["product"]
+        order = sys.argv[3] if len(sys.argv) > 3 else "revenue"
+        db = sys.argv[4] if len(sys.argv) > 4 else "inventory.db"
+        snap = load_snapshot(snapshot_dir(db))
+        if snap is None:
+            raise SystemExit(f"No snapshot in {snapshot_dir(db)}; run: python analytics.py export {db}")
+        report = inventory_metrics(snap, group_by, order=order, limit=20)
+        print(f"Snapshot {report['snapshot']}, sales {report['from']} .. {report['to']} ({report['days']} days)")
+        for r in report["data"]:
+            print("  " + "  ".join(f"{k}={v}" for k, v in r.items()))
@@ -0,0 +1,406 @@
+# api.py
+import heapq
+from itertools import islice
+
+from flask import Blueprint, Response, jsonify, request, url_for
+from analytics import current_snapshot, inventory_metrics, snapshot_dir
+from db_executor import get_executor
+from exports import FORMATS, ExportBusyError, export_filename, stream_export
+from inventory_crud import current_db_path, get_connection, use_database
+# Write and lookup functions go through sharding (inventory_crud's own without DB_SHARDS)
+from sharding import (
+    add_new_product_purchase,
+    update_existing_purchase,
+    update_sales,
+    product_locations,
+    search_products,
+    autocomplete_products,
+    delete_purchase_line,
+    delete_product_safe,
+    fan_out,
+    shard_map
+)
+from sales_rollup import merge_revenue_reports, revenue_report
+
+api_bp = Blueprint("api", __name__, url_prefix="/api")
+db = get_executor()
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# ---------- List resources (keyset pagination on the primary key) ----------
+# columns: public field name -> SQL expression; filters: query arg -> (SQL predicate, type).
+# With DB_SHARDS, resources with a "store" field are read from every shard and
+# merged on (key, store): ids are only unique within a shard, but a store
+# lives on one shard, so the pair orders rows across shards and the cursor
+# is ?after=<key>&after_store=<store>. The others are replicated dimensions,
+# read from the primary shard.
+LIST_RESOURCES = {
+    "products": {
+        "key": "ProductId",
+        "from": "Products p",
+        "columns": {
+            "ProductId": "p.ProductId",
+            "Brand": "p.Brand",
+            "ProductName": "p.ProductName",
+            "Size": "p.Size",
+        },
+        "filters": {
+            "product_name": ("p.ProductName = ?", str),
+            "size": ("p.Size = ?", str),
+            "brand": ("p.Brand = ?", int),
+        },
+    },
+    "stores": {
+        "key": "StoreId",
+        "from": "Stores s JOIN Cities c ON s.CityId = c.CityId",
+        "columns": {
+            "StoreId": "s.StoreId",
+            "CityId": "s.CityId",
+            "CityName": "c.CityName",
+        },
+        "filters": {
+            "city": ("c.CityName = ?", str),
+        },
+    },
+    "invoices": {
+        "key": "InvoiceLineId",
+        "store": "StoreId",
+        "from": "InvoiceLines il JOIN Invoices i ON il.InvoiceId = i.InvoiceId",
+        "columns": {
+            "InvoiceLineId": "il.InvoiceLineId",
+            "InvoiceId": "il.InvoiceId",
+            "StoreId": "i.StoreId",
+            "VendorNumber": "i.VendorNumber",
+            "InvoiceDate": "i.InvoiceDate",
+            "ProductId": "il.ProductId",
+            "InventoryId": "il.InventoryId",
+            "PurchasePrice": "il.PurchasePrice",
+            "Quantity": "il.Quantity",
+            "LineTotal": "il.LineTotal",
+        },
+        "filters": {
+            "store_id": ("i.StoreId = ?", int),
+            "vendor_number": ("i.VendorNumber = ?", int),
+            "product_id": ("il.ProductId = ?", int),
+            "date_from": ("i.InvoiceDate >= ?", str),
+            "date_to": ("i.InvoiceDate <= ?", str),
+        },
+    },
+    "sales": {
+        "key": "SaleId",
+        "store": "StoreId",
+        "from": "Sales sa",
+        "columns": {
+            "SaleId": "sa.SaleId",
+            "StoreId": "sa.StoreId",
+            "ProductId": "sa.ProductId",
+            "SaleDate": "sa.SaleDate",
+            "Quantity": "sa.Quantity",
+            "SalePrice": "sa.SalePrice",
+            "TotalAmount": "sa.TotalAmount",
+        },
+        "filters": {
+            "store_id": ("sa.StoreId = ?", int),
+            "product_id": ("sa.ProductId = ?", int),
+            "date_from": ("sa.SaleDate >= ?", str),
+            "date_to": ("sa.SaleDate <= ?", str),
+        },
+    },
+}
+
+
+def _error(message, status=400):
+    return jsonify({"error": message}), status
+
+
+def _conditional(payload, status=200):
+    """JSON response with an ETag; answers 304 when If-None-Match matches."""
+    resp = jsonify(payload)
+    resp.status_code = status
+    if status == 200:
+        resp.add_etag()
+        resp = resp.make_conditional(request)
+    return resp
+
+
+def _result(result, status=200):
+    # inventory_crud reports validation problems as {"error": ...}
+    if isinstance(result, dict) and "error" in result:
+        return _error(result["error"])
+    return jsonify(result), status
+
+
+def page_sql(spec, selected, where):
+    """One keyset page: rows after the cursor, in primary-key order."""
+    columns = spec["columns"]
+    return (f"SELECT {', '.join(f'{columns[f]} AS {f}' for f in selected)} "
+            f"FROM {spec['from']} WHERE {' AND '.join(where)} "
+            f"ORDER BY {columns[spec['key']]} LIMIT ?;")
+
+
+def _fetch_page(sql, params):
+    conn = get_connection(readonly=True)
+    try:
+        return conn.cursor(tuples=True).execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def _read_page(spec, sql, params, count, order, store_id=None):
+    """
+    Up to `count` rows of a page from the current database, or merged from
+    the shards: `order` is the (key, store) positions in each row.
+    """
+    shards = shard_map()
+    if shards is None:
+        return _fetch_page(sql, params)
+    if "store" not in spec:
+        path = shards.primary_path
+    elif store_id is not None:
+        path = shards.path_of(store_id)
+    else:
+        pages = fan_out(_fetch_page, sql, params)
+        return list(islice(heapq.merge(*pages.values(), key=lambda r: (r[order[0]], r[order[1]])), count))
+    with use_database(path):
+        return _fetch_page(sql, params)
+
+
+def _list(resource_name):
+    spec = LIST_RESOURCES[resource_name]
+    key = spec["key"]
+    columns = spec["columns"]
+
+    fields = request.args.get("fields")
+    if fields:
+        selected = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in selected if f not in columns]
+        if unknown:
+            return _error(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(columns)}.")
+        if key not in selected:
+            selected.insert(0, key)
+    else:
+        selected = list(columns)
+    store = spec.get("store") if shard_map() is not None else None
+    if store and store not in selected:
+        selected.insert(1, store)
+
+    try:
+        limit = min(max(int(request.args.get("limit", DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        after = int(request.args.get("after", 0))
+        after_store = int(request.args["after_store"]) if store and "after_store" in request.args else None
+        if after_store is None:
+            where, params = [f"{columns[key]} > ?"], [after]
+        else:
+            # (key, store) > (after, after_store), as a range on the key
+            where = [f"{columns[key]} >= ?", f"({columns[key]} > ? OR {columns[store]} > ?)"]
+            params = [after, after, after_store]
+        for arg, (predicate, cast) in spec["filters"].items():
+            if arg in request.args:
+                where.append(predicate)
+                params.append(cast(request.args[arg]))
+        store_id = int(request.args["store_id"]) if store and "store_id" in request.args else None
+    except ValueError as e:
+        return _error(f"Invalid query parameter: {e}")
+
+    order = (selected.index(key), selected.index(store) if store else None)
+    rows = db.read(_read_page, spec, page_sql(spec, selected, where), params + [limit + 1], limit + 1,
+                   order, store_id)
+
+    has_more = len(rows) > limit
+    data = [dict(zip(selected, r)) for r in rows[:limit]]
+    next_after = data[-1][key] if has_more else None
+    payload = {"data": data, "limit": limit, "next_after": next_after, "next": None}
+    if store:
+        payload["next_after_store"] = data[-1][store] if has_more else None
+    if next_after is not None:
+        args = request.args.to_dict()
+        args["after"] = next_after
+        if store:
+            args["after_store"] = payload["next_after_store"]
+        payload["next"] = url_for(request.endpoint, **args)
+    return _conditional(payload)
+
+
+@api_bp.route("/products", methods=["GET"])
+def list_products():
+    return _list("products")
+
+@api_bp.route("/stores", methods=["GET"])
+def list_stores():
+    return _list("stores")
+
+@api_bp.route("/invoices", methods=["GET"])
+def list_invoice_lines():
+    return _list("invoices")
+
+@api_bp.route("/sales", methods=["GET"])
+def list_sales():
+    return _list("sales")
+
+
+# ---------- CRUD operations ----------
+def _body(*fields, casts=None):
+    """Required fields from the JSON body (or form), cast per `casts`."""
+    data = request.get_json(silent=True) or request.form.to_dict(flat=True) or request.args.to_dict()
+    missing = [f for f in fields if data.get(f) in (None, "")]
+    if missing:
+        raise ValueError(f"Missing field(s): {', '.join(missing)}.")
+    out = {f: data[f] for f in fields}
+    for name, cast in (casts or {}).items():
+        if data.get(name) not in (None, ""):
+            out[name] = cast(data[name])
+    return out
+
+
+@api_bp.route("/purchases", methods=["POST"])
+def api_add_purchase():
+    try:
+        data = _body("store_id", "product_id", "product_name", "size", "vendor_number", "vendor_name",
+                     "invoice_date", "purchase_price", "quantity",
+                     casts={"store_id": int, "product_id": int, "vendor_number": int,
+                            "purchase_price": float, "quantity": int})
+    except (TypeError, ValueError) as e:
+        return _error(str(e))
+    return _result(db.write(add_new_product_purchase, **data), 201)
+
+@api_bp.route("/purchases", methods=["PATCH"])
+def api_update_purchase():
+    try:
+        data = _body("city", "store_id", "vendor_name", "product_name", "size", "invoice_date", "quantity",
+                     casts={"store_id": int, "quantity": int})
+    except (TypeError, ValueError) as e:
+        return _error(str(e))
+    return _result(db.write(update_existing_purchase, **data))
+
+@api_bp.route("/purchases", methods=["DELETE"])
+def api_delete_purchase():
+    try:
+        data = _body("city", "store_id", "vendor_name", "product_name", "size", "invoice_date",
+                     casts={"store_id": int})
+    except (TypeError, ValueError) as e:
+        return _error(str(e))
+    return _result(db.write(delete_purchase_line, **data))
+
+@api_bp.route("/sales", methods=["POST"])
+def api_record_sale():
+    try:
+        data = _body("city", "store_id", "product_name", "size", "sale_date", "quantity",
+                     casts={"store_id": int, "quantity": int, "sale_price": float})
+    except (TypeError, ValueError) as e:
+        return _error(str(e))
+    return _result(db.write(update_sales, **data), 201)
+
+@api_bp.route("/inventory", methods=["GET"])
+def api_inventory():
+    product_name = request.args.get("product_name")
+    if not product_name:
+        return _error("Missing query parameter: product_name.")
+    return _conditional({"data": [r.as_dict() for r in db.read(product_locations, product_name)]})
+
+@api_bp.route("/products/search", methods=["GET"])
+def api_search_products():
+    """Ranked matches for ?q= (prefix, substring, then typo-tolerant unless ?fuzzy=0)."""
+    return _product_lookup(search_products, fuzzy=request.args.get("fuzzy", "1") != "0")
+
+@api_bp.route("/products/autocomplete", methods=["GET"])
+def api_autocomplete_products():
+    """Name suggestions for a partially typed ?q=."""
+    return _product_lookup(autocomplete_products)
+
+def _product_lookup(fn, **options):
+    text = request.args.get("q", "").strip()
+    if not text:
+        return _error("Missing query parameter: q.")
+    try:
+        limit = min(max(int(request.args.get("limit", 10)), 1), MAX_LIMIT)
+    except ValueError as e:
+        return _error(f"Invalid query parameter: {e}")
+    return _conditional({"data": db.read(fn, text, request.args.get("size"), limit, **options), "q": text})
+
+@api_bp.route("/reports/revenue", methods=["GET"])
+def api_revenue_report():
+    """Revenue between ?from= and ?to= (ISO dates), grouped by ?group_by=product,store,city,date,month."""
+    args = request.args
+    if not args.get("from") or not args.get("to"):
+        return _error("Missing query parameter(s): from, to.")
+    group_by = [g.strip() for g in args.get("group_by", "product").split(",") if g.strip()]
+    try:
+        store_id = int(args["store_id"]) if "store_id" in args else None
+        product_id = int(args["product_id"]) if "product_id" in args else None
+        limit = min(max(int(args.get("limit", DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        rows = db.read(_revenue_report, args["from"], args["to"], group_by, store_id, product_id,
+                       args.get("city"), args.get("order", "revenue"), limit)
+    except ValueError as e:
+        return _error(str(e))
+    return _conditional({"data": rows, "group_by": group_by, "from": args["from"], "to": args["to"]})
+
+def _revenue_report_on(date_from, date_to, group_by, store_id, product_id, city, order, limit):
+    conn = get_connection(readonly=True)
+    try:
+        return revenue_report(conn, date_from, date_to, group_by, store_id, product_id, city, order, limit)
+    finally:
+        conn.close()
+
+def _revenue_report(date_from, date_to, group_by, store_id, product_id, city, order, limit):
+    shards = shard_map()
+    if shards is None:
+        return _revenue_report_on(date_from, date_to, group_by, store_id, product_id, city, order, limit)
+    if store_id is not None:
+        with use_database(shards.path_of(store_id)):
+            return _revenue_report_on(date_from, date_to, group_by, store_id, product_id, city, order, limit)
+    # Groups can span shards: every shard reports all its groups (LIMIT -1),
+    # then the sums are merged, re-sorted and limited
+    parts = fan_out(_revenue_report_on, date_from, date_to, group_by, store_id, product_id, city, order, -1)
+    return merge_revenue_reports(parts.values(), order, limit)
+
+@api_bp.route("/analytics/inventory", methods=["GET"])
+def api_inventory_metrics():
+    """
+    Turnover, days of supply and margin from the columnar snapshot, grouped by
+    ?group_by=product,store,city over ?from= / ?to= (default: last 30 days of sales).
+    """
+    if shard_map() is not None:
+        # Ratios per group cannot be merged from per-shard reports
+        return _error("Inventory metrics are not available with DB_SHARDS; query each shard's database.", 501)
+    args = request.args
+    group_by = [g.strip() for g in args.get("group_by", "product").split(",") if g.strip()]
+    try:
+        limit = min(max(int(args.get("limit", DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        report = db.read(_inventory_metrics, group_by, args.get("from"), args.get("to"),
+                         args.get("order", "revenue"), limit)
+    except ValueError as e:
+        return _error(str(e))
+    return _conditional(report)
+
+def _inventory_metrics(*args):
+    conn = get_connection(readonly=True)
+    try:
+        snap = current_snapshot(conn, snapshot_dir(current_db_path()))
+    finally:
+        conn.close()
+    return inventory_metrics(snap, *args)
+
+@api_bp.route("/export/<kind>", methods=["GET"])
+def api_export(kind):
+    """
+    Streams all purchases or sales (hot and archived) as ?format=csv|ndjson,
+    gzipped with ?gzip=1, filtered by ?date_from=, ?date_to=, ?store_id= and,
+    for purchases, ?vendor_number= or ?vendor=.
+    """
+    args = request.args
+    fmt = args.get("format", "csv")
+    gzip = args.get("gzip", "0").lower() in ("1", "true", "yes")
+    filters = {k: v for k, v in args.items() if k not in ("format", "gzip")}
+    try:
+        chunks = stream_export(kind, fmt, filters, gzip)
+    except ExportBusyError as e:
+        return _error(str(e), 429)
+    except ValueError as e:
+        return _error(str(e))
+    headers = {"Content-Disposition": f'attachment; filename="{export_filename(kind, fmt, gzip)}"'}
+    return Response(chunks, mimetype="application/gzip" if gzip else FORMATS[fmt], headers=headers)
+
+@api_bp.route("/products/<int:product_id>", methods=["DELETE"])
+def api_delete_product(product_id):
+    return _result(db.write(delete_product_safe, product_id))
@@ -1,22 +1,80 @@
-from flask import Flask, render_template, request
-from inventory_crud import (
+import csv
+import io
+import json
+import os
+
+from flask import Flask, Response, g, jsonify, render_template, request
+# Write and lookup functions go through sharding (inventory_crud's own without DB_SHARDS)
+from sharding import (
     add_new_product_purchase,
     update_existing_purchase,
     update_sales,
-    read_product_across_locations,
+    product_locations,
+    search_products,
     delete_purchase_line,        
-    delete_product_safe 
+    delete_product_safe,
+    bulk_add_purchases,
+    bulk_record_sales,
+    fan_out,
+    shard_map
 )
 from dashboard import dashboard_bp 
+from api import api_bp
+from change_log import consumer_status, head_seq
+from db_executor import executor_stats, get_executor
+from db_pool import pool_stats
+from inventory_crud import get_connection
+from query_metrics import begin_route, end_route, render_prometheus
+from ref_cache import ref_cache_stats
+from result_cache import result_cache_stats
+from schema_catalog import schema_stats
+from write_queue import write_queue_stats
 
 app = Flask(__name__)
+db = get_executor()
 
 app.register_blueprint(dashboard_bp)
+app.register_blueprint(api_bp)
+
+# Attribute SQL time to the route being served
+@app.before_request
+def _start_route_metrics():
+    rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+    g.route_metrics = begin_route(f"{request.method} {rule}")
+
+@app.teardown_request
+def _end_route_metrics(_exc):
+    token = g.pop("route_metrics", None)
+    if token is not None:
+        end_route(token)
 
 @app.route("/")
 def home():
     return render_template("index.html")
 
+def _read_records():
+    """
+    Rows of a bulk upload, from the request body or a 'file' form field.
+    Accepts CSV (header row), a JSON array, or JSON lines.
+    """
+    upload = request.files.get("file")
+    if upload:
+        raw = upload.read().decode("utf-8-sig")
+        filename = upload.filename or ""
+    else:
+        raw = request.get_data(as_text=True)
+        filename = ""
+    fmt = request.args.get("format", "").lower()
+    if not fmt:
+        is_csv = "csv" in (request.mimetype or "") or filename.lower().endswith(".csv")
+        fmt = "csv" if is_csv else "json"
+    if fmt == "csv":
+        return list(csv.DictReader(io.StringIO(raw)))
+    text = raw.strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
 # Add Purchase
 @app.route("/purchase", methods=["GET"])
 def add_purchase_form():
@@ -30,9 +88,19 @@ def add_purchase_submit():
     data["vendor_number"] = int(data["vendor_number"])
     data["purchase_price"] = float(data["purchase_price"])
     data["quantity"] = int(data["quantity"])
-    result = add_new_product_purchase(**data)
+    result = db.write(add_new_product_purchase, **data)
     return render_template("add_purchase.html", result=result)
 
+# Bulk Purchase (vendor feeds)
+@app.route("/purchase/bulk", methods=["POST"])
+def bulk_purchase_submit():
+    try:
+        rows = _read_records()
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"error": f"Could not parse upload: {e}"}), 400
+    result = db.write(bulk_add_purchases, rows)
+    return jsonify(result), (500 if "error" in result else 200)
+
 # Update Purchase
 @app.route("/purchase/update", methods=["GET"])
 def update_purchase_form():
@@ -43,7 +111,7 @@ def update_purchase_submit():
     data = request.form.to_dict(flat=True)
     data["store_id"] = int(data["store_id"])
     data["quantity"] = int(data["quantity"])
-    result = update_existing_purchase(**data)
+    result = db.write(update_existing_purchase, **data)
     return render_template("update_purchase.html", result=result)
 
 # Record Sale
@@ -57,9 +125,19 @@ def record_sale_submit():
     data["store_id"] = int(data["store_id"])
     data["quantity"] = int(data["quantity"])
     data["sale_price"] = float(data["sale_price"]) if data["sale_price"] else None
-    result = update_sales(**data)
+    result = db.write(update_sales, **data)
     return render_template("record_sale.html", result=result)
 
+# Batched Sales (end-of-day POS feeds)
+@app.route("/sale/bulk", methods=["POST"])
+def bulk_sale_submit():
+    try:
+        rows = _read_records()
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"error": f"Could not parse upload: {e}"}), 400
+    result = db.write(bulk_record_sales, rows)
+    return jsonify(result), (500 if "error" in result else 200)
+
 # View Inventory
 @app.route("/inventory", methods=["GET"])
 def view_inventory_form():
@@ -68,8 +146,11 @@ def view_inventory_form():
 @app.route("/inventory", methods=["POST"])
 def view_inventory_submit():
     product_name = request.form["product_name"]
-    results = read_product_across_locations(product_name)
-    return render_template("view_inventory.html", results=results)
+    results = db.read(product_locations, product_name)
+    # No exact catalog name: offer the closest products instead
+    suggestions = [] if results else db.read(search_products, product_name)
+    return render_template("view_inventory.html", results=results, product_name=product_name,
+                           suggestions=suggestions)
     
 @app.route("/purchase/delete", methods=["GET"])
 def delete_purchase_form():
@@ -79,7 +160,8 @@ def delete_purchase_form():
 def delete_purchase_submit():
     data = request.form.to_dict(flat=True)
     data["store_id"] = int(data["store_id"])
-    result = delete_purchase_line(
+    result = db.write(
+        delete_purchase_line,
         city=data["city"],
         store_id=data["store_id"],
         vendor_name=data["vendor_name"],
@@ -100,8 +182,57 @@ def delete_product_submit():
     except ValueError:
         return render_template("delete_product.html", title="Delete Product",
                                result={"error": "product_id must be an integer."})
-    result = delete_product_safe(product_id)
+    result = db.write(delete_product_safe, product_id)
     return render_template("delete_product.html", title="Delete Product", result=result)
+
+# Connection pool metrics
+@app.route("/health/db", methods=["GET"])
+def db_health():
+    return jsonify(pool_stats())
+
+# Database executor queue depths
+@app.route("/health/executor", methods=["GET"])
+def executor_health():
+    return jsonify(executor_stats())
+
+# Write queue batch sizes and commit times
+@app.route("/health/writes", methods=["GET"])
+def write_queue_health():
+    return jsonify(write_queue_stats())
+
+# Per-query and per-route SQL metrics (Prometheus text format)
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+# Reference-data cache counters
+@app.route("/health/cache", methods=["GET"])
+def cache_health():
+    return jsonify(ref_cache_stats())
+
+@app.route("/health/cache/results", methods=["GET"])
+def result_cache_health():
+    return jsonify(result_cache_stats())
+
+@app.route("/health/schema", methods=["GET"])
+def schema_health():
+    return jsonify(schema_stats())
+
+# ChangeLog head and how far each consumer is behind
+@app.route("/health/changes", methods=["GET"])
+def change_log_health():
+    # Each shard has its own log
+    if shard_map() is not None:
+        return jsonify(fan_out(_change_log_status))
+    return jsonify(_change_log_status())
+
+def _change_log_status():
+    conn = get_connection(readonly=True)
+    try:
+        return {"head": head_seq(conn), "consumers": consumer_status(conn)}
+    finally:
+        conn.close()
     
 if __name__ == "__main__":
-    app.run(debug=True)
+    # Development server only; see wsgi.py / asgi.py for production serving
+    app.run(debug=os.getenv("FLASK_DEBUG", "1") == "1")
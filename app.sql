@@ -183,6 +183,8 @@ DROP TABLE IF EXISTS Stores;
 DROP TABLE IF EXISTS Vendors;
 DROP TABLE IF EXISTS Products;
 DROP TABLE IF EXISTS Cities;
+-- External-content search index over Products; migrations.py rebuilds it
+DROP TABLE IF EXISTS ProductSearch;
 
 CREATE TABLE Cities (
     CityId    INTEGER PRIMARY KEY,
@@ -293,10 +295,50 @@ ON InvoiceLines (InvoiceId);
 
 CREATE INDEX IF NOT EXISTS idx_invoicelines_product
 ON InvoiceLines (ProductId);
+
+-- Open (non-depleted) lots only; used by FIFO depletion in update_sales
+CREATE INDEX IF NOT EXISTS idx_invoicelines_open_lots
+ON InvoiceLines (ProductId, InvoiceLineId)
+WHERE Quantity > 0;
 """)
 conn.commit()
 
 
+cur.executescript("""
+-- StockLevels: maintained on-hand quantity per (store, product).
+-- Kept in step by every write path in inventory_crud.py;
+-- `python stock_levels.py verify|rebuild` checks or recomputes it.
+DROP TABLE IF EXISTS StockLevels;
+
+CREATE TABLE StockLevels (
+    StoreId    INTEGER NOT NULL,
+    ProductId  INTEGER NOT NULL,
+    Quantity   INTEGER NOT NULL DEFAULT 0,
+    LineCount  INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (StoreId, ProductId)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_stocklevels_product
+ON StockLevels (ProductId, StoreId);
+
+INSERT INTO StockLevels (StoreId, ProductId, Quantity, LineCount)
+SELECT i.StoreId, il.ProductId, SUM(il.Quantity), COUNT(*)
+FROM InvoiceLines il
+JOIN Invoices i ON il.InvoiceId = i.InvoiceId
+GROUP BY i.StoreId, il.ProductId;
+""")
+conn.commit()
+print("StockLevels created and populated.")
+
+# Sales table, indexes for the hot query shapes and the schema version
+# (PRAGMA user_version) are managed by migrations.py
+from migrations import migrate
+# The tables above were recreated without the indexes and triggers later
+# migrations add to them, so a re-run replays every (idempotent) migration
+conn.execute("PRAGMA user_version = 0;")
+for number, description in migrate(conn):
+    print(f"Applied migration {number}: {description}")
+
 ###############################CRUD - DML############################################
 
 # ---------- 1️⃣ Add New Product Purchase ----------
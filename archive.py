@@ -0,0 +1,259 @@
+import argparse
+import os
+import sqlite3
+import sys
+
+from change_log import log_changes
+from stock_levels import adjust_stock_many
+
+# Archival of cold history. Fully depleted invoice lines (Quantity = 0) and
+# sales dated before a cutoff move out of the hot tables into per-period
+# tables (InvoiceLines_Archive_2016, Sales_Archive_2016_03, ...); invoice
+# headers follow once none of their lines are left. The *All views
+# (InvoiceLinesAll, InvoicesAll, SalesAll) UNION the hot table with every
+# archive table, so reports can span both. Ids are AUTOINCREMENT, so an
+# archived id is never reused by a hot row.
+#
+# An archived invoice header or sale keeps its natural key: a later purchase
+# for the same (store, vendor, date), or a sale for the same (store, product,
+# date), first moves the archived row back into the hot table with
+# restore_archived() and then extends it as usual, so InvoicesAll and
+# SalesAll never hold two rows for one key. A restored row is archived again
+# by the next run once it is eligible.
+
+# Archive table granularity: "year" or "month"
+ARCHIVE_PERIOD = os.getenv("ARCHIVE_PERIOD", "year")
+# Rows moved per write transaction
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "5000"))
+
+PERIOD_FORMATS = {"year": "%Y", "month": "%Y_%m"}
+
+# base table -> (id column, extra archive index columns)
+HISTORY_TABLES = {
+    "InvoiceLines": ("InvoiceLineId", ("ProductId",)),
+    "Invoices": ("InvoiceId", ("StoreId", "VendorNumber", "InvoiceDate")),
+    "Sales": ("SaleId", ("ProductId", "SaleDate")),
+}
+
+# base table -> natural key an upsert looks rows up by
+NATURAL_KEYS = {
+    "Invoices": ("StoreId", "VendorNumber", "InvoiceDate"),
+    "Sales": ("StoreId", "ProductId", "SaleDate"),
+}
+
+ARCHIVE_INDEXES_DDL = """
+-- Depleted lots, the archival candidates (the open-lots index is the complement)
+CREATE INDEX IF NOT EXISTS idx_invoicelines_depleted
+ON InvoiceLines (InvoiceId)
+WHERE Quantity = 0;
+
+CREATE INDEX IF NOT EXISTS idx_sales_date
+ON Sales (SaleDate);
+"""
+
+
+# ---------- Schema ----------
+def archive_tables(cur, base):
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ? ORDER BY name;",
+                (f"{base}_Archive_*",))
+    return [row[0] for row in cur.fetchall()]
+
+
+def rebuild_history_views(cur):
+    """(Re)creates InvoiceLinesAll, InvoicesAll and SalesAll over the hot and archive tables."""
+    for base in HISTORY_TABLES:
+        union = " UNION ALL ".join(f"SELECT * FROM {t}" for t in [base] + archive_tables(cur, base))
+        cur.execute(f"DROP VIEW IF EXISTS {base}All;")
+        cur.execute(f"CREATE VIEW {base}All AS {union};")
+
+
+def ensure_history_views(conn):
+    conn.executescript(ARCHIVE_INDEXES_DDL)
+    rebuild_history_views(conn.cursor())
+    conn.commit()
+
+
+def _archive_table(cur, base, period):
+    """Creates {base}_Archive_{period} like the hot table if needed. Returns (name, created)."""
+    name = f"{base}_Archive_{period}"
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;", (name,))
+    if cur.fetchone():
+        return name, False
+    id_column, indexed = HISTORY_TABLES[base]
+    cur.execute(f"CREATE TABLE {name} AS SELECT * FROM {base} WHERE 0;")
+    cur.execute(f"CREATE UNIQUE INDEX {name}_id ON {name} ({id_column});")
+    cur.execute(f"CREATE INDEX {name}_lookup ON {name} ({', '.join(indexed)});")
+    return name, True
+
+
+def _move(cur, base, rows_by_period):
+    """Copies then deletes {period: [ids]} from the hot table. Returns True if a table was created."""
+    id_column = HISTORY_TABLES[base][0]
+    created_any = False
+    for period, ids in rows_by_period.items():
+        table, created = _archive_table(cur, base, period)
+        created_any |= created
+        cur.execute("DELETE FROM temp.ArchiveIds;")
+        cur.executemany("INSERT INTO temp.ArchiveIds VALUES (?);", [(i,) for i in ids])
+        cur.execute(f"INSERT INTO {table} SELECT * FROM {base} WHERE {id_column} IN (SELECT Id FROM temp.ArchiveIds);")
+        cur.execute(f"DELETE FROM {base} WHERE {id_column} IN (SELECT Id FROM temp.ArchiveIds);")
+    return created_any
+
+
+def restore_archived(cur, base, keys):
+    """
+    Moves archived Invoices or Sales rows whose natural key is in `keys` (and
+    has no hot row) back into the hot table, inside the caller's transaction.
+    Returns the number of rows restored.
+    """
+    tables = archive_tables(cur, base) if keys else []
+    if not tables:
+        return 0
+    id_column = HISTORY_TABLES[base][0]
+    key_columns = NATURAL_KEYS[base]
+    match = " AND ".join(f"a.{c} = k.K{n}" for n, c in enumerate(key_columns, 1))
+    hot = " AND ".join(f"h.{c} = a.{c}" for c in key_columns)
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS ArchiveKeys (K1, K2, K3);")
+    cur.execute("DELETE FROM temp.ArchiveKeys;")
+    cur.executemany("INSERT INTO temp.ArchiveKeys VALUES (?, ?, ?);", keys)
+    restored = 0
+    for table in tables:
+        cur.execute(f"""
+            INSERT INTO {base}
+            SELECT a.* FROM {table} a JOIN temp.ArchiveKeys k ON {match}
+            WHERE NOT EXISTS (SELECT 1 FROM {base} h WHERE {hot});
+        """)
+        if cur.rowcount > 0:
+            restored += cur.rowcount
+            # Ids are never reused, so the matching ids now hot are the rows just copied
+            cur.execute(f"""
+                DELETE FROM {table}
+                WHERE {id_column} IN (SELECT a.{id_column} FROM {table} a JOIN temp.ArchiveKeys k ON {match})
+                  AND {id_column} IN (SELECT {id_column} FROM {base});
+            """)
+    cur.execute("DELETE FROM temp.ArchiveKeys;")
+    return restored
+
+
+# ---------- One archival batch ----------
+def archive_batch(tx, cutoff, limit=ARCHIVE_BATCH, period=ARCHIVE_PERIOD):
+    """
+    Moves up to `limit` depleted invoice lines and `limit` sales dated before
+    `cutoff` (ISO date) into archive tables, inside the caller's transaction.
+    Returns counts of rows moved.
+    """
+    fmt = PERIOD_FORMATS[period]
+    cur = tx.cursor()
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS ArchiveIds (Id INTEGER PRIMARY KEY);")
+
+    # Depleted lots on old invoices
+    cur.execute("""
+        SELECT il.InvoiceLineId, il.InvoiceId, i.StoreId, il.ProductId,
+               COALESCE(strftime(?, i.InvoiceDate), 'undated')
+        FROM InvoiceLines il INDEXED BY idx_invoicelines_depleted
+        JOIN Invoices i ON il.InvoiceId = i.InvoiceId
+        WHERE il.Quantity = 0 AND i.InvoiceDate < ?
+        LIMIT ?;
+    """, (fmt, cutoff, limit))
+    lines = cur.fetchall()
+    line_ids, line_counts, invoice_periods = {}, {}, {}
+    for line_id, invoice_id, store_id, product_id, line_period in lines:
+        line_ids.setdefault(line_period, []).append(line_id)
+        line_counts[(store_id, product_id)] = line_counts.get((store_id, product_id), 0) + 1
+        invoice_periods[invoice_id] = line_period
+    created = _move(cur, "InvoiceLines", line_ids)
+    # Depleted lots carry no quantity; only the backing line count changes
+    adjust_stock_many(cur, [(store_id, product_id, 0, -n) for (store_id, product_id), n in line_counts.items()])
+    log_changes(cur, [("archive", store_id, product_id, None, 0, -n, 0, None)
+                      for (store_id, product_id), n in line_counts.items()])
+
+    # Invoice headers with no hot lines left
+    emptied = {}
+    for invoice_id, invoice_period in invoice_periods.items():
+        cur.execute("SELECT 1 FROM InvoiceLines WHERE InvoiceId = ? LIMIT 1;", (invoice_id,))
+        if cur.fetchone() is None:
+            emptied.setdefault(invoice_period, []).append(invoice_id)
+    created |= _move(cur, "Invoices", emptied)
+
+    # Old sales
+    cur.execute("""
+        SELECT SaleId, ProductId, COALESCE(strftime(?, SaleDate), 'undated')
+        FROM Sales
+        WHERE SaleDate < ?
+        LIMIT ?;
+    """, (fmt, cutoff, limit))
+    sales = cur.fetchall()
+    sale_ids = {}
+    for sale_id, _, sale_period in sales:
+        sale_ids.setdefault(sale_period, []).append(sale_id)
+    created |= _move(cur, "Sales", sale_ids)
+
+    if created:
+        rebuild_history_views(cur)
+    cur.execute("DELETE FROM temp.ArchiveIds;")
+
+    product_ids = {product_id for _, product_id in line_counts} | {r[1] for r in sales}
+    return {"invoice_lines": len(lines), "invoices": sum(len(v) for v in emptied.values()),
+            "sales": len(sales), "product_ids": sorted(product_ids)}
+
+
+def archive_before(cutoff, batch=ARCHIVE_BATCH, period=ARCHIVE_PERIOD, progress=None):
+    """
+    Archives everything eligible before `cutoff` through the write queue, one
+    batch per transaction so app writes interleave. Returns totals.
+    """
+    from inventory_crud import notify_write, queued_mutation
+
+    @queued_mutation
+    def run_batch(tx):
+        moved = archive_batch(tx, cutoff, batch, period)
+        if moved["product_ids"]:
+            tx.after_commit(notify_write, "archive", moved["product_ids"])
+        return moved
+
+    totals = {"invoice_lines": 0, "invoices": 0, "sales": 0, "batches": 0}
+    while True:
+        moved = run_batch()
+        for key in ("invoice_lines", "invoices", "sales"):
+            totals[key] += moved[key]
+        totals["batches"] += 1
+        if progress:
+            progress(totals)
+        if moved["invoice_lines"] < batch and moved["sales"] < batch:
+            return totals
+
+
+def archive_status(conn):
+    """Row counts of the hot tables and of every archive table."""
+    cur = conn.cursor()
+    status = {}
+    for base in HISTORY_TABLES:
+        for table in [base] + archive_tables(cur, base):
+            status[table] = cur.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0]
+    return status
+
+
+# ---------- CLI ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move depleted lots and old sales into archive tables.")
+    parser.add_argument("--db", default=os.getenv("DB_PATH", "inventory.db"))
+    parser.add_argument("--before", help="cutoff date (YYYY-MM-DD); omit to only print status")
+    parser.add_argument("--period", choices=sorted(PERIOD_FORMATS), default=ARCHIVE_PERIOD)
+    parser.add_argument("--batch", type=int, default=ARCHIVE_BATCH, help="rows per transaction")
+    args = parser.parse_args(argv)
+
+    # inventory_crud reads DB_PATH at import time
+    os.environ["DB_PATH"] = args.db
+    if args.before:
+        totals = archive_before(args.before, args.batch, args.period,
+                                progress=lambda t: print(f"\r[archive] {t}", end="", file=sys.stderr))
+        print(file=sys.stderr)
+        print(totals)
+    conn = sqlite3.connect(args.db)
+    for table, rows in archive_status(conn).items():
+        print(f"{table:32} {rows:>12}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+# asgi.py
+# asyncio serving mode, e.g.
+#   uvicorn asgi:application --workers 1
+#   hypercorn asgi:application
+# The event loop owns the sockets; each request runs the Flask view on a
+# thread from a pool of ASGI_THREADS, so slow reads overlap instead of
+# queueing, and the views hand database work to db_executor (concurrent
+# readers, one serialized writer). Needs: pip install a2wsgi uvicorn
+# (asgiref's WsgiToAsgi runs every request on one shared thread.)
+import os
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError as e:
+    raise ImportError("asgi.py needs a2wsgi (pip install a2wsgi)") from e
+
+from app import app
+
+# Threads running Flask views (one per in-flight request)
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", "16"))
+
+
+def make_application(wsgi_app, threads=ASGI_THREADS):
+    """ASGI wrapper that runs wsgi_app on a pool of `threads` threads."""
+    return WSGIMiddleware(wsgi_app, workers=threads)
+
+
+application = make_application(app)
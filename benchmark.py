@@ -0,0 +1,434 @@
+import argparse
+import datetime
+import fnmatch
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+# Benchmark harness for the inventory_crud functions, the dashboard queries
+# and a mixed read/write workload under concurrent clients.
+#   python benchmark.py --db bench.db --generate 100000 --out run.json
+#   python benchmark.py --db bench.db --generate 100000 --baseline run.json
+# Scenarios mutate the database, so comparable runs regenerate it
+# (--generate) from the same seed first.
+
+SAMPLE_ROWS = 50_000
+
+
+# ---------- Scenario registry ----------
+# name -> setup(ctx) returning make(i); make(i) does untimed preparation and
+# returns the zero-argument callable that is timed.
+SCENARIOS = {}
+
+
+def scenario(name, concurrent=False):
+    def register(setup):
+        SCENARIOS[name] = (setup, concurrent)
+        return setup
+    return register
+
+
+class BenchContext:
+    """Sample keys from the database, drawn with a seeded RNG."""
+
+    def __init__(self, db_path, seed):
+        self.db_path = db_path
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        conn = sqlite3.connect(db_path)
+        self.stock = conn.execute(f"""
+            SELECT c.CityName, sl.StoreId, p.ProductName, p.Size, sl.Quantity
+            FROM StockLevels sl
+            JOIN Products p ON sl.ProductId = p.ProductId
+            JOIN Stores s ON sl.StoreId = s.StoreId
+            JOIN Cities c ON s.CityId = c.CityId
+            LIMIT {SAMPLE_ROWS};
+        """).fetchall()
+        self.in_stock = [r for r in self.stock if r[4] > 0]
+        self.vendors = conn.execute(f"SELECT VendorNumber, VendorName FROM Vendors LIMIT {SAMPLE_ROWS};").fetchall()
+        self.stores = [r[0] for r in conn.execute(f"SELECT StoreId FROM Stores LIMIT {SAMPLE_ROWS};")]
+        self._next_product = conn.execute("SELECT COALESCE(MAX(ProductId), 0) FROM Products;").fetchone()[0]
+        conn.close()
+        if not self.stock:
+            raise SystemExit(f"{db_path} has no stock; generate data first (--generate N).")
+
+    def choice(self, seq):
+        with self._lock:
+            return self.rng.choice(seq)
+
+    def randint(self, a, b):
+        with self._lock:
+            return self.rng.randint(a, b)
+
+    def random(self):
+        with self._lock:
+            return self.rng.random()
+
+    def new_product_id(self):
+        with self._lock:
+            self._next_product += 1
+            return self._next_product
+
+    def date(self, year=2017):
+        day = datetime.date(year, 1, 1) + datetime.timedelta(days=self.randint(0, 364))
+        return day.isoformat()
+
+
+# ---------- inventory_crud scenarios ----------
+@scenario("crud.add_new_product_purchase")
+def _add_new_product_purchase(ctx):
+    from inventory_crud import add_new_product_purchase
+
+    def make(i):
+        vendor_number, vendor_name = ctx.choice(ctx.vendors)
+        kwargs = dict(store_id=ctx.choice(ctx.stores), product_id=ctx.new_product_id(),
+                      product_name=f"Bench Product {i}", size="750mL", vendor_number=vendor_number,
+                      vendor_name=vendor_name, invoice_date=ctx.date(), purchase_price=9.99,
+                      quantity=ctx.randint(1, 24))
+        return lambda: add_new_product_purchase(**kwargs)
+    return make
+
+
+@scenario("crud.update_existing_purchase")
+def _update_existing_purchase(ctx):
+    from inventory_crud import update_existing_purchase
+
+    def make(i):
+        city, store_id, product_name, size, _ = ctx.choice(ctx.stock)
+        kwargs = dict(city=city, store_id=store_id, vendor_name=ctx.choice(ctx.vendors)[1],
+                      product_name=product_name, size=size, invoice_date=ctx.date(),
+                      quantity=ctx.randint(1, 12))
+        return lambda: update_existing_purchase(**kwargs)
+    return make
+
+
+@scenario("crud.update_sales")
+def _update_sales(ctx):
+    from inventory_crud import update_sales
+
+    def make(i):
+        city, store_id, product_name, size, _ = ctx.choice(ctx.in_stock)
+        kwargs = dict(city=city, store_id=store_id, product_name=product_name, size=size,
+                      sale_date=ctx.date(), quantity=1, sale_price=14.99)
+        return lambda: update_sales(**kwargs)
+    return make
+
+
+@scenario("crud.read_product_across_locations")
+def _read_product_across_locations(ctx):
+    from inventory_crud import read_product_across_locations
+
+    def make(i):
+        product_name = ctx.choice(ctx.stock)[2]
+        return lambda: read_product_across_locations(product_name)
+    return make
+
+
+@scenario("crud.product_locations")
+def _product_locations(ctx):
+    from inventory_crud import product_locations
+
+    def make(i):
+        product_name = ctx.choice(ctx.stock)[2]
+        return lambda: product_locations(product_name)
+    return make
+
+
+@scenario("crud.delete_purchase_line")
+def _delete_purchase_line(ctx):
+    from inventory_crud import delete_purchase_line, update_existing_purchase
+
+    def make(i):
+        # Untimed: add the line that the timed call deletes
+        city, store_id, product_name, size, _ = ctx.choice(ctx.stock)
+        key = dict(city=city, store_id=store_id, vendor_name=ctx.choice(ctx.vendors)[1],
+                   product_name=product_name, size=size, invoice_date=ctx.date(2031))
+        update_existing_purchase(quantity=1, **key)
+        return lambda: delete_purchase_line(**key)
+    return make
+
+
+@scenario("crud.delete_product_safe")
+def _delete_product_safe(ctx):
+    from inventory_crud import delete_product_safe, get_connection
+
+    def make(i):
+        # Untimed: an unreferenced product to delete
+        product_id = ctx.new_product_id()
+        conn = get_connection()
+        conn.execute("INSERT INTO Products (ProductId, Brand, ProductName, Size) VALUES (?, 1, ?, '1L');",
+                     (product_id, f"Bench Delete {i}"))
+        conn.commit()
+        conn.close()
+        return lambda: delete_product_safe(product_id)
+    return make
+
+
+@scenario("crud.bulk_add_purchases")
+def _bulk_add_purchases(ctx, batch=500):
+    from inventory_crud import bulk_add_purchases
+
+    def make(i):
+        rows = []
+        for _ in range(batch):
+            city, store_id, product_name, size, _ = ctx.choice(ctx.stock)
+            rows.append({"city": city, "store_id": store_id, "vendor_name": ctx.choice(ctx.vendors)[1],
+                         "product_name": product_name, "size": size, "invoice_date": ctx.date(),
+                         "quantity": ctx.randint(1, 12), "purchase_price": 8.5})
+        return lambda: bulk_add_purchases(rows)
+    return make
+
+
+@scenario("crud.bulk_record_sales")
+def _bulk_record_sales(ctx, batch=500):
+    from inventory_crud import bulk_record_sales
+
+    def make(i):
+        rows = []
+        for _ in range(batch):
+            city, store_id, product_name, size, _ = ctx.choice(ctx.in_stock)
+            rows.append({"city": city, "store_id": store_id, "product_name": product_name, "size": size,
+                         "sale_date": ctx.date(), "quantity": 1, "sale_price": 14.99})
+        return lambda: bulk_record_sales(rows)
+    return make
+
+
+# ---------- Dashboard scenarios ----------
+def _dashboard_query(sql_name):
+    def setup(ctx):
+        import dashboard
+        sql = getattr(dashboard, sql_name)
+        return lambda i: (lambda: dashboard.query_db(sql))
+    return setup
+
+
+for _name in ("STOCK_BY_PRODUCT_SQL", "TOP_REVENUE_SQL", "STOCK_BY_CITY_SQL", "LOW_STOCK_SQL"):
+    scenario(f"dashboard.{_name[:-4].lower()}")(_dashboard_query(_name))
+
+
+@scenario("dashboard.compute_aggregates")
+def _compute_aggregates(ctx):
+    from dashboard import compute_aggregates
+    return lambda i: compute_aggregates
+
+
+@scenario("dashboard.change_totals")
+def _change_totals(ctx):
+    from dashboard import change_totals
+    change_totals()  # seed once, outside the timed ops
+    return lambda i: change_totals
+
+
+@scenario("analytics.dashboard_snapshot")
+def _dashboard_snapshot(ctx):
+    from dashboard import snapshot_totals
+    snapshot_totals()  # export once, outside the timed ops
+    return lambda i: snapshot_totals
+
+
+@scenario("analytics.inventory_metrics")
+def _inventory_metrics(ctx):
+    from analytics import inventory_metrics
+    from dashboard import current_db_path, current_snapshot, get_connection, snapshot_dir
+    conn = get_connection(readonly=True)
+    try:
+        snap = current_snapshot(conn, snapshot_dir(current_db_path()))
+    finally:
+        conn.close()
+    groups = (["product"], ["store"], ["city"], ["store", "product"])
+    return lambda i: (lambda: inventory_metrics(snap, groups[i % len(groups)]))
+
+
+# ---------- Mixed workload ----------
+@scenario("mixed.read_write", concurrent=True)
+def _mixed(ctx, write_share=0.2, dashboard_share=0.05):
+    from dashboard import LOW_STOCK_SQL, query_db
+    read = _read_product_across_locations(ctx)
+    sale = _update_sales(ctx)
+
+    def make(i):
+        roll = ctx.random()
+        if roll < write_share:
+            return "update_sales", sale(i)
+        if roll < write_share + dashboard_share:
+            return "dashboard_low_stock", lambda: query_db(LOW_STOCK_SQL)
+        return "read_product_across_locations", read(i)
+    return make
+
+
+# ---------- Runner ----------
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def _latency_summary(latencies):
+    ordered = sorted(latencies)
+    ms = lambda v: round(v * 1000.0, 3) if v is not None else None
+    return {
+        "p50_ms": ms(_percentile(ordered, 50)),
+        "p95_ms": ms(_percentile(ordered, 95)),
+        "p99_ms": ms(_percentile(ordered, 99)),
+        "max_ms": ms(ordered[-1] if ordered else None),
+        "mean_ms": ms(sum(ordered) / len(ordered) if ordered else None),
+    }
+
+
+def run_scenario(ctx, name, ops, clients=1, warmup=3):
+    """Runs `ops` timed operations across `clients` threads. Returns a stats dict."""
+    setup, _ = SCENARIOS[name]
+    make = setup(ctx)
+    for i in range(warmup):
+        _unpack(make(-1 - i))[1]()
+
+    latencies = {}
+    errors = [0]
+    lock = threading.Lock()
+    counter = iter(range(ops))
+
+    def client():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            kind, fn = _unpack(make(i))
+            started = time.perf_counter()
+            try:
+                result = fn()
+                failed = isinstance(result, dict) and "error" in result
+            except Exception:
+                failed = True
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.setdefault(kind, []).append(elapsed)
+                errors[0] += failed
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    everything = [v for values in latencies.values() for v in values]
+    stats = {"ops": len(everything), "clients": clients, "errors": errors[0],
+             "seconds": round(wall, 4),
+             "ops_per_second": round(len(everything) / wall, 1) if wall > 0 else None,
+             **_latency_summary(everything)}
+    if len(latencies) > 1:
+        stats["by_kind"] = {kind: dict(ops=len(v), **_latency_summary(v)) for kind, v in sorted(latencies.items())}
+    return stats
+
+
+def _unpack(made):
+    return made if isinstance(made, tuple) else ("op", made)
+
+
+def _db_size(db_path):
+    return sum(os.path.getsize(db_path + s) for s in ("", "-wal") if os.path.exists(db_path + s))
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(report, baseline, tolerance):
+    """Scenarios whose p95 grew or throughput fell by more than `tolerance` versus the baseline."""
+    regressions = []
+    for name, stats in report["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        if base.get("p95_ms") and stats["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {stats['p95_ms']}ms")
+        if base.get("ops_per_second") and stats["ops_per_second"] < base["ops_per_second"] * (1 - tolerance):
+            regressions.append(f"{name}: {base['ops_per_second']} -> {stats['ops_per_second']} ops/s")
+    return regressions
+
+
+# ---------- CLI ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark inventory_crud, dashboard and mixed workloads.")
+    parser.add_argument("--db", default="bench.db", help="database to benchmark (it is modified)")
+    parser.add_argument("--generate", type=int, metavar="LINES",
+                        help="rebuild --db with this many synthetic InvoiceLines first")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scenarios", default="*", help="comma-separated names or globs (see --list)")
+    parser.add_argument("--ops", type=int, default=200, help="timed operations per scenario")
+    parser.add_argument("--bulk-ops", type=int, default=5, help="timed operations for bulk scenarios")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients for mixed scenarios")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--list", action="store_true", help="list scenarios and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("\n".join(sorted(SCENARIOS)))
+        return 0
+
+    generated = None
+    if args.generate:
+        from synthetic_data import generate
+        generated = generate(args.db, args.generate, args.seed, overwrite=True)
+
+    # inventory_crud reads DB_PATH at import time
+    os.environ["DB_PATH"] = args.db
+    patterns = [p.strip() for p in args.scenarios.split(",") if p.strip()]
+    names = [n for n in sorted(SCENARIOS) if any(fnmatch.fnmatch(n, p) for p in patterns)]
+
+    ctx = BenchContext(args.db, args.seed)
+    report = {
+        "meta": {
+            "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "ops": args.ops,
+            "clients": args.clients,
+        },
+        "db": {"path": args.db, "generated": generated, "size_bytes_before": _db_size(args.db)},
+        "scenarios": {},
+    }
+    for name in names:
+        concurrent = SCENARIOS[name][1]
+        ops = args.bulk_ops if name.startswith("crud.bulk_") else args.ops
+        report["scenarios"][name] = run_scenario(ctx, name, ops, args.clients if concurrent else 1)
+        print(f"[bench] {name}: {report['scenarios'][name]['ops_per_second']} ops/s, "
+              f"p95 {report['scenarios'][name]['p95_ms']} ms", file=sys.stderr)
+    report["db"]["size_bytes_after"] = _db_size(args.db)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+        status = 1 if regressions else 0
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
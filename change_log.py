@@ -0,0 +1,242 @@
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from collections import namedtuple
+
+# ChangeLog is an append-only feed of every stock and revenue change. The
+# mutations in inventory_crud.py (and archive / ETL batches) append their
+# deltas in the same transaction as the change itself, so an entry exists
+# exactly when its change committed. Seq comes from AUTOINCREMENT: it only
+# grows and is never reused, even after old entries are pruned, and with a
+# single writer the commit order is the Seq order. StockDelta / LineDelta
+# mirror StockLevels (Quantity, LineCount) and RevenueDelta mirrors
+# SalesDaily.Revenue, so summing a (store, product)'s deltas from a seeded
+# total keeps it current without rescanning InvoiceLines or Sales.
+#
+# Consumers tail the log from a checkpoint: ChangeConsumer applies each batch
+# inside a write transaction together with its new checkpoint in
+# ChangeConsumers, so a derived table in the same database sees every change
+# exactly once; effects outside the database must tolerate replays.
+CHANGE_LOG_DDL = """
+CREATE TABLE IF NOT EXISTS ChangeLog (
+    Seq           INTEGER PRIMARY KEY AUTOINCREMENT,
+    Event         TEXT NOT NULL,
+    StoreId       INTEGER,
+    ProductId     INTEGER,
+    Day           DATE,
+    StockDelta    INTEGER NOT NULL DEFAULT 0,
+    LineDelta     INTEGER NOT NULL DEFAULT 0,
+    RevenueDelta  NUMERIC NOT NULL DEFAULT 0,
+    Detail        TEXT,
+    LoggedAt      TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+);
+
+CREATE TABLE IF NOT EXISTS ChangeConsumers (
+    Consumer   TEXT PRIMARY KEY,
+    Seq        INTEGER NOT NULL,
+    UpdatedAt  TEXT NOT NULL
+);
+"""
+
+# Entries read per batch by consumers
+CHANGE_LOG_BATCH = int(os.getenv("CHANGE_LOG_BATCH", "1000"))
+# Seconds a consumer thread sleeps once it has caught up
+CHANGE_LOG_POLL = float(os.getenv("CHANGE_LOG_POLL", "1"))
+
+log = logging.getLogger(__name__)
+
+Change = namedtuple("Change", ("Seq", "Event", "StoreId", "ProductId", "Day",
+                               "StockDelta", "LineDelta", "RevenueDelta", "Detail", "LoggedAt"))
+
+INSERT_CHANGE_SQL = """
+    INSERT INTO ChangeLog (Event, StoreId, ProductId, Day, StockDelta, LineDelta, RevenueDelta, Detail)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+READ_CHANGES_SQL = """
+    SELECT Seq, Event, StoreId, ProductId, Day, StockDelta, LineDelta, RevenueDelta, Detail, LoggedAt
+    FROM ChangeLog
+    WHERE Seq > ?
+    ORDER BY Seq
+    LIMIT ?;
+"""
+
+
+# ---------- Schema ----------
+def ensure_change_log(conn):
+    conn.executescript(CHANGE_LOG_DDL)
+
+
+# ---------- Append (call inside the writer's transaction) ----------
+def _detail(detail):
+    return json.dumps(detail, separators=(",", ":")) if detail else None
+
+
+def log_change(cur, event, store_id=None, product_id=None, day=None,
+               stock=0, lines=0, revenue=0, detail=None):
+    """Appends one entry; `detail` (a dict) is stored as JSON."""
+    cur.execute(INSERT_CHANGE_SQL, (event, store_id, product_id, day, stock, lines, revenue, _detail(detail)))
+
+
+def log_changes(cur, entries):
+    """Appends many (event, store_id, product_id, day, stock, lines, revenue, detail) entries."""
+    cur.executemany(INSERT_CHANGE_SQL, [e[:7] + (_detail(e[7]),) for e in entries])
+
+
+# ---------- Read ----------
+def head_seq(conn):
+    """Highest Seq ever assigned (0 for an empty log); survives pruning."""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'ChangeLog';").fetchone()
+    return row[0] if row else 0
+
+
+def read_changes(conn, after=0, limit=CHANGE_LOG_BATCH):
+    """Up to `limit` entries with Seq > after, oldest first."""
+    changes = []
+    for row in conn.execute(READ_CHANGES_SQL, (after, limit)).fetchall():
+        row = tuple(row)
+        changes.append(Change(*row[:8], json.loads(row[8]) if row[8] else {}, row[9]))
+    return changes
+
+
+def get_checkpoint(conn, consumer):
+    """Last Seq the consumer has applied (0 if it never ran)."""
+    row = conn.execute("SELECT Seq FROM ChangeConsumers WHERE Consumer = ?;", (consumer,)).fetchone()
+    return row[0] if row else 0
+
+
+def save_checkpoint(cur, consumer, seq):
+    cur.execute("""
+        INSERT INTO ChangeConsumers (Consumer, Seq, UpdatedAt)
+        VALUES (?, ?, datetime('now'))
+        ON CONFLICT (Consumer) DO UPDATE
+        SET Seq = excluded.Seq, UpdatedAt = excluded.UpdatedAt;
+    """, (consumer, seq))
+
+
+def consumer_status(conn):
+    """Every consumer with its checkpoint and how many entries it is behind."""
+    head = head_seq(conn)
+    return [{"consumer": name, "seq": seq, "lag": head - seq, "updated_at": updated}
+            for name, seq, updated in conn.execute(
+                "SELECT Consumer, Seq, UpdatedAt FROM ChangeConsumers ORDER BY Consumer;").fetchall()]
+
+
+def prune_changes(conn, upto=None):
+    """
+    Deletes entries every registered consumer has applied (or, with `upto`,
+    entries with Seq <= upto). Returns the number of entries deleted.
+    """
+    if upto is None:
+        row = conn.execute("SELECT MIN(Seq) FROM ChangeConsumers;").fetchone()
+        if row[0] is None:
+            return 0
+        upto = row[0]
+    cur = conn.execute("DELETE FROM ChangeLog WHERE Seq <= ?;", (upto,))
+    conn.commit()
+    return cur.rowcount
+
+
+# ---------- Consumers ----------
+class ChangeConsumer:
+    """
+    Tails ChangeLog for one named consumer. poll() reads batches after the
+    consumer's checkpoint on a reader connection and hands each to
+    apply(tx, changes) on the write queue, which also stores the new
+    checkpoint: the batch and the checkpoint commit (or roll back) together.
+    After a crash or restart the consumer resumes after the last committed
+    batch; replay() rewinds it to rebuild from an earlier Seq.
+    """
+
+    def __init__(self, name, apply, db_path=None, batch=CHANGE_LOG_BATCH):
+        self.name = name
+        self.apply = apply
+        self.db_path = db_path
+        self.batch = batch
+        self.applied = 0
+
+    def _database(self):
+        from inventory_crud import current_db_path, use_database
+        return use_database(self.db_path or current_db_path())
+
+    def _apply_batch(self, tx, after, changes):
+        # Another poller of the same consumer got here first: skip the batch
+        if get_checkpoint(tx.conn, self.name) != after:
+            return 0
+        self.apply(tx, changes)
+        save_checkpoint(tx.cursor(), self.name, changes[-1].Seq)
+        return len(changes)
+
+    def poll(self, max_batches=None):
+        """Applies pending entries (up to max_batches batches). Returns how many were applied."""
+        from inventory_crud import get_connection, write_queue
+        applied = batches = 0
+        with self._database():
+            while max_batches is None or batches < max_batches:
+                conn = get_connection(readonly=True)
+                try:
+                    after = get_checkpoint(conn, self.name)
+                    changes = read_changes(conn, after, self.batch)
+                finally:
+                    conn.close()
+                if not changes:
+                    break
+                applied += write_queue().submit(self._apply_batch, after, changes).result()
+                batches += 1
+        self.applied += applied
+        return applied
+
+    def replay(self, from_seq=0):
+        """Moves the checkpoint back so entries after from_seq are applied again."""
+        from inventory_crud import write_queue
+        with self._database():
+            write_queue().submit(lambda tx: save_checkpoint(tx.cursor(), self.name, from_seq)).result()
+
+    def run(self, stop, interval=CHANGE_LOG_POLL):
+        """Polls until stop (a threading.Event) is set, sleeping `interval` once caught up."""
+        while not stop.is_set():
+            try:
+                caught_up = not self.poll()
+            except Exception:
+                # The failed batch rolled back with its checkpoint; retry it later
+                log.exception("Change consumer %s failed", self.name)
+                caught_up = True
+            if caught_up:
+                stop.wait(interval)
+
+    def start(self, interval=CHANGE_LOG_POLL):
+        """Runs the consumer on a daemon thread. Returns the Event that stops it."""
+        stop = threading.Event()
+        threading.Thread(target=self.run, args=(stop, interval), name=f"changes-{self.name}",
+                         daemon=True).start()
+        return stop
+
+
+# ---------- CLI ----------
+if __name__ == "__main__":
+    # python change_log.py tail <db_path> [after_seq] [limit]
+    # python change_log.py consumers <db_path>
+    # python change_log.py prune <db_path> [upto_seq]
+    if len(sys.argv) < 3 or sys.argv[1] not in ("tail", "consumers", "prune"):
+        raise SystemExit("usage: python change_log.py (tail <db_path> [after_seq] [limit] | consumers <db_path> "
+                         "| prune <db_path> [upto_seq])")
+    command, db = sys.argv[1], sys.argv[2]
+    conn = sqlite3.connect(db)
+    if command == "tail":
+        after = int(sys.argv[3]) if len(sys.argv) > 3 else max(head_seq(conn) - 20, 0)
+        limit = int(sys.argv[4]) if len(sys.argv) > 4 else CHANGE_LOG_BATCH
+        for change in read_changes(conn, after, limit):
+            print(f"{change.Seq:>10} {change.LoggedAt} {change.Event:<22} store={change.StoreId} "
+                  f"product={change.ProductId} day={change.Day} stock={change.StockDelta:+} "
+                  f"lines={change.LineDelta:+} revenue={float(change.RevenueDelta):+.2f} {change.Detail or ''}")
+        print(f"Head: {head_seq(conn)}")
+    elif command == "consumers":
+        for c in consumer_status(conn):
+            print(f"{c['consumer']:<30} seq={c['seq']} lag={c['lag']} updated={c['updated_at']}")
+    else:
+        upto = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        print(f"Pruned {prune_changes(conn, upto)} entries.")
+    conn.close()
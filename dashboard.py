@@ -1,63 +1,359 @@
 # dashboard.py
-import sqlite3
-from flask import Blueprint, render_template
+import logging
+import os
+import threading
+import time
+
+from flask import Blueprint, jsonify, render_template
+from analytics import current_snapshot, dashboard_totals, snapshot_dir
+from change_log import CHANGE_LOG_BATCH, head_seq, read_changes
+from db_executor import get_executor
+from inventory_crud import current_db_path, get_connection, register_write_listener
+from sharding import fan_out, shard_map
 
 dashboard_bp = Blueprint("dashboard", __name__, template_folder="templates")
 
+# Seconds a computed snapshot is served before a background refresh
+DASHBOARD_TTL = float(os.getenv("DASHBOARD_TTL", "30"))
+# Floor between refreshes, so a stream of writes cannot trigger back-to-back scans
+DASHBOARD_MIN_REFRESH = float(os.getenv("DASHBOARD_MIN_REFRESH", "2"))
+# How often the page polls /dashboard/data (seconds)
+DASHBOARD_POLL = int(os.getenv("DASHBOARD_POLL", "15"))
+# "sql": aggregate the live tables; "snapshot": aggregate the columnar
+# analytics snapshot (re-exported once older than ANALYTICS_SNAPSHOT_MAX_AGE);
+# "changes": totals seeded once, then kept current from ChangeLog deltas
+DASHBOARD_SOURCE = os.getenv("DASHBOARD_SOURCE", "sql")
+
+log = logging.getLogger(__name__)
+
+# Dashboard queries (also checked by index_advisor.py)
+STOCK_BY_PRODUCT_SQL = """
+    SELECT p.ProductName, SUM(sl.Quantity) AS Stock
+    FROM StockLevels sl
+    JOIN Products p ON sl.ProductId = p.ProductId
+    GROUP BY p.ProductName
+    ORDER BY Stock DESC;
+"""
+
+TOP_REVENUE_SQL = """
+    SELECT p.ProductName, SUM(sd.Revenue) AS Revenue
+    FROM SalesDaily sd
+    JOIN Products p ON sd.ProductId = p.ProductId
+    GROUP BY p.ProductName
+    ORDER BY Revenue DESC LIMIT 5;
+"""
+
+STOCK_BY_CITY_SQL = """
+    SELECT c.CityName, SUM(sl.Quantity) AS Stock
+    FROM StockLevels sl
+    JOIN Stores s ON sl.StoreId = s.StoreId
+    JOIN Cities c ON s.CityId = c.CityId
+    GROUP BY c.CityName;
+"""
+
+LOW_STOCK_SQL = """
+    SELECT p.ProductName, p.Size, SUM(sl.Quantity) AS Remaining
+    FROM StockLevels sl
+    JOIN Products p ON sl.ProductId = p.ProductId
+    GROUP BY p.ProductName, p.Size
+    HAVING Remaining < 10;
+"""
+
+# Sharded dashboards merge per-shard totals, so top-N and HAVING filters
+# apply after the merge: these are TOP_REVENUE_SQL and LOW_STOCK_SQL unfiltered
+REVENUE_BY_PRODUCT_SQL = """
+    SELECT p.ProductName, SUM(sd.Revenue) AS Revenue
+    FROM SalesDaily sd
+    JOIN Products p ON sd.ProductId = p.ProductId
+    GROUP BY p.ProductName;
+"""
+
+STOCK_BY_PRODUCT_SIZE_SQL = """
+    SELECT p.ProductName, p.Size, SUM(sl.Quantity) AS Remaining
+    FROM StockLevels sl
+    JOIN Products p ON sl.ProductId = p.ProductId
+    GROUP BY p.ProductName, p.Size;
+"""
+
 def query_db(query):
-    conn = sqlite3.connect("inventory.db")
-    conn.row_factory = sqlite3.Row
-    rows = conn.execute(query).fetchall()
-    conn.close()
+    conn = get_connection(readonly=True)
+    try:
+        rows = conn.execute(query).fetchall()
+    finally:
+        conn.close()
     return [dict(r) for r in rows]
 
-@dashboard_bp.route("/dashboard")
-def dashboard():
-    stock_data = query_db("""
-        SELECT p.ProductName, SUM(il.Quantity) AS Stock
-        FROM InvoiceLines il
-        JOIN Products p ON il.ProductId = p.ProductId
-        GROUP BY p.ProductName
-        ORDER BY Stock DESC;
-    """)
-
-    sales_data = query_db("""
-        SELECT p.ProductName, SUM(s.TotalAmount) AS Revenue
-        FROM Sales s
-        JOIN Products p ON s.ProductId = p.ProductId
-        GROUP BY p.ProductName
-        ORDER BY Revenue DESC LIMIT 5;
-    """)
-
-    city_data = query_db("""
-        SELECT c.CityName, SUM(il.Quantity) AS Stock
-        FROM InvoiceLines il
-        JOIN Invoices i ON il.InvoiceId = i.InvoiceId
-        JOIN Stores s ON i.StoreId = s.StoreId
-        JOIN Cities c ON s.CityId = c.CityId
-        GROUP BY c.CityName;
-    """)
-
-    low_stock = query_db("""
-        SELECT p.ProductName, p.Size, SUM(il.Quantity) AS Remaining
-        FROM InvoiceLines il
-        JOIN Products p ON il.ProductId = p.ProductId
-        GROUP BY p.ProductName, p.Size
-        HAVING Remaining < 10;
-    """)
+def snapshot_totals():
+    """_shard_totals() for the current database from its analytics snapshot."""
+    conn = get_connection(readonly=True)
+    try:
+        snap = current_snapshot(conn, snapshot_dir(current_db_path()))
+    finally:
+        conn.close()
+    return dashboard_totals(snap)
+
+# ---------- Change-fed totals ----------
+class ChangeFedTotals:
+    """
+    Per-database dashboard totals maintained from ChangeLog. The first call
+    seeds them from StockLevels and SalesDaily in one read transaction (at
+    the log's head Seq); later calls apply only the entries logged since, so
+    a refresh costs the changes, not a scan. A gap in Seq (entries pruned
+    before they were applied) reseeds.
+    """
+
+    def __init__(self):
+        self.seq = None
+        self.reseeds = 0
+        self._lock = threading.Lock()
+
+    def _seed(self, cur):
+        cur.execute("BEGIN;")
+        try:
+            self.seq = head_seq(cur)
+            self.levels = {}
+            self.by_product, self.by_store = {}, {}
+            for store_id, product_id, quantity, lines in cur.execute(
+                    "SELECT StoreId, ProductId, Quantity, LineCount FROM StockLevels;").fetchall():
+                self._adjust(store_id, product_id, quantity, lines)
+            self.revenue = dict(cur.execute(
+                "SELECT ProductId, SUM(Revenue) FROM SalesDaily GROUP BY ProductId;").fetchall())
+            self.products = {pid: (name, size) for pid, name, size in cur.execute(
+                "SELECT ProductId, ProductName, Size FROM Products;").fetchall()}
+            self.city_of = dict(cur.execute("""
+                SELECT s.StoreId, c.CityName FROM Stores s JOIN Cities c ON s.CityId = c.CityId;
+            """).fetchall())
+        finally:
+            cur.execute("COMMIT;")
+        self.reseeds += 1
+
+    def _count(self, store_id, product_id, stock, rows):
+        for totals, key in ((self.by_product, product_id), (self.by_store, store_id)):
+            total = totals.setdefault(key, [0, 0])
+            total[0] += stock
+            total[1] += rows
+
+    def _adjust(self, store_id, product_id, stock, lines):
+        # Mirrors stock_levels.adjust_stock(), including dropping emptied rows
+        key = (store_id, product_id)
+        level = self.levels.get(key)
+        if level is None:
+            level = self.levels[key] = [0, 0]
+            self._count(store_id, product_id, 0, 1)
+        level[0] += stock
+        level[1] += lines
+        self._count(store_id, product_id, stock, 0)
+        if lines < 0 and level[1] <= 0:
+            del self.levels[key]
+            self._count(store_id, product_id, -level[0], -1)
+
+    def _apply(self, changes):
+        for c in changes:
+            if c.StockDelta or c.LineDelta:
+                self._adjust(c.StoreId, c.ProductId, c.StockDelta, c.LineDelta)
+            if c.RevenueDelta:
+                self.revenue[c.ProductId] = self.revenue.get(c.ProductId, 0) + c.RevenueDelta
+            if c.Event == "delete_product":
+                self.products.pop(c.ProductId, None)
+            self.seq = c.Seq
+
+    def _resolve_names(self, cur):
+        # Products and stores created since the seed
+        missing = [pid for pid in set(self.by_product) | set(self.revenue) if pid not in self.products]
+        if missing:
+            cur.execute(f"SELECT ProductId, ProductName, Size FROM Products "
+                        f"WHERE ProductId IN ({','.join('?' * len(missing))});", missing)
+            self.products.update((pid, (name, size)) for pid, name, size in cur.fetchall())
+        missing = [sid for sid in self.by_store if sid not in self.city_of]
+        if missing:
+            cur.execute(f"SELECT s.StoreId, c.CityName FROM Stores s JOIN Cities c ON s.CityId = c.CityId "
+                        f"WHERE s.StoreId IN ({','.join('?' * len(missing))});", missing)
+            self.city_of.update(cur.fetchall())
+
+    def current(self, conn):
+        """Catches up with the log, then returns the four _shard_totals() datasets."""
+        cur = conn.cursor(tuples=True)
+        with self._lock:
+            if self.seq is None:
+                self._seed(cur)
+            while True:
+                changes = read_changes(conn, self.seq, CHANGE_LOG_BATCH)
+                if not changes:
+                    break
+                if changes[0].Seq != self.seq + 1:
+                    self._seed(cur)
+                    continue
+                self._apply(changes)
+            self._resolve_names(cur)
+            return self._totals()
+
+    def _totals(self):
+        stock, revenue, city, stock_size = {}, {}, {}, {}
+        for pid, (quantity, rows) in self.by_product.items():
+            if rows > 0 and pid in self.products:
+                name, size = self.products[pid]
+                stock[name] = stock.get(name, 0) + quantity
+                stock_size[(name, size)] = stock_size.get((name, size), 0) + quantity
+        for pid, amount in self.revenue.items():
+            if pid in self.products:
+                name = self.products[pid][0]
+                revenue[name] = revenue.get(name, 0) + amount
+        for sid, (quantity, rows) in self.by_store.items():
+            if rows > 0 and sid in self.city_of:
+                city[self.city_of[sid]] = city.get(self.city_of[sid], 0) + quantity
+        return [
+            [{"ProductName": k, "Stock": v} for k, v in sorted(stock.items(), key=lambda kv: -kv[1])],
+            [{"ProductName": k, "Revenue": v} for k, v in revenue.items()],
+            [{"CityName": k, "Stock": v} for k, v in city.items()],
+            [{"ProductName": k[0], "Size": k[1], "Remaining": v} for k, v in stock_size.items()],
+        ]
+
+
+_change_totals = {}
+_change_totals_lock = threading.Lock()
+
+def change_totals():
+    """_shard_totals() for the current database from its ChangeFedTotals."""
+    with _change_totals_lock:
+        view = _change_totals.setdefault(current_db_path(), ChangeFedTotals())
+    conn = get_connection(readonly=True)
+    try:
+        return view.current(conn)
+    finally:
+        conn.close()
+
+def _shard_totals():
+    # Unfiltered totals of one database (one shard), in DASHBOARD_SOURCE's way
+    if DASHBOARD_SOURCE == "changes":
+        return change_totals()
+    if DASHBOARD_SOURCE == "snapshot":
+        return snapshot_totals()
+    return [query_db(q) for q in (STOCK_BY_PRODUCT_SQL, REVENUE_BY_PRODUCT_SQL,
+                                  STOCK_BY_CITY_SQL, STOCK_BY_PRODUCT_SIZE_SQL)]
+
+def _merge(parts, keys, value):
+    totals = {}
+    for rows in parts:
+        for r in rows:
+            key = tuple(r[k] for k in keys)
+            totals[key] = totals.get(key, 0) + r[value]
+    return [dict(zip(keys, key), **{value: total}) for key, total in totals.items()]
+
+def sharded_data():
+    """The dashboard datasets from every shard in parallel, merged."""
+    return merged_data(list(fan_out(_shard_totals).values()))
+
+def merged_data(shards):
+    """The dashboard datasets from _shard_totals() of one or more databases."""
+    stock = _merge([s[0] for s in shards], ("ProductName",), "Stock")
+    revenue = _merge([s[1] for s in shards], ("ProductName",), "Revenue")
+    return {
+        "stock_data": sorted(stock, key=lambda r: -r["Stock"]),
+        "sales_data": sorted(revenue, key=lambda r: -r["Revenue"])[:5],
+        "city_data": _merge([s[2] for s in shards], ("CityName",), "Stock"),
+        "low_stock": [r for r in _merge([s[3] for s in shards], ("ProductName", "Size"), "Remaining")
+                      if r["Remaining"] < 10],
+    }
+
+def compute_aggregates():
+    """Runs the dashboard queries and KPIs; the only full pass over the data."""
+    if DASHBOARD_SOURCE in ("snapshot", "changes") or shard_map() is not None:
+        # Sharded: every shard's totals, from its own snapshot / log / tables
+        data = sharded_data() if shard_map() is not None else merged_data([_shard_totals()])
+        stock_data, sales_data = data["stock_data"], data["sales_data"]
+        city_data, low_stock = data["city_data"], data["low_stock"]
+    else:
+        stock_data = query_db(STOCK_BY_PRODUCT_SQL)
+        sales_data = query_db(TOP_REVENUE_SQL)
+        city_data = query_db(STOCK_BY_CITY_SQL)
+        low_stock = query_db(LOW_STOCK_SQL)
 
     # Compute summary KPIs
     total_products = len(stock_data)
     total_revenue = sum([r["Revenue"] for r in sales_data]) if sales_data else 0
     total_stock = sum([r["Stock"] for r in stock_data]) if stock_data else 0
 
-    return render_template(
-        "dashboard.html",
-        stock_data=stock_data,
-        sales_data=sales_data,
-        city_data=city_data,
-        low_stock=low_stock,
-        total_products=total_products,
-        total_revenue=total_revenue,
-        total_stock=total_stock
-    )
+    return {
+        "stock_data": stock_data,
+        "sales_data": sales_data,
+        "city_data": city_data,
+        "low_stock": low_stock,
+        "total_products": total_products,
+        "total_revenue": total_revenue,
+        "total_stock": total_stock,
+        "computed_at": time.time(),
+    }
+
+# ---------- Aggregate cache ----------
+class DashboardCache:
+    """
+    Holds the last computed dashboard snapshot.
+    Page views read the snapshot; once it is older than the TTL or a write
+    has invalidated it, one background refresh recomputes it while readers
+    keep getting the previous snapshot. Refreshes run on the database
+    executor's reader threads; only a cold start waits for one.
+    """
+
+    def __init__(self, ttl=DASHBOARD_TTL, min_refresh=DASHBOARD_MIN_REFRESH):
+        self.ttl = ttl
+        self.min_refresh = min_refresh
+        self._snapshot = None
+        self._dirty = False
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def refresh(self):
+        snapshot = compute_aggregates()
+        with self._lock:
+            self._snapshot = snapshot
+            self._dirty = False
+            self._refreshing = False
+            self.refreshes += 1
+        return snapshot
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            with self._lock:
+                self._refreshing = False
+            log.exception("Dashboard refresh failed")
+
+    def get(self):
+        with self._lock:
+            snapshot = self._snapshot
+        if snapshot is None:
+            return get_executor().read(self.refresh)
+
+        age = time.time() - snapshot["computed_at"]
+        with self._lock:
+            stale = self._dirty or age > self.ttl
+            start = stale and not self._refreshing and age >= self.min_refresh
+            if start:
+                self._refreshing = True
+        if start:
+            get_executor().submit_read(self._refresh_in_background)
+        return snapshot
+
+    def invalidate(self, *_event):
+        with self._lock:
+            self._dirty = True
+
+
+dashboard_cache = DashboardCache()
+register_write_listener(dashboard_cache.invalidate)
+
+def _with_age(snapshot):
+    data = dict(snapshot)
+    data["age_seconds"] = round(time.time() - snapshot["computed_at"], 1)
+    return data
+
+@dashboard_bp.route("/dashboard")
+def dashboard():
+    data = _with_age(dashboard_cache.get())
+    return render_template("dashboard.html", poll_seconds=DASHBOARD_POLL, **data)
+
+@dashboard_bp.route("/dashboard/data")
+def dashboard_data():
+    return jsonify(_with_age(dashboard_cache.get()))
@@ -0,0 +1,107 @@
+import atexit
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from db_pool import POOL_READERS
+
+# Reader threads (one per pooled reader connection by default)
+EXECUTOR_READERS = int(os.getenv("DB_EXECUTOR_READERS", str(POOL_READERS)))
+# Seconds a blocking caller waits for its database job
+EXECUTOR_TIMEOUT = float(os.getenv("DB_EXECUTOR_TIMEOUT", "60"))
+
+
+# ---------- Database executor ----------
+class DbExecutor:
+    """
+    Runs database work off the request threads.
+    Reads go to a pool of reader threads and run concurrently; mutations go
+    to one writer thread and run strictly in submission order, so a slow
+    dashboard scan never holds up a sale or purchase. Queued mutations
+    (inventory_crud write functions) skip the writer thread and go straight
+    to the group-commit write queue.
+    """
+
+    def __init__(self, readers=EXECUTOR_READERS, timeout=EXECUTOR_TIMEOUT):
+        self.timeout = timeout
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-read")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+        self._lock = threading.Lock()
+        self._pending = {"read": 0, "write": 0}
+        self._completed = {"read": 0, "write": 0}
+        self.readers = readers
+
+    def _submit(self, kind, executor, fn, args, kwargs):
+        with self._lock:
+            self._pending[kind] += 1
+        # Carry the caller's context (e.g. the route SQL time is attributed to)
+        future = executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        future.add_done_callback(lambda _f: self._done(kind))
+        return future
+
+    def _done(self, kind):
+        with self._lock:
+            self._pending[kind] -= 1
+            self._completed[kind] += 1
+
+    # ----- futures -----
+    def submit_read(self, fn, *args, **kwargs):
+        return self._submit("read", self._readers, fn, args, kwargs)
+
+    def submit_write(self, fn, *args, **kwargs):
+        submit = getattr(fn, "submit", None)
+        if submit is None:
+            return self._submit("write", self._writer, fn, args, kwargs)
+        future = submit(*args, **kwargs)
+        with self._lock:
+            self._pending["write"] += 1
+        future.add_done_callback(lambda _f: self._done("write"))
+        return future
+
+    # ----- blocking (WSGI request threads) -----
+    def read(self, fn, *args, **kwargs):
+        return self.submit_read(fn, *args, **kwargs).result(self.timeout)
+
+    def write(self, fn, *args, **kwargs):
+        return self.submit_write(fn, *args, **kwargs).result(self.timeout)
+
+    def stats(self):
+        with self._lock:
+            return {"readers": self.readers,
+                    "pending_reads": self._pending["read"], "pending_writes": self._pending["write"],
+                    "completed_reads": self._completed["read"], "completed_writes": self._completed["write"]}
+
+    def shutdown(self, wait=True):
+        self._readers.shutdown(wait=wait)
+        self._writer.shutdown(wait=wait)
+
+
+# ---------- Process-wide executor ----------
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Returns the shared DbExecutor, creating it on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = DbExecutor()
+    return _executor
+
+
+def executor_stats():
+    return _executor.stats() if _executor is not None else {}
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+atexit.register(shutdown_executor)
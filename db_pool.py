@@ -0,0 +1,254 @@
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from query_metrics import QUERY_METRICS, InstrumentedCursor
+
+# Tunables (override via environment)
+POOL_READERS = int(os.getenv("DB_POOL_READERS", "4"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "65536"))
+# Prepared statements sqlite3 keeps per connection (see statements.py)
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE", "256"))
+
+
+class PoolTimeoutError(RuntimeError):
+    """Raised when no pooled connection becomes free within the wait timeout."""
+
+
+# ---------- Pooled connection proxy ----------
+class PooledConnection:
+    """
+    Thin proxy around a long-lived sqlite3 connection.
+    close() hands the connection back to its pool instead of closing it,
+    so existing `conn = get_connection() ... conn.close()` code keeps working.
+    """
+
+    def __init__(self, pool, conn, readonly):
+        self._pool = pool
+        self._conn = conn
+        self.readonly = readonly
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    # Statements go through query_metrics when QUERY_METRICS is on.
+    # tuples=True skips sqlite3.Row for hot paths that unpack rows positionally.
+    def cursor(self, tuples=False):
+        cur = self._conn.cursor()
+        if tuples:
+            cur.row_factory = None
+        if QUERY_METRICS:
+            return InstrumentedCursor(cur, self._conn)
+        return cur
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool._release(self._conn, self.readonly)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and self._conn.in_transaction:
+            self._conn.commit()
+        self.close()
+        return False
+
+
+# ---------- Connection pool (one writer, N readers) ----------
+class ConnectionPool:
+    """
+    Bounded pool of long-lived connections to one SQLite file.
+    A single writer connection serializes mutations; up to `readers`
+    read-only connections serve SELECTs concurrently (WAL mode).
+    """
+
+    def __init__(self, db_path, readers=POOL_READERS, timeout=POOL_TIMEOUT):
+        self.db_path = db_path
+        self.max_readers = max(1, int(readers))
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._writer_lock = threading.Lock()
+        self._writer = None
+        self._idle_readers = queue.LifoQueue()
+        self._reader_count = 0
+        self._closed = False
+
+        self._stats = {
+            "acquired": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "connections_opened": 0,
+        }
+
+    def _connect(self, readonly):
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000.0,
+                               check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON;")
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE};")
+        conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB};")
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};")
+        conn.execute("PRAGMA temp_store = MEMORY;")
+        if readonly:
+            conn.execute("PRAGMA query_only = ON;")
+        with self._lock:
+            self._stats["connections_opened"] += 1
+        return conn
+
+    def _record_wait(self, started):
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._stats["waits"] += 1
+            self._stats["wait_seconds_total"] += waited
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+
+    def _timed_out(self, kind):
+        with self._lock:
+            self._stats["timeouts"] += 1
+        raise PoolTimeoutError(f"No {kind} connection to {self.db_path} free after {self.timeout}s.")
+
+    def acquire(self, readonly=False):
+        """Returns a PooledConnection; call close() (or use `with`) to release it."""
+        if self._closed:
+            raise RuntimeError(f"Connection pool for {self.db_path} is closed.")
+        conn = self._acquire_reader() if readonly else self._acquire_writer()
+        with self._lock:
+            self._stats["acquired"] += 1
+        return PooledConnection(self, conn, readonly)
+
+    def _acquire_writer(self):
+        if not self._writer_lock.acquire(blocking=False):
+            started = time.perf_counter()
+            if not self._writer_lock.acquire(timeout=self.timeout):
+                self._timed_out("writer")
+            self._record_wait(started)
+        if self._writer is None:
+            try:
+                self._writer = self._connect(readonly=False)
+            except Exception:
+                self._writer_lock.release()
+                raise
+        return self._writer
+
+    def _acquire_reader(self):
+        try:
+            return self._idle_readers.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._reader_count < self.max_readers
+            if can_open:
+                self._reader_count += 1
+        if can_open:
+            try:
+                return self._connect(readonly=True)
+            except Exception:
+                with self._lock:
+                    self._reader_count -= 1
+                raise
+
+        started = time.perf_counter()
+        try:
+            conn = self._idle_readers.get(timeout=self.timeout)
+        except queue.Empty:
+            self._timed_out("reader")
+        self._record_wait(started)
+        return conn
+
+    def _release(self, conn, readonly):
+        # Never hand a connection back with a half-finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+        if readonly:
+            if self._closed:
+                conn.close()
+            else:
+                self._idle_readers.put(conn)
+        else:
+            self._writer_lock.release()
+
+    def stats(self):
+        """Pool-size and wait-time metrics as a JSON-ready dict."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["readers_open"] = self._reader_count
+        snapshot["db_path"] = self.db_path
+        snapshot["readers_max"] = self.max_readers
+        snapshot["readers_idle"] = self._idle_readers.qsize()
+        snapshot["writer_busy"] = self._writer_lock.locked()
+        snapshot["wait_seconds_total"] = round(snapshot["wait_seconds_total"], 6)
+        snapshot["wait_seconds_max"] = round(snapshot["wait_seconds_max"], 6)
+        return snapshot
+
+    def close(self):
+        """Closes every idle connection; readers still in use close on release."""
+        self._closed = True
+        while True:
+            try:
+                self._idle_readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._reader_count = 0
+        if self._writer_lock.acquire(timeout=self.timeout):
+            try:
+                if self._writer is not None:
+                    self._writer.close()
+                    self._writer = None
+            finally:
+                self._writer_lock.release()
+
+
+# ---------- Process-wide registry ----------
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path):
+    """Returns the shared pool for db_path, creating it on first use."""
+    pool = _pools.get(db_path)
+    if pool is None or pool._closed:
+        with _pools_lock:
+            pool = _pools.get(db_path)
+            if pool is None or pool._closed:
+                pool = ConnectionPool(db_path)
+                _pools[db_path] = pool
+    return pool
+
+
+def pool_stats():
+    """Metrics for every open pool, keyed by database path."""
+    return {path: pool.stats() for path, pool in list(_pools.items())}
+
+
+def close_all_pools():
+    """Shutdown hook: closes every pooled connection."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_all_pools)
@@ -0,0 +1,470 @@
+import argparse
+import csv
+import os
+import re
+import sqlite3
+import sys
+import time
+
+from archive import archive_tables, restore_archived
+from change_log import log_changes
+from migrations import migrate
+from result_cache import bump_generations, process_generations, shared_generations
+from stock_levels import adjust_stock_many
+
+# Streaming replacement for the app.sql pipeline: raw rows (CSV or the
+# RawTransactions table) are normalized chunk by chunk straight into
+# Cities/Stores/Vendors/Products/Invoices/InvoiceLines, without the
+# T_1NF / *_2NF / Fact_3NF copies. Each chunk commits together with its
+# checkpoint, so an interrupted load resumes where it stopped.
+#
+# Delta mode (--delta) loads new raw files into an existing database:
+# a raw row counts as already loaded when an InvoiceLine with the same
+# InventoryId exists on the invoice for its (Store, VendorNumber, InvoiceDate).
+# InventoryId alone is a store/brand item code that repeats across purchases,
+# so it is matched together with the invoice key. Archived lines count as
+# loaded, and an archived invoice header is restored rather than recreated
+# (see archive.py).
+#
+# The load writes the database directly, not through inventory_crud, so
+# after each chunk commits it bumps the shared result-cache counters
+# (<db>-cachegen, see result_cache.py) of the products it touched: app
+# processes then drop their cached read_product_across_locations() results.
+# A load run inside an app process also bumps that process's own counters.
+
+DEFAULT_CHUNK = 50_000
+
+FINAL_SCHEMA_DDL = """
+CREATE TABLE IF NOT EXISTS Cities (
+    CityId    INTEGER PRIMARY KEY,
+    CityName  TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS Stores (
+    StoreId  INTEGER PRIMARY KEY,
+    CityId   INTEGER,
+    FOREIGN KEY (CityId) REFERENCES Cities(CityId)
+);
+
+CREATE TABLE IF NOT EXISTS Vendors (
+    VendorNumber  INTEGER PRIMARY KEY,
+    VendorName    TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS Products (
+    ProductId    INTEGER PRIMARY KEY,
+    Brand        INTEGER NOT NULL,
+    ProductName  TEXT NOT NULL,
+    Size         TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS Invoices (
+    InvoiceId     INTEGER PRIMARY KEY AUTOINCREMENT,
+    StoreId       INTEGER NOT NULL,
+    VendorNumber  INTEGER NOT NULL,
+    InvoiceDate   DATE NOT NULL,
+    UNIQUE (StoreId, VendorNumber, InvoiceDate),
+    FOREIGN KEY (StoreId)      REFERENCES Stores(StoreId),
+    FOREIGN KEY (VendorNumber) REFERENCES Vendors(VendorNumber)
+);
+
+CREATE TABLE IF NOT EXISTS InvoiceLines (
+    InvoiceLineId  INTEGER PRIMARY KEY AUTOINCREMENT,
+    InvoiceId      INTEGER NOT NULL,
+    ProductId      INTEGER NOT NULL,
+    InventoryId    TEXT,
+    PurchasePrice  NUMERIC NOT NULL,
+    Quantity       INTEGER NOT NULL,
+    LineTotal      NUMERIC NOT NULL,
+    FOREIGN KEY (InvoiceId) REFERENCES Invoices(InvoiceId),
+    FOREIGN KEY (ProductId) REFERENCES Products(ProductId)
+);
+
+CREATE TABLE IF NOT EXISTS EtlCheckpoints (
+    Source     TEXT PRIMARY KEY,
+    Position   INTEGER NOT NULL,
+    RowsLoaded INTEGER NOT NULL,
+    RowsSkipped INTEGER NOT NULL,
+    UpdatedAt  TEXT NOT NULL
+);
+"""
+
+
+# ---------- Raw row parsing ----------
+def _int(value):
+    if value is None or value == "":
+        return None
+    return int(float(value))
+
+
+def _float(value):
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value)
+    return value if value != "" else None
+
+
+_DMY = re.compile(r"^(\d{1,2})[/-](\d{1,2})[/-](\d{4})$")
+
+
+def _iso_date(value):
+    # Raw extracts use day-first dates; the schema stores 'YYYY-MM-DD'
+    value = _text(value)
+    if value is None:
+        return None
+    value = value.strip()
+    m = _DMY.match(value)
+    if m:
+        day, month, year = m.groups()
+        return f"{year}-{int(month):02d}-{int(day):02d}"
+    return value[:10]
+
+
+def normalize_raw(record):
+    """
+    Maps one RawTransactions-shaped record to a typed tuple:
+    (InventoryId, Store, City, Brand, ProductName, Size, VendorNumber,
+     VendorName, InvoiceDate, PurchasePrice, Quantity), or None when a key
+    column is missing (app.sql drops those rows in its joins too).
+    """
+    product_name = record.get("Product Name", record.get("ProductName"))
+    vendor_name = _text(record.get("VendorName"))
+    row = (
+        _text(record.get("InventoryId")),
+        _int(record.get("Store")),
+        _text(record.get("City")),
+        _int(record.get("Brand")),
+        _text(product_name),
+        _text(record.get("Size")),
+        _int(record.get("VendorNumber")),
+        vendor_name.strip() if vendor_name else None,
+        _iso_date(record.get("InvoiceDate")),
+        _float(record.get("PurchasePrice")),
+        _int(record.get("Quantity")),
+    )
+    _, store, city, brand, name, size, vendor_number, vendor, date, price, qty = row
+    if None in (store, city, brand, name, size, vendor_number, vendor, date, price, qty):
+        return None
+    return row
+
+
+# ---------- Sources ----------
+def iter_csv(path, start=0):
+    """Yields (position, record) for data rows of a CSV, skipping the first `start`."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for position, record in enumerate(csv.DictReader(f), start=1):
+            if position > start:
+                yield position, record
+
+
+def iter_table(conn, table="RawTransactions", start=0, batch=DEFAULT_CHUNK):
+    """Yields (rowid, record) from a raw table in rowid order, after rowid `start`."""
+    conn.row_factory = sqlite3.Row
+    last = start
+    while True:
+        rows = conn.execute(f'SELECT rowid AS _pos, * FROM "{table}" WHERE rowid > ? ORDER BY rowid LIMIT ?;',
+                            (last, batch)).fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield row["_pos"], dict(row)
+        last = rows[-1]["_pos"]
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ---------- Loader ----------
+class StreamingLoader:
+    """
+    Normalizes raw rows into the final tables one chunk (one transaction) at a time.
+    Dimension ids seen so far are kept in dicts, so each chunk only touches
+    the database for new cities, stores, vendors and products.
+    """
+
+    def __init__(self, conn, source, delta=False):
+        self.conn = conn
+        self.source = source
+        self.delta = delta
+        self.duplicates = 0
+        self.db_path = conn.execute("PRAGMA database_list;").fetchone()[2]
+        self.generations = shared_generations(self.db_path) if self.db_path else None
+        self._load_dimension_ids()
+        self.conn.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS EtlInvoiceKeys (
+                StoreId INTEGER, VendorNumber INTEGER, InvoiceDate TEXT
+            );
+        """)
+        self.conn.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS EtlDeltaKeys (
+                InventoryId TEXT, StoreId INTEGER, VendorNumber INTEGER, InvoiceDate TEXT
+            );
+        """)
+
+    def _load_dimension_ids(self):
+        conn = self.conn
+        self.city_of = dict(conn.execute("SELECT CityName, CityId FROM Cities;").fetchall())
+        self.stores_seen = {r[0] for r in conn.execute("SELECT StoreId FROM Stores;")}
+        self.vendor_name_of = dict(conn.execute("SELECT VendorNumber, VendorName FROM Vendors;").fetchall())
+        self.product_of = {
+            (brand, name, size): product_id
+            for product_id, brand, name, size in conn.execute(
+                "SELECT MIN(ProductId), Brand, ProductName, Size FROM Products GROUP BY Brand, ProductName, Size;")
+        }
+
+    def checkpoint(self):
+        """(Position, RowsLoaded, RowsSkipped) of the last committed chunk, or zeros."""
+        row = self.conn.execute("SELECT Position, RowsLoaded, RowsSkipped FROM EtlCheckpoints WHERE Source = ?;",
+                                (self.source,)).fetchone()
+        return tuple(row) if row else (0, 0, 0)
+
+    def reset(self):
+        self.conn.execute("DELETE FROM EtlCheckpoints WHERE Source = ?;", (self.source,))
+        self.conn.commit()
+
+    def _resolve_dimensions(self, cur, rows):
+        new_cities = sorted({r[2] for r in rows} - self.city_of.keys())
+        if new_cities:
+            cur.executemany("INSERT OR IGNORE INTO Cities (CityName) VALUES (?);", [(c,) for c in new_cities])
+            for name in new_cities:
+                cur.execute("SELECT CityId FROM Cities WHERE CityName = ?;", (name,))
+                self.city_of[name] = cur.fetchone()[0]
+
+        new_stores = {}
+        for r in rows:
+            if r[1] not in self.stores_seen:
+                new_stores.setdefault(r[1], self.city_of[r[2]])
+        if new_stores:
+            cur.executemany("INSERT OR IGNORE INTO Stores (StoreId, CityId) VALUES (?, ?);", list(new_stores.items()))
+            self.stores_seen.update(new_stores)
+
+        # app.sql keeps MIN(VendorName) per VendorNumber
+        chunk_names = {}
+        for r in rows:
+            chunk_names[r[6]] = min(chunk_names.get(r[6], r[7]), r[7])
+        vendors = {number: name for number, name in chunk_names.items()
+                   if number not in self.vendor_name_of or name < self.vendor_name_of[number]}
+        if vendors:
+            cur.executemany("""
+                INSERT INTO Vendors (VendorNumber, VendorName) VALUES (?, ?)
+                ON CONFLICT (VendorNumber) DO UPDATE
+                SET VendorName = MIN(VendorName, excluded.VendorName);
+            """, list(vendors.items()))
+            self.vendor_name_of.update(vendors)
+
+        new_names = set()
+        for r in rows:
+            key = (r[3], r[4], r[5])
+            if key not in self.product_of:
+                cur.execute("INSERT INTO Products (Brand, ProductName, Size) VALUES (?, ?, ?);", key)
+                self.product_of[key] = cur.lastrowid
+                new_names.add(key[1])
+        return new_names
+
+    def _resolve_invoices(self, cur, rows):
+        keys = sorted({(r[1], r[6], r[8]) for r in rows})
+        restore_archived(cur, "Invoices", keys)
+        cur.executemany("INSERT OR IGNORE INTO Invoices (StoreId, VendorNumber, InvoiceDate) VALUES (?, ?, ?);", keys)
+        cur.execute("DELETE FROM temp.EtlInvoiceKeys;")
+        cur.executemany("INSERT INTO temp.EtlInvoiceKeys VALUES (?, ?, ?);", keys)
+        cur.execute("""
+            SELECT i.StoreId, i.VendorNumber, i.InvoiceDate, i.InvoiceId
+            FROM temp.EtlInvoiceKeys k
+            JOIN Invoices i
+              ON i.StoreId = k.StoreId AND i.VendorNumber = k.VendorNumber AND i.InvoiceDate = k.InvoiceDate;
+        """)
+        return {(s, v, d): invoice_id for s, v, d, invoice_id in cur.fetchall()}
+
+    def _drop_loaded(self, cur, rows):
+        # Delta mode: keep only rows whose (InventoryId, invoice) is not in the DB yet
+        keys = {(r[0], r[1], r[6], r[8]) for r in rows if r[0] is not None}
+        cur.execute("DELETE FROM temp.EtlDeltaKeys;")
+        cur.executemany("INSERT INTO temp.EtlDeltaKeys VALUES (?, ?, ?, ?);", keys)
+        # Archived lines count as loaded too
+        suffix = "All" if archive_tables(cur, "InvoiceLines") else ""
+        cur.execute(f"""
+            SELECT DISTINCT k.InventoryId, k.StoreId, k.VendorNumber, k.InvoiceDate
+            FROM temp.EtlDeltaKeys k
+            JOIN Invoices{suffix} i
+              ON i.StoreId = k.StoreId AND i.VendorNumber = k.VendorNumber AND i.InvoiceDate = k.InvoiceDate
+            JOIN InvoiceLines{suffix} il
+              ON il.InventoryId = k.InventoryId AND il.InvoiceId = i.InvoiceId;
+        """)
+        loaded = set(cur.fetchall())
+        fresh = [r for r in rows if (r[0], r[1], r[6], r[8]) not in loaded]
+        self.duplicates += len(rows) - len(fresh)
+        return fresh
+
+    def load_chunk(self, rows, position, loaded, skipped):
+        """
+        Writes one chunk of normalized rows plus the new checkpoint in one transaction.
+        `loaded` is the running total before this chunk.
+        Returns the number of invoice lines inserted.
+        """
+        try:
+            return self._write_chunk(rows, position, loaded, skipped)
+        except BaseException:
+            # Ids cached during the failed chunk may belong to rolled-back rows
+            self.conn.rollback()
+            self._load_dimension_ids()
+            raise
+
+    def _write_chunk(self, rows, position, loaded, skipped):
+        cur = self.conn.cursor()
+        if rows and self.delta:
+            rows = self._drop_loaded(cur, rows)
+        stock, new_names = {}, set()
+        if rows:
+            new_names = self._resolve_dimensions(cur, rows)
+            invoice_of = self._resolve_invoices(cur, rows)
+
+            lines = []
+            for inventory_id, store, _, brand, name, size, vendor_number, _, date, price, qty in rows:
+                product_id = self.product_of[(brand, name, size)]
+                lines.append((invoice_of[(store, vendor_number, date)], product_id,
+                              inventory_id, price, qty, price * qty))
+                delta = stock.setdefault((store, product_id), [0, 0])
+                delta[0] += qty
+                delta[1] += 1
+            cur.executemany("""
+                INSERT INTO InvoiceLines (InvoiceId, ProductId, InventoryId, PurchasePrice, Quantity, LineTotal)
+                VALUES (?, ?, ?, ?, ?, ?);
+            """, lines)
+            adjust_stock_many(cur, [(s, p, q, n) for (s, p), (q, n) in stock.items()])
+            log_changes(cur, [("load", s, p, None, q, n, 0, {"Source": self.source})
+                              for (s, p), (q, n) in stock.items()])
+
+        cur.execute("""
+            INSERT INTO EtlCheckpoints (Source, Position, RowsLoaded, RowsSkipped, UpdatedAt)
+            VALUES (?, ?, ?, ?, datetime('now'))
+            ON CONFLICT (Source) DO UPDATE
+            SET Position = excluded.Position, RowsLoaded = excluded.RowsLoaded,
+                RowsSkipped = excluded.RowsSkipped, UpdatedAt = excluded.UpdatedAt;
+        """, (self.source, position, loaded + len(rows), skipped))
+        self.conn.commit()
+        for generations in (self.generations, process_generations(self.db_path)):
+            if generations is not None:
+                bump_generations(generations, {p for _, p in stock}, new_names)
+        return len(rows)
+
+
+def open_target(db_path):
+    """Opens the target DB tuned for bulk loading and makes sure the schema exists."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    conn.execute("PRAGMA temp_store = MEMORY;")
+    conn.executescript(FINAL_SCHEMA_DDL)
+    migrate(conn)
+    return conn
+
+
+def run_load(target, records, source, total=None, chunk_size=DEFAULT_CHUNK, progress=None, delta=False):
+    """
+    Streams (position, record) pairs into the target connection.
+    Resumes from the source's checkpoint; `records` must already start after it.
+    With delta=True, rows already present in InvoiceLines are skipped.
+    Returns a summary dict with rows loaded/skipped and throughput.
+    """
+    loader = StreamingLoader(target, source, delta=delta)
+    position, loaded, skipped = loader.checkpoint()
+    started = time.perf_counter()
+    session_rows = 0
+
+    for chunk in _chunks(records, chunk_size):
+        rows = []
+        for _, record in chunk:
+            row = normalize_raw(record)
+            if row is None:
+                skipped += 1
+            else:
+                rows.append(row)
+        position = chunk[-1][0]
+        loaded += loader.load_chunk(rows, position, loaded, skipped)
+        session_rows += len(chunk)
+        if progress:
+            elapsed = time.perf_counter() - started
+            progress({
+                "position": position,
+                "total": total,
+                "rows_loaded": loaded,
+                "rows_skipped": skipped,
+                "rows_already_loaded": loader.duplicates,
+                "elapsed_seconds": round(elapsed, 2),
+                "rows_per_second": round(session_rows / elapsed, 1) if elapsed > 0 else None,
+            })
+
+    elapsed = time.perf_counter() - started
+    return {
+        "source": source,
+        "position": position,
+        "rows_loaded": loaded,
+        "rows_skipped": skipped,
+        "rows_already_loaded": loader.duplicates,
+        "rows_this_run": session_rows,
+        "elapsed_seconds": round(elapsed, 2),
+        "rows_per_second": round(session_rows / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+def _print_progress(p):
+    pct = f" {100.0 * p['position'] / p['total']:5.1f}%" if p["total"] else ""
+    print(f"\r[etl]{pct} position={p['position']} loaded={p['rows_loaded']} "
+          f"skipped={p['rows_skipped']} already_loaded={p['rows_already_loaded']} "
+          f"{p['rows_per_second']} rows/s", end="", file=sys.stderr, flush=True)
+
+
+# ---------- CLI ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream raw transactions into the normalized inventory schema.")
+    parser.add_argument("source", help="raw CSV file, or a SQLite file holding the raw table")
+    parser.add_argument("--db", default=os.getenv("DB_PATH", "inventory.db"), help="target database")
+    parser.add_argument("--table", default="RawTransactions", help="raw table name when source is SQLite")
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="rows per transaction")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over")
+    parser.add_argument("--delta", action="store_true",
+                        help="incremental load: skip raw rows already present in InvoiceLines")
+    args = parser.parse_args(argv)
+
+    target = open_target(args.db)
+    is_csv = args.source.lower().endswith(".csv")
+    source_key = os.path.abspath(args.source) + ("" if is_csv else f"#{args.table}")
+
+    loader = StreamingLoader(target, source_key)
+    if args.restart:
+        loader.reset()
+    start = loader.checkpoint()[0]
+    if start:
+        print(f"Resuming {source_key} after position {start}.", file=sys.stderr)
+
+    if is_csv:
+        records, total = iter_csv(args.source, start), None
+    else:
+        # A separate connection keeps reads off the loader's transactions
+        reader = sqlite3.connect(args.source)
+        total = reader.execute(f'SELECT MAX(rowid) FROM "{args.table}";').fetchone()[0]
+        records = iter_table(reader, args.table, start, args.chunk)
+
+    summary = run_load(target, records, source_key, total, args.chunk, _print_progress, delta=args.delta)
+    print(file=sys.stderr)
+    print(summary)
+    target.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,278 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
+import zlib
+
+from sharding import shard_map
+
+# Streaming extracts of purchase lines and sales (hot + archived history)
+# joined with their stores, cities, vendors and products. Rows are read with
+# fetchmany() and encoded batch by batch into CSV or NDJSON (optionally
+# gzipped), so memory stays flat however large the export is. Each database
+# is read in one read transaction on its own connection: the export is a
+# consistent snapshot, and a long download does not hold one of the pool's
+# readers. With DB_SHARDS set, the shards are streamed one after another.
+
+# Rows fetched per fetchmany() (and encoded per output chunk)
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "5000"))
+# Exports streaming at the same time; further requests are refused
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "2"))
+# gzip level for ?gzip=1 / --gzip (1 = fastest)
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+# columns: output field -> SQL expression; filters: name -> (SQL predicate, type).
+# Dimensions are LEFT JOINed so a row with a missing store, vendor or product
+# is still exported (with empty fields) instead of silently dropped.
+EXPORTS = {
+    "purchases": {
+        "from": """InvoiceLinesAll il
+            JOIN InvoicesAll i ON il.InvoiceId = i.InvoiceId
+            LEFT JOIN Stores s ON i.StoreId = s.StoreId
+            LEFT JOIN Cities c ON s.CityId = c.CityId
+            LEFT JOIN Vendors v ON i.VendorNumber = v.VendorNumber
+            LEFT JOIN Products p ON il.ProductId = p.ProductId""",
+        "columns": {
+            "InvoiceLineId": "il.InvoiceLineId",
+            "InvoiceId": "il.InvoiceId",
+            "InvoiceDate": "i.InvoiceDate",
+            "StoreId": "i.StoreId",
+            "CityName": "c.CityName",
+            "VendorNumber": "i.VendorNumber",
+            "VendorName": "v.VendorName",
+            "ProductId": "il.ProductId",
+            "Brand": "p.Brand",
+            "ProductName": "p.ProductName",
+            "Size": "p.Size",
+            "InventoryId": "il.InventoryId",
+            "PurchasePrice": "il.PurchasePrice",
+            "Quantity": "il.Quantity",
+            "LineTotal": "il.LineTotal",
+        },
+        "filters": {
+            "date_from": ("i.InvoiceDate >= ?", str),
+            "date_to": ("i.InvoiceDate <= ?", str),
+            "store_id": ("i.StoreId = ?", int),
+            "vendor_number": ("i.VendorNumber = ?", int),
+            "vendor": ("v.VendorName = ?", str),
+        },
+    },
+    "sales": {
+        "from": """SalesAll sa
+            LEFT JOIN Stores s ON sa.StoreId = s.StoreId
+            LEFT JOIN Cities c ON s.CityId = c.CityId
+            LEFT JOIN Products p ON sa.ProductId = p.ProductId""",
+        "columns": {
+            "SaleId": "sa.SaleId",
+            "SaleDate": "sa.SaleDate",
+            "StoreId": "sa.StoreId",
+            "CityName": "c.CityName",
+            "ProductId": "sa.ProductId",
+            "Brand": "p.Brand",
+            "ProductName": "p.ProductName",
+            "Size": "p.Size",
+            "Quantity": "sa.Quantity",
+            "SalePrice": "sa.SalePrice",
+            "TotalAmount": "sa.TotalAmount",
+        },
+        "filters": {
+            "date_from": ("sa.SaleDate >= ?", str),
+            "date_to": ("sa.SaleDate <= ?", str),
+            "store_id": ("sa.StoreId = ?", int),
+        },
+    },
+}
+
+_slots = threading.BoundedSemaphore(max(1, EXPORT_CONCURRENCY))
+
+
+class ExportBusyError(RuntimeError):
+    """Raised when EXPORT_CONCURRENCY exports are already streaming."""
+
+
+# ---------- Query ----------
+def export_sql(kind, filters=None):
+    """
+    SELECT for one export and its parameters. filters maps names from
+    EXPORTS[kind]["filters"] to raw values; unknown names or values that do
+    not convert raise ValueError.
+    """
+    if kind not in EXPORTS:
+        raise ValueError(f"Unknown export '{kind}'. Available: {', '.join(EXPORTS)}.")
+    spec = EXPORTS[kind]
+    where, params = [], []
+    for name, value in (filters or {}).items():
+        if value in (None, ""):
+            continue
+        if name not in spec["filters"]:
+            raise ValueError(f"'{name}' does not filter {kind}. Available: {', '.join(spec['filters'])}.")
+        predicate, cast = spec["filters"][name]
+        try:
+            params.append(cast(value))
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid {name}: {value!r}.") from None
+        where.append(predicate)
+    sql = (f"SELECT {', '.join(spec['columns'].values())} FROM {spec['from']}"
+           + (f" WHERE {' AND '.join(where)}" if where else "") + ";")
+    return sql, params
+
+
+def _databases(filters):
+    """Database files an export reads: every shard, or just the store's."""
+    shards = shard_map()
+    if shards is None:
+        from inventory_crud import current_db_path
+        return [current_db_path()]
+    store_id = (filters or {}).get("store_id")
+    if store_id not in (None, ""):
+        return [shards.path_of(int(store_id))]
+    return list(shards.shards.values())
+
+
+def _connect(db_path):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+    conn.execute("PRAGMA query_only = ON;")
+    return conn
+
+
+def iter_rows(kind, filters=None, batch=EXPORT_BATCH, db_paths=None):
+    """Yields lists of up to `batch` row tuples (in EXPORTS[kind]["columns"] order)."""
+    sql, params = export_sql(kind, filters)
+    for db_path in db_paths or _databases(filters):
+        conn = _connect(db_path)
+        try:
+            cur = conn.cursor()
+            cur.execute("BEGIN;")
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(batch)
+                if not rows:
+                    break
+                yield rows
+            cur.execute("COMMIT;")
+        finally:
+            conn.close()
+
+
+# ---------- Encoding ----------
+def csv_chunks(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def ndjson_chunks(columns, batches):
+    for rows in batches:
+        yield "".join(json.dumps(dict(zip(columns, row)), separators=(",", ":")) + "\n"
+                      for row in rows).encode()
+
+
+def gzip_chunks(chunks, level=EXPORT_GZIP_LEVEL):
+    # wbits=31: a gzip member (header + deflate + CRC), written incrementally
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+class ExportStream:
+    """
+    Iterator over the bytes of one export. Holds a concurrency slot from
+    creation until it is exhausted or closed (WSGI servers call close(),
+    also when the client disconnects or the body is never sent).
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._open = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self._open:
+            self._open = False
+            self._chunks.close()
+            _slots.release()
+
+
+def stream_export(kind, fmt="csv", filters=None, gzip=False, batch=EXPORT_BATCH, db_paths=None):
+    """
+    ExportStream of one export. Validates everything before the first row
+    is read, so errors surface as ValueError on the call, not mid-stream.
+    Raises ExportBusyError when EXPORT_CONCURRENCY exports are running.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'. Available: {', '.join(FORMATS)}.")
+    export_sql(kind, filters)
+    paths = db_paths or _databases(filters)
+    if not _slots.acquire(blocking=False):
+        raise ExportBusyError(f"{EXPORT_CONCURRENCY} export(s) already running; retry later.")
+    encode = csv_chunks if fmt == "csv" else ndjson_chunks
+    chunks = encode(list(EXPORTS[kind]["columns"]), iter_rows(kind, filters, batch, paths))
+    return ExportStream(gzip_chunks(chunks) if gzip else chunks)
+
+
+def export_filename(kind, fmt, gzip=False):
+    return f"{kind}.{fmt}" + (".gz" if gzip else "")
+
+
+# ---------- CLI ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream purchase or sales history to CSV / NDJSON.")
+    parser.add_argument("kind", choices=sorted(EXPORTS))
+    parser.add_argument("--db", default=os.getenv("DB_PATH", "inventory.db"))
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--from", dest="date_from", help="first date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", help="last date (YYYY-MM-DD)")
+    parser.add_argument("--store", dest="store_id", type=int)
+    parser.add_argument("--vendor-number", dest="vendor_number", type=int, help="purchases only")
+    parser.add_argument("--vendor", help="vendor name (purchases only)")
+    parser.add_argument("--batch", type=int, default=EXPORT_BATCH, help="rows per fetchmany()")
+    parser.add_argument("--out", help="output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    filters = {name: getattr(args, name) for name in ("date_from", "date_to", "store_id", "vendor_number", "vendor")
+               if getattr(args, name) is not None}
+    # With DB_SHARDS set, every shard (or the --store's) is exported instead of --db
+    db_paths = None if shard_map() else [args.db]
+    if db_paths and not os.path.exists(args.db):
+        raise SystemExit(f"DB not found: {args.db}")
+    try:
+        chunks = stream_export(args.kind, args.format, filters, args.gzip, args.batch, db_paths)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    out = open(args.out, "wb") if args.out else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if args.out:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# Partial index over non-empty lots: depleted (Quantity = 0) lines drop out
+# of it, so FIFO never walks a product's fully consumed history.
+FIFO_INDEX_DDL = """
+CREATE INDEX IF NOT EXISTS idx_invoicelines_open_lots
+ON InvoiceLines (ProductId, InvoiceLineId)
+WHERE Quantity > 0;
+"""
+
+# Open lots of one product at one store, oldest first, with the running
+# quantity ahead of each lot. Only lots that start before `quantity` is
+# covered are returned, together with how much of each to take.
+FIFO_LOTS_SQL = """
+    SELECT InvoiceLineId, InvoiceId, PurchasePrice, Quantity,
+           MIN(Quantity, :quantity - Ahead) AS Taken
+    FROM (
+        SELECT il.InvoiceLineId, il.InvoiceId, il.PurchasePrice, il.Quantity,
+               COALESCE(SUM(il.Quantity) OVER (
+                   ORDER BY il.InvoiceLineId
+                   ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+               ), 0) AS Ahead
+        FROM InvoiceLines il INDEXED BY idx_invoicelines_open_lots
+        JOIN Invoices i ON il.InvoiceId = i.InvoiceId
+        WHERE il.ProductId = :product_id
+          AND il.Quantity > 0
+          AND i.StoreId = :store_id
+    )
+    WHERE Ahead < :quantity;
+"""
+
+
+def ensure_fifo_index(conn):
+    conn.executescript(FIFO_INDEX_DDL)
+
+
+# ---------- FIFO depletion ----------
+def deplete_fifo(cur, store_id, product_id, quantity):
+    """
+    Consumes `quantity` units of a product from the store's oldest open lots.
+    Runs inside the caller's transaction: one windowed SELECT picks the lots,
+    one executemany applies the deductions.
+    Returns the consumed lots as dicts (InvoiceLineId, InvoiceId, PurchasePrice,
+    QuantityTaken, QuantityLeft). Fewer units than requested are taken only
+    when the store's open lots run out; callers check stock first.
+    """
+    if quantity <= 0:
+        return []
+    cur.execute(FIFO_LOTS_SQL, {"store_id": store_id, "product_id": product_id, "quantity": quantity})
+    # Sorted here rather than in SQL (no temp B-tree); keyed on InvoiceLineId
+    # because pooled connections return sqlite3.Row, which does not order
+    lots = [
+        {
+            "InvoiceLineId": line_id,
+            "InvoiceId": invoice_id,
+            "PurchasePrice": float(price),
+            "QuantityTaken": taken,
+            "QuantityLeft": lot_qty - taken,
+        }
+        for line_id, invoice_id, price, lot_qty, taken in sorted(cur.fetchall(), key=lambda r: r[0])
+    ]
+    cur.executemany(
+        "UPDATE InvoiceLines SET Quantity = Quantity - ? WHERE InvoiceLineId = ?;",
+        [(lot["QuantityTaken"], lot["InvoiceLineId"]) for lot in lots],
+    )
+    return lots
+
+
+def cost_of_goods(lots):
+    """Total purchase cost of the consumed lots."""
+    return round(sum(lot["PurchasePrice"] * lot["QuantityTaken"] for lot in lots), 2)
@@ -0,0 +1,9 @@
+# gunicorn.conf.py — production WSGI settings (gunicorn -c gunicorn.conf.py wsgi:application)
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+# One process: the database executor and its writer thread are per process
+workers = int(os.getenv("WEB_WORKERS", "1"))
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "16"))
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
@@ -0,0 +1,190 @@
+import argparse
+import os
+import re
+import sqlite3
+
+from change_log import READ_CHANGES_SQL
+from exports import export_sql
+from fifo import FIFO_LOTS_SQL
+from migrations import current_version, migrate
+from sales_rollup import revenue_report_sql
+from schema_catalog import load_schema
+from statements import STATEMENTS
+
+# name -> (sql, sample params, allowed findings)
+# Allowed findings: "scan" (full table scan) and/or "temp_btree" (sort/group
+# without an index) for queries that aggregate the whole table by design.
+QUERY_REGISTRY = {}
+
+
+def register_query(name, sql, params=(), allow=()):
+    """Adds a statement to the set checked by the advisor."""
+    QUERY_REGISTRY[name] = (sql, params, frozenset(allow))
+
+
+# ---------- inventory_crud.py statement shapes ----------
+for _name, (_sql, _sample, _allow) in STATEMENTS.items():
+    if _sample is not None:
+        register_query(_name, _sql, _sample, allow=_allow)
+# Lookups behind ref_cache.RefCache and stock_levels
+register_query("city_by_name", "SELECT CityId FROM Cities WHERE CityName = ?;", ("X",))
+register_query("city_name_by_id", "SELECT CityName FROM Cities WHERE CityId = ?;", (1,))
+register_query("store_by_id", "SELECT CityId FROM Stores WHERE StoreId = ?;", (1,))
+register_query("product_by_name_size",
+               "SELECT ProductId, Brand FROM Products WHERE ProductName = ? AND Size = ?;", ("X", "750mL"))
+register_query("vendor_by_name", "SELECT VendorNumber FROM Vendors WHERE VendorName = ?;", ("X",))
+register_query("stock_point_lookup",
+               "SELECT Quantity FROM StockLevels WHERE StoreId = ? AND ProductId = ?;", (1, 1))
+register_query("fifo_open_lots", FIFO_LOTS_SQL, {"store_id": 1, "product_id": 1, "quantity": 1})
+register_query("archive_depleted_lines", """
+    SELECT il.InvoiceLineId, il.InvoiceId, i.StoreId, il.ProductId,
+           COALESCE(strftime('%Y', i.InvoiceDate), 'undated')
+    FROM InvoiceLines il INDEXED BY idx_invoicelines_depleted
+    JOIN Invoices i ON il.InvoiceId = i.InvoiceId
+    WHERE il.Quantity = 0 AND i.InvoiceDate < ?
+    LIMIT ?;
+""", ("2016-01-01", 100), allow=("scan",))
+register_query("archive_old_sales", """
+    SELECT SaleId, ProductId, COALESCE(strftime('%Y', SaleDate), 'undated')
+    FROM Sales WHERE SaleDate < ? LIMIT ?;
+""", ("2016-01-01", 100))
+register_query("product_name_prefix", """
+    SELECT ProductId, ProductName, Size, Brand FROM Products
+    WHERE ProductName LIKE ? ESCAPE '\\' ORDER BY ProductName COLLATE NOCASE, Size LIMIT ?;
+""", ("old v%", 10))
+register_query("change_log_tail", READ_CHANGES_SQL, (0, 1000))
+register_query("change_log_checkpoint", "SELECT Seq FROM ChangeConsumers WHERE Consumer = ?;", ("x",))
+# Full extracts read every row by design; a store filter should use an index
+for _kind in ("purchases", "sales"):
+    register_query(f"export_{_kind}", *export_sql(_kind), allow=("scan",))
+    register_query(f"export_{_kind}_store", *export_sql(_kind, {"store_id": 1, "date_from": "2016-01-01"}))
+_report_params = {"date_from": "2016-01-01", "date_to": "2016-12-31", "store_id": 1, "limit": 100}
+# Grouped reports aggregate a whole date range; the planner may drive them from Products
+register_query("report_revenue_by_product", revenue_report_sql(("product",))[0], _report_params,
+               allow=("scan", "temp_btree"))
+register_query("report_revenue_store_by_date", revenue_report_sql(("date",), store_id=1, order="key")[0],
+               _report_params)
+
+
+def _register_dashboard_queries():
+    # Imported lazily: dashboard pulls in Flask
+    from dashboard import (LOW_STOCK_SQL, REVENUE_BY_PRODUCT_SQL, STOCK_BY_CITY_SQL, STOCK_BY_PRODUCT_SIZE_SQL,
+                           STOCK_BY_PRODUCT_SQL, TOP_REVENUE_SQL)
+    from sharding import LATEST_PURCHASE_SQL, LATEST_SALE_SQL
+
+    whole_table = ("scan", "temp_btree")
+    register_query("dashboard_stock_by_product", STOCK_BY_PRODUCT_SQL, allow=whole_table)
+    register_query("dashboard_top_revenue", TOP_REVENUE_SQL, allow=whole_table)
+    register_query("dashboard_stock_by_city", STOCK_BY_CITY_SQL, allow=whole_table)
+    register_query("dashboard_low_stock", LOW_STOCK_SQL, allow=whole_table)
+    register_query("shard_revenue_by_product", REVENUE_BY_PRODUCT_SQL, allow=whole_table)
+    register_query("shard_stock_by_product_size", STOCK_BY_PRODUCT_SIZE_SQL, allow=whole_table)
+    register_query("shard_latest_purchase_price", LATEST_PURCHASE_SQL, (1,))
+    register_query("shard_latest_sale_price", LATEST_SALE_SQL, (1,))
+
+
+def _register_api_queries():
+    # Imported lazily: api pulls in Flask
+    from api import LIST_RESOURCES, page_sql
+
+    for name, spec in LIST_RESOURCES.items():
+        key = spec["key"]
+        register_query(f"api_{name}_page",
+                       page_sql(spec, list(spec["columns"]), [f"{spec['columns'][key]} > ?"]), (0, 100))
+        if "store" in spec:
+            # Sharded cursor: (key, store) after (?, ?)
+            key_sql, store_sql = spec["columns"][key], spec["columns"][spec["store"]]
+            register_query(f"api_{name}_page_sharded",
+                           page_sql(spec, list(spec["columns"]),
+                                    [f"{key_sql} >= ?", f"({key_sql} > ? OR {store_sql} > ?)"]), (0, 0, 0, 100))
+
+
+# ---------- Plan analysis ----------
+def _findings(plan_details):
+    found = []
+    for detail in plan_details:
+        if detail.startswith("SCAN ") and "COVERING INDEX" not in detail \
+                and not detail.startswith(("SCAN (subquery", "SCAN CONSTANT ROW")):
+            found.append(("scan", detail))
+        elif "USE TEMP B-TREE" in detail:
+            found.append(("temp_btree", detail))
+    return found
+
+
+def explain(conn, sql, params=()):
+    """EXPLAIN QUERY PLAN detail strings for one statement."""
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+
+
+def advise(conn, include_dashboard=True):
+    """
+    Runs EXPLAIN QUERY PLAN over every registered query.
+    Returns a list of dicts (name, plan, issues, allowed); `issues` holds
+    full scans / temp B-trees that the query did not declare as expected.
+    """
+    if include_dashboard:
+        _register_dashboard_queries()
+        _register_api_queries()
+    report = []
+    for name, (sql, params, allow) in sorted(QUERY_REGISTRY.items()):
+        try:
+            plan = explain(conn, sql, params)
+        except sqlite3.Error as e:
+            report.append({"name": name, "plan": [], "issues": [f"error: {e}"], "allowed": []})
+            continue
+        findings = _findings(plan)
+        report.append({
+            "name": name,
+            "plan": plan,
+            "issues": [f"{kind}: {detail}" for kind, detail in findings if kind not in allow],
+            "allowed": [f"{kind}: {detail}" for kind, detail in findings if kind in allow],
+        })
+    return report
+
+
+def unused_indexes(schema, report):
+    """
+    Indexes created with CREATE INDEX (not PRIMARY KEY / UNIQUE constraints)
+    that no registered query plan uses. Informational: an index can still
+    serve ad-hoc queries or a statement the registry does not cover.
+    """
+    used = set()
+    for r in report:
+        for detail in r["plan"]:
+            used.update(re.findall(r"USING (?:COVERING )?INDEX (\S+)", detail))
+    return sorted(name for name, index in schema["indexes"].items()
+                  if index["origin"] == "c" and name not in used)
+
+
+# ---------- CLI ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="EXPLAIN every registered query and flag scans and temp B-trees.")
+    parser.add_argument("--db", default=os.getenv("DB_PATH", "inventory.db"))
+    parser.add_argument("--no-migrate", action="store_true", help="check the schema as it is")
+    args = parser.parse_args(argv)
+
+    # sqlite3.connect would create an empty database, which migrate cannot upgrade
+    if not os.path.exists(args.db):
+        raise SystemExit(f"DB not found: {args.db}")
+    conn = sqlite3.connect(args.db)
+    if not args.no_migrate:
+        migrate(conn)
+    print(f"Schema version {current_version(conn)}")
+
+    report = advise(conn)
+    flagged = [r for r in report if r["issues"]]
+    for r in report:
+        status = "FLAG" if r["issues"] else "ok"
+        print(f"[{status:>4}] {r['name']}")
+        for issue in r["issues"]:
+            print(f"         {issue}")
+    print(f"{len(flagged)} of {len(report)} queries flagged.")
+    unused = unused_indexes(load_schema(conn, args.db), report)
+    if unused:
+        print(f"Indexes no registered query uses: {', '.join(unused)}")
+    conn.close()
+    raise SystemExit(1 if flagged else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,170 @@
-import sqlite3
+import contextlib
+import contextvars
+import functools
+from decimal import ROUND_HALF_UP, Decimal
+import logging
 import os
+import threading
+import time
+
+from archive import restore_archived
+from change_log import log_change, log_changes
+from db_pool import get_pool
+from fifo import cost_of_goods, deplete_fifo
+from migrations import migrate
+from product_search import autocomplete, search
+from ref_cache import get_ref_cache
+from result_cache import get_result_cache
+from schema_catalog import check_schema
+from sales_rollup import adjust_sales_daily, adjust_sales_daily_many
+import statements as sql
+from stock_levels import adjust_stock, adjust_stock_many, get_stock
+from write_queue import get_write_queue
 
 # Configurable DB path
 DB_PATH = os.getenv("DB_PATH", "inventory.db")
+# Database the calls below run against; sharding.py points it at a shard
+_db_path = contextvars.ContextVar("inventory_db_path", default=DB_PATH)
+
+_schema_ready = set()
+_schema_lock = threading.Lock()
+_write_listeners = []
+
+log = logging.getLogger(__name__)
+
+
+# ---------- Helper: Database Selection ----------
+def current_db_path():
+    """The database inventory_crud calls use in this context (DB_PATH unless use_database() is active)."""
+    return _db_path.get()
+
+
+@contextlib.contextmanager
+def use_database(db_path):
+    """
+    Runs the enclosed inventory_crud calls against db_path. The choice is a
+    context variable, so it follows queued mutations onto the write queue
+    and reads onto the executor's threads.
+    """
+    token = _db_path.set(db_path)
+    try:
+        yield
+    finally:
+        _db_path.reset(token)
+
 
 # ---------- Helper: Get Connection ----------
-def get_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON;")
-    return conn
+def get_connection(readonly=False):
+    """
+    Borrows a long-lived connection from the shared pool.
+    Writers share the single writer connection; readonly=True uses a reader.
+    conn.close() returns it to the pool.
+    """
+    pool = get_pool(current_db_path())
+    if pool.db_path not in _schema_ready:
+        _ensure_schema(pool)
+    return pool.acquire(readonly=readonly)
+
+
+def _ensure_schema(pool):
+    # Pending schema migrations run once per DB, on first use; then the
+    # (cached) schema snapshot must have every table and column used here
+    with _schema_lock:
+        if pool.db_path in _schema_ready:
+            return
+        conn = pool.acquire()
+        try:
+            migrate(conn)
+            check_schema(conn, pool.db_path)
+        finally:
+            conn.close()
+        _schema_ready.add(pool.db_path)
+
+
+def ref_cache():
+    """Dimension lookup cache (Cities, Stores, Products, Vendors) for the current database."""
+    return get_ref_cache(current_db_path())
+
+
+def result_cache():
+    """Memoized read_product_across_locations() results for the current database."""
+    return get_result_cache(current_db_path())
+
+
+# ---------- Helper: Write Queue ----------
+def write_queue():
+    """Single-writer, group-commit mutation queue for the current database."""
+    pool = get_pool(current_db_path())
+    if pool.db_path not in _schema_ready:
+        _ensure_schema(pool)
+    # A failed batch may have cached ids of rows it inserted
+    return get_write_queue(pool.db_path, on_abort=ref_cache().invalidate_all)
+
+
+def queued_mutation(body):
+    """
+    Turns body(tx, ...) into a write function that runs on the write queue.
+    fn(...) waits for the committed result; fn.submit(...) returns the Future.
+    """
+    @functools.wraps(body)
+    def run(*args, **kwargs):
+        return submit(*args, **kwargs).result()
+
+    def submit(*args, **kwargs):
+        return write_queue().submit(body, *args, **kwargs)
+
+    run.submit = submit
+    return run
+
+
+# ---------- Helper: Write Listeners ----------
+def register_write_listener(callback):
+    """
+    Registers callback(event, product_ids), called after every committed mutation.
+    event is one of "purchase", "sale", "delete_purchase_line", "delete_product", "archive".
+    """
+    _write_listeners.append(callback)
+
+
+def notify_write(event, product_ids):
+    product_ids = tuple(sorted(set(product_ids)))
+    for callback in list(_write_listeners):
+        try:
+            callback(event, product_ids)
+        except Exception:
+            log.exception("Write listener %r failed for %s", callback, event)
+
+
+def _invalidate_lookups(event, product_ids):
+    result_cache().on_write(event, product_ids)
+
+
+register_write_listener(_invalidate_lookups)
+
+
+def _invoice_id(cur, store_id, vendor_number, invoice_date):
+    """InvoiceId for the key: the hot header, an archived one brought back, or a new one."""
+    key = (store_id, vendor_number, invoice_date)
+    cur.execute(sql.INVOICE_BY_KEY, key)
+    row = cur.fetchone()
+    if row is None and restore_archived(cur, "Invoices", [key]):
+        cur.execute(sql.INVOICE_BY_KEY, key)
+        row = cur.fetchone()
+    if row:
+        return row[0]
+    cur.execute(sql.INVOICE_INSERT, key)
+    return cur.lastrowid
+
+
+def _round2(value):
+    # Responses used to come from SQLite's ROUND(x, 2), which rounds the
+    # shortest decimal form half up (36.665 -> 36.67, where round() gives 36.66)
+    return float(Decimal(repr(float(value))).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
 
 
 # ---------- 1️⃣ Add New Product Purchase ----------
-def add_new_product_purchase(store_id, product_id, product_name, size,
+@queued_mutation
+def add_new_product_purchase(tx, store_id, product_id, product_name, size,
                              vendor_number, vendor_name,
                              invoice_date, purchase_price, quantity):
     """
@@ -23,226 +174,165 @@ def add_new_product_purchase(store_id, product_id, product_name, size,
     Returns the inserted purchase row as dict (JSON-ready).
     """
 
-    conn = get_connection()
-    cur = conn.cursor()
+    cur = tx.cursor(tuples=True)
+    cache = ref_cache()
 
     # Check for existing ProductId
-    cur.execute("SELECT COUNT(*) FROM Products WHERE ProductId = ?;", (product_id,))
+    cur.execute(sql.PRODUCT_EXISTS, (product_id,))
     if cur.fetchone()[0] > 0:
-        conn.close()
         return {"error": f"ProductId {product_id} already exists. Please use a new ProductId."}
 
-    # Ensure Vendor exists
-    cur.execute("""
-        INSERT OR IGNORE INTO Vendors (VendorNumber, VendorName)
-        VALUES (?, ?)
-    """, (vendor_number, vendor_name))
+    # Store (and its city, for the response)
+    city_id = cache.store_city_id(cur, store_id)
+    if city_id is None:
+        return {"error": f"Store {store_id} not found."}
+    city_name = cache.city_name(cur, city_id)
 
-    # Insert Product
-    cur.execute("""
-        INSERT INTO Products (ProductId, Brand, ProductName, Size)
-        VALUES (?, ?, ?, ?)
-    """, (product_id, vendor_number, product_name, size))
-
-    # Create Invoice
-    cur.execute("""
-        INSERT INTO Invoices (StoreId, VendorNumber, InvoiceDate)
-        VALUES (?, ?, ?)
-    """, (store_id, vendor_number, invoice_date))
-    invoice_id = cur.lastrowid
+    # Ensure Vendor exists; an existing number keeps its stored name
+    cur.execute(sql.VENDOR_INSERT_OR_IGNORE, (vendor_number, vendor_name))
+    if cur.rowcount == 0:
+        cur.execute(sql.VENDOR_NAME, (vendor_number,))
+        vendor_name = cur.fetchone()[0]
 
-    # Insert Invoice Line
-    line_total = float(purchase_price) * float(quantity)
-    cur.execute("""
-        INSERT INTO InvoiceLines (InvoiceId, ProductId, PurchasePrice, Quantity, LineTotal)
-        VALUES (?, ?, ?, ?, ?);
-    """, (invoice_id, product_id, float(purchase_price), quantity, line_total))
-
-    conn.commit()
-
-    # Retrieve and return the joined record
-    cur.execute("""
-        SELECT 
-            c.CityName, s.StoreId, v.VendorName, p.ProductName, p.Size,
-            i.InvoiceDate, ROUND(il.PurchasePrice, 2) AS PurchasePrice,
-            il.Quantity, ROUND(il.LineTotal, 2) AS LineTotal
-        FROM InvoiceLines il
-        JOIN Invoices i ON il.InvoiceId = i.InvoiceId
-        JOIN Vendors v ON i.VendorNumber = v.VendorNumber
-        JOIN Products p ON il.ProductId = p.ProductId
-        JOIN Stores s ON i.StoreId = s.StoreId
-        JOIN Cities c ON s.CityId = c.CityId
-        WHERE il.InvoiceId = ? AND il.ProductId = ?;
-    """, (invoice_id, product_id))
+    # Insert Product
+    cur.execute(sql.PRODUCT_INSERT, (product_id, vendor_number, product_name, size))
 
-    row = cur.fetchone()
-    conn.close()
+    # Check or Create Invoice
+    invoice_id = _invoice_id(cur, store_id, vendor_number, invoice_date)
 
-    if not row:
-        return {"error": "No matching inserted record found."}
-    return dict(row)
+    # Insert Invoice Line
+    purchase_price = float(purchase_price)
+    line_total = purchase_price * float(quantity)
+    cur.execute(sql.INVOICE_LINE_INSERT, (invoice_id, product_id, purchase_price, quantity, line_total))
+    adjust_stock(cur, store_id, product_id, quantity, line_delta=1)
+    log_change(cur, "purchase", store_id, product_id, invoice_date, stock=quantity, lines=1,
+               detail={"InvoiceId": invoice_id, "Quantity": quantity, "PurchasePrice": purchase_price,
+                       "ProductName": product_name, "Size": size})
+
+    tx.after_commit(cache.invalidate_vendor, vendor_name)
+    tx.after_commit(cache.invalidate_product, product_name, size)
+    tx.after_commit(result_cache().invalidate_name, product_name)
+    tx.after_commit(notify_write, "purchase", [product_id])
+
+    # Everything in the record is already known; no read-back join
+    return {
+        "CityName": city_name, "StoreId": store_id, "VendorName": vendor_name,
+        "ProductName": product_name, "Size": size, "InvoiceDate": invoice_date,
+        "PurchasePrice": _round2(purchase_price), "Quantity": quantity, "LineTotal": _round2(line_total),
+    }
 
 
 # ---------- 2️⃣ Update Existing Purchase ----------
-def update_existing_purchase(city, store_id, vendor_name, product_name, size, invoice_date, quantity):
+@queued_mutation
+def update_existing_purchase(tx, city, store_id, vendor_name, product_name, size, invoice_date, quantity,
+                             purchase_price=None):
     """
     Updates purchase quantity only if City, Store, and Product already exist.
-    Uses the latest PurchasePrice from an existing record.
+    Uses the latest PurchasePrice from an existing record unless purchase_price is given.
     Returns updated record as dict.
     """
 
-    conn = get_connection()
-    cur = conn.cursor()
+    cur = tx.cursor(tuples=True)
+    cache = ref_cache()
 
     # Verify City
-    cur.execute("SELECT CityId FROM Cities WHERE CityName = ?;", (city,))
-    row = cur.fetchone()
-    if not row:
-        conn.close()
+    city_id = cache.city_id(cur, city)
+    if city_id is None:
         return {"error": f"City '{city}' does not exist."}
-    city_id = row[0]
 
     # Verify Store
-    cur.execute("SELECT CityId FROM Stores WHERE StoreId = ?;", (store_id,))
-    row = cur.fetchone()
-    if not row or row[0] != city_id:
-        conn.close()
+    store_city = cache.store_city_id(cur, store_id)
+    if store_city is None or store_city != city_id:
         return {"error": f"Store {store_id} not found in city '{city}'."}
 
     # Verify Product
-    cur.execute("SELECT ProductId, Brand FROM Products WHERE ProductName = ? AND Size = ?;", (product_name, size))
-    row = cur.fetchone()
-    if not row:
-        conn.close()
+    product = cache.product(cur, product_name, size)
+    if not product:
         return {"error": f"Product '{product_name}' ({size}) not found."}
-    product_id, brand = row
+    product_id, brand = product
 
     # Ensure Vendor
-    cur.execute("SELECT VendorNumber FROM Vendors WHERE VendorName = ?;", (vendor_name,))
-    vendor_row = cur.fetchone()
-    if vendor_row:
-        vendor_number = vendor_row[0]
-    else:
-        cur.execute("INSERT INTO Vendors (VendorName) VALUES (?);", (vendor_name,))
+    vendor_number = cache.vendor_number(cur, vendor_name)
+    vendor_created = vendor_number is None
+    if vendor_created:
+        cur.execute(sql.VENDOR_INSERT, (vendor_name,))
         vendor_number = cur.lastrowid
 
     # Check or Create Invoice
-    cur.execute("""
-        SELECT InvoiceId FROM Invoices
-        WHERE StoreId = ? AND VendorNumber = ? AND InvoiceDate = ?;
-    """, (store_id, vendor_number, invoice_date))
-    invoice_row = cur.fetchone()
-    if invoice_row:
-        invoice_id = invoice_row[0]
-    else:
-        cur.execute("""
-            INSERT INTO Invoices (StoreId, VendorNumber, InvoiceDate)
-            VALUES (?, ?, ?);
-        """, (store_id, vendor_number, invoice_date))
-        invoice_id = cur.lastrowid
+    invoice_id = _invoice_id(cur, store_id, vendor_number, invoice_date)
 
     # Get latest PurchasePrice
-    cur.execute("""
-        SELECT CAST(PurchasePrice AS REAL)
-        FROM InvoiceLines il
-        JOIN Products p ON il.ProductId = p.ProductId
-        WHERE p.ProductName = ?
-        ORDER BY il.InvoiceLineId DESC
-        LIMIT 1;
-    """, (product_name,))
-    price_row = cur.fetchone()
-    if not price_row:
-        conn.close()
-        return {"error": f"No previous purchase price for '{product_name}'."}
-    purchase_price = float(price_row[0])
+    if purchase_price is None:
+        cur.execute(sql.LATEST_PURCHASE_PRICE, (product_id,))
+        price_row = cur.fetchone()
+        if not price_row:
+            return {"error": f"No previous purchase price for '{product_name}'."}
+        purchase_price = float(price_row[0])
+    else:
+        purchase_price = float(purchase_price)
 
     # Update or Insert InvoiceLine
-    cur.execute("SELECT InvoiceLineId, Quantity FROM InvoiceLines WHERE InvoiceId = ? AND ProductId = ?;",
-                (invoice_id, product_id))
+    cur.execute(sql.INVOICE_LINE_BY_INVOICE_PRODUCT, (invoice_id, product_id))
     line = cur.fetchone()
 
     if line:
-        line_id, old_qty = line
+        line_id, old_qty = line[:2]
         new_qty = old_qty + quantity
-        new_total = new_qty * purchase_price
-        cur.execute("""
-            UPDATE InvoiceLines
-            SET Quantity = ?, PurchasePrice = ?, LineTotal = ?
-            WHERE InvoiceLineId = ?;
-        """, (new_qty, purchase_price, new_total, line_id))
+        line_total = new_qty * purchase_price
+        cur.execute(sql.INVOICE_LINE_UPDATE, (new_qty, purchase_price, line_total, line_id))
+        line_delta = 0
     else:
+        new_qty = quantity
         line_total = purchase_price * quantity
-        cur.execute("""
-            INSERT INTO InvoiceLines (InvoiceId, ProductId, PurchasePrice, Quantity, LineTotal)
-            VALUES (?, ?, ?, ?, ?);
-        """, (invoice_id, product_id, purchase_price, quantity, line_total))
-
-    conn.commit()
-
-    # Return updated joined view
-    cur.execute("""
-        SELECT c.CityName, s.StoreId, v.VendorName, p.ProductName, p.Size,
-               i.InvoiceDate, il.Quantity,
-               ROUND(il.PurchasePrice, 2) AS PurchasePrice,
-               ROUND(il.LineTotal, 2) AS LineTotal
-        FROM InvoiceLines il
-        JOIN Invoices i ON il.InvoiceId = i.InvoiceId
-        JOIN Vendors v ON i.VendorNumber = v.VendorNumber
-        JOIN Products p ON il.ProductId = p.ProductId
-        JOIN Stores s ON i.StoreId = s.StoreId
-        JOIN Cities c ON s.CityId = c.CityId
-        WHERE c.CityName = ? AND s.StoreId = ? AND p.ProductName = ? AND p.Size = ?
-              AND v.VendorName = ? AND i.InvoiceDate = ?;
-    """, (city, store_id, product_name, size, vendor_name, invoice_date))
-    row = cur.fetchone()
-    conn.close()
+        cur.execute(sql.INVOICE_LINE_INSERT, (invoice_id, product_id, purchase_price, quantity, line_total))
+        line_delta = 1
+    adjust_stock(cur, store_id, product_id, quantity, line_delta=line_delta)
+    log_change(cur, "purchase", store_id, product_id, invoice_date, stock=quantity, lines=line_delta,
+               detail={"InvoiceId": invoice_id, "Quantity": quantity, "PurchasePrice": purchase_price})
 
-    return dict(row) if row else {"error": "No updated row found."}
+    if vendor_created:
+        tx.after_commit(cache.invalidate_vendor, vendor_name)
+    tx.after_commit(notify_write, "purchase", [product_id])
+
+    # The updated line, from the values just written
+    return {
+        "CityName": city, "StoreId": store_id, "VendorName": vendor_name,
+        "ProductName": product_name, "Size": size, "InvoiceDate": invoice_date,
+        "Quantity": new_qty, "PurchasePrice": _round2(purchase_price), "LineTotal": _round2(line_total),
+    }
 
 
 # ---------- 3️⃣ Update Sales ----------
-def update_sales(city, store_id, product_name, size, sale_date, quantity, sale_price=None):
+@queued_mutation
+def update_sales(tx, city, store_id, product_name, size, sale_date, quantity, sale_price=None):
     """
     Records or updates a sale entry, deducting from inventory.
     Returns sale info + updated inventory.
     """
 
-    conn = get_connection()
-    cur = conn.cursor()
+    cur = tx.cursor(tuples=True)
+    cache = ref_cache()
 
     # Validate City and Store
-    cur.execute("SELECT CityId FROM Cities WHERE CityName = ?;", (city,))
-    city_row = cur.fetchone()
-    if not city_row:
-        conn.close()
+    city_id = cache.city_id(cur, city)
+    if city_id is None:
         return {"error": f"City '{city}' not found."}
-    city_id = city_row[0]
 
-    cur.execute("SELECT CityId FROM Stores WHERE StoreId = ?;", (store_id,))
-    store_row = cur.fetchone()
-    if not store_row or store_row[0] != city_id:
-        conn.close()
+    store_city = cache.store_city_id(cur, store_id)
+    if store_city is None or store_city != city_id:
         return {"error": f"Store {store_id} invalid for city '{city}'."}
 
     # Validate Product
-    cur.execute("SELECT ProductId FROM Products WHERE ProductName = ? AND Size = ?;", (product_name, size))
-    product_row = cur.fetchone()
-    if not product_row:
-        conn.close()
+    product = cache.product(cur, product_name, size)
+    if not product:
         return {"error": f"Product '{product_name}' ({size}) not found."}
-    product_id = product_row[0]
+    product_id = product[0]
 
     # Determine Sale Price
     if sale_price is None:
-        cur.execute("""
-            SELECT SalePrice FROM Sales s
-            JOIN Products p ON s.ProductId = p.ProductId
-            WHERE p.ProductName = ?
-            ORDER BY s.SaleId DESC LIMIT 1;
-        """, (product_name,))
+        cur.execute(sql.LATEST_SALE_PRICE, (product_id,))
         row = cur.fetchone()
         if not row:
-            conn.close()
             return {"error": f"No previous sale price found for '{product_name}'."}
         sale_price = float(row[0])
     else:
@@ -251,186 +341,182 @@ def update_sales(city, store_id, product_name, size, sale_date, quantity, sale_p
     total_amount = float(quantity) * sale_price
 
     # Check Inventory
-    cur.execute("""
-        SELECT SUM(Quantity) FROM InvoiceLines il
-        JOIN Products p ON il.ProductId = p.ProductId
-        JOIN Invoices i ON il.InvoiceId = i.InvoiceId
-        WHERE i.StoreId = ? AND p.ProductName = ?;
-    """, (store_id, product_name))
-    available = cur.fetchone()[0] or 0
+    available = get_stock(cur, store_id, product_id)
     if available < quantity:
-        conn.close()
         return {"error": f"Not enough stock. Available: {available}, Requested: {quantity}"}
 
-    # Upsert Sale
-    cur.execute("SELECT SaleId, Quantity FROM Sales WHERE StoreId = ? AND ProductId = ? AND SaleDate = ?;",
-                (store_id, product_id, sale_date))
+    # Upsert Sale (into the archived row for the key, if there is one)
+    cur.execute(sql.SALE_BY_KEY, (store_id, product_id, sale_date))
     sale_row = cur.fetchone()
+    if sale_row is None and restore_archived(cur, "Sales", [(store_id, product_id, sale_date)]):
+        cur.execute(sql.SALE_BY_KEY, (store_id, product_id, sale_date))
+        sale_row = cur.fetchone()
     if sale_row:
-        sale_id, old_qty = sale_row
+        sale_id, old_qty, old_total = sale_row
         new_qty = old_qty + quantity
         new_total = new_qty * sale_price
-        cur.execute("""
-            UPDATE Sales SET Quantity = ?, SalePrice = ?, TotalAmount = ?
-            WHERE SaleId = ?;
-        """, (new_qty, sale_price, new_total, sale_id))
+        cur.execute(sql.SALE_UPDATE, (new_qty, sale_price, new_total, sale_id))
+        revenue = new_total - float(old_total)
     else:
-        cur.execute("""
-            INSERT INTO Sales (StoreId, ProductId, SaleDate, Quantity, SalePrice, TotalAmount)
-            VALUES (?, ?, ?, ?, ?, ?);
-        """, (store_id, product_id, sale_date, quantity, sale_price, total_amount))
-
-    # Deduct Inventory (FIFO)
-    cur.execute("SELECT InvoiceLineId, Quantity FROM InvoiceLines WHERE ProductId = ? ORDER BY InvoiceLineId ASC;",
-                (product_id,))
-    lines = cur.fetchall()
-    remaining = quantity
-    for inv_id, inv_qty in lines:
-        if remaining <= 0:
-            break
-        if inv_qty <= remaining:
-            cur.execute("UPDATE InvoiceLines SET Quantity = 0 WHERE InvoiceLineId = ?;", (inv_id,))
-            remaining -= inv_qty
-        else:
-            new_qty = inv_qty - remaining
-            cur.execute("UPDATE InvoiceLines SET Quantity = ? WHERE InvoiceLineId = ?;", (new_qty, inv_id))
-            remaining = 0
-
-    conn.commit()
-
-    # Prepare Response
-    cur.execute("""
-        SELECT c.CityName, s.StoreId, p.ProductName, p.Size,
-               sa.SaleDate, sa.Quantity, ROUND(sa.SalePrice, 2) AS SalePrice,
-               ROUND(sa.TotalAmount, 2) AS TotalAmount
-        FROM Sales sa
-        JOIN Stores s ON sa.StoreId = s.StoreId
-        JOIN Cities c ON s.CityId = c.CityId
-        JOIN Products p ON sa.ProductId = p.ProductId
-        WHERE c.CityName = ? AND s.StoreId = ? AND p.ProductName = ? AND p.Size = ? AND sa.SaleDate = ?;
-    """, (city, store_id, product_name, size, sale_date))
-    sale = cur.fetchone()
-
-    cur.execute("""
-        SELECT p.ProductName, p.Size, SUM(il.Quantity) AS RemainingStock
-        FROM InvoiceLines il
-        JOIN Products p ON il.ProductId = p.ProductId
-        JOIN Invoices i ON il.InvoiceId = i.InvoiceId
-        WHERE i.StoreId = ? AND p.ProductName = ?
-        GROUP BY p.ProductName, p.Size;
-    """, (store_id, product_name))
-    inv = cur.fetchone()
-    conn.close()
+        new_qty, new_total = quantity, total_amount
+        cur.execute(sql.SALE_INSERT, (store_id, product_id, sale_date, quantity, sale_price, total_amount))
+        revenue = total_amount
+    adjust_sales_daily(cur, sale_date, store_id, product_id, quantity, revenue)
+
+    # Deduct Inventory (FIFO over this store's open lots)
+    lots = deplete_fifo(cur, store_id, product_id, quantity)
+    taken = sum(lot["QuantityTaken"] for lot in lots)
+    adjust_stock(cur, store_id, product_id, -taken)
+    log_change(cur, "sale", store_id, product_id, sale_date, stock=-taken, revenue=revenue,
+               detail={"Quantity": quantity, "SalePrice": sale_price, "CostOfGoods": cost_of_goods(lots)})
 
+    tx.after_commit(notify_write, "sale", [product_id])
+
+    # Prepare Response (from the values just written; no read-back joins)
     return {
-        "sale_record": dict(sale) if sale else None,
-        "inventory_after_sale": dict(inv) if inv else None
+        "sale_record": {
+            "CityName": city, "StoreId": store_id, "ProductName": product_name, "Size": size,
+            "SaleDate": sale_date, "Quantity": new_qty, "SalePrice": _round2(sale_price),
+            "TotalAmount": _round2(new_total),
+        },
+        "inventory_after_sale": {"ProductName": product_name, "Size": size, "RemainingStock": available - taken},
+        "lots_consumed": lots,
+        "cost_of_goods": cost_of_goods(lots)
     }
 
 
 # ---------- 4️⃣ Read Product Across All Locations ----------
+class StockLocation:
+    """One store's stock of one size of a product (a read-only record)."""
+    __slots__ = ("Store", "City", "Product", "Size", "Quantity")
+
+    def __init__(self, store, city, product, size, quantity):
+        self.Store = store
+        self.City = city
+        self.Product = product
+        self.Size = size
+        self.Quantity = quantity
+
+    def as_dict(self):
+        return {"Store": self.Store, "City": self.City, "Product": self.Product,
+                "Size": self.Size, "Quantity": self.Quantity}
+
+
+def product_locations(product_name):
+    """
+    Fast path of read_product_across_locations(): a tuple of StockLocation
+    records, shared with result_cache() (treat as read-only). Templates can
+    use the attributes directly; JSON callers convert with as_dict().
+    """
+    cache = result_cache()
+    records = cache.get(product_name)
+    if records is not None:
+        return records
+
+    conn = get_connection(readonly=True)
+    cur = conn.cursor(tuples=True)
+    # Counters are read before the queries they cover: a write racing the
+    # lookup moves one of them and the cached result is never served
+    stamp = cache.stamp(product_name)
+    cur.execute(sql.PRODUCT_IDS_BY_NAME, (product_name,))
+    stamp += cache.stamp(product_ids=[r[0] for r in cur.fetchall()])
+    cur.execute(sql.PRODUCT_LOCATIONS, (product_name,))
+    records = tuple(StockLocation(*row) for row in cur.fetchall())
+    conn.close()
+
+    cache.put(product_name, stamp, records)
+    return records
+
+
 def read_product_across_locations(product_name):
     """
     Returns all stores & cities where a product exists (inventory).
+    Served from result_cache() until a write touches one of the product's sizes.
     """
+    return [r.as_dict() for r in product_locations(product_name)]
+
+
+def search_products(text, size=None, limit=10, fuzzy=True):
+    """
+    Ranked product search (prefix, substring, then typo-tolerant matches),
+    optionally limited to one size. See product_search.search().
+    """
+    conn = get_connection(readonly=True)
+    try:
+        return search(conn, text, size, limit, fuzzy)
+    finally:
+        conn.close()
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT s.StoreId AS Store, c.CityName AS City,
-               p.ProductName AS Product, p.Size AS Size,
-               SUM(il.Quantity) AS Quantity
-        FROM InvoiceLines il
-        JOIN Invoices i ON il.InvoiceId = i.InvoiceId
-        JOIN Stores s ON i.StoreId = s.StoreId
-        JOIN Cities c ON s.CityId = c.CityId
-        JOIN Products p ON il.ProductId = p.ProductId
-        WHERE p.ProductName = ?
-        GROUP BY s.StoreId, c.CityName, p.ProductName, p.Size
-        ORDER BY c.CityName, s.StoreId;
-    """, (product_name,))
-    rows = cur.fetchall()
-    conn.close()
 
-    return [dict(r) for r in rows] if rows else []
+def autocomplete_products(text, size=None, limit=10):
+    """Product name suggestions while typing. See product_search.autocomplete()."""
+    conn = get_connection(readonly=True)
+    try:
+        return autocomplete(conn, text, size, limit)
+    finally:
+        conn.close()
     
 # ---------- 5️⃣ Delete Purchase Line (by city, store, vendor, product, size, invoice_date) ----------
-def delete_purchase_line(city, store_id, vendor_name, product_name, size, invoice_date):
+@queued_mutation
+def delete_purchase_line(tx, city, store_id, vendor_name, product_name, size, invoice_date):
     """
     Deletes a specific purchase line (an inventory record).
     If the invoice has no lines left afterward, the invoice itself is deleted.
     """
-    conn = get_connection()
-    cur = conn.cursor()
+    cur = tx.cursor(tuples=True)
+    cache = ref_cache()
 
     # City
-    cur.execute("SELECT CityId FROM Cities WHERE CityName = ?;", (city,))
-    row = cur.fetchone()
-    if not row:
-        conn.close()
+    city_id = cache.city_id(cur, city)
+    if city_id is None:
         return {"error": f"City '{city}' not found."}
-    city_id = row[0]
 
     # Store belongs to city
-    cur.execute("SELECT CityId FROM Stores WHERE StoreId = ?;", (store_id,))
-    row = cur.fetchone()
-    if not row or row[0] != city_id:
-        conn.close()
+    store_city = cache.store_city_id(cur, store_id)
+    if store_city is None or store_city != city_id:
         return {"error": f"Store {store_id} is not in city '{city}'."}
 
     # Vendor
-    cur.execute("SELECT VendorNumber FROM Vendors WHERE VendorName = ?;", (vendor_name,))
-    row = cur.fetchone()
-    if not row:
-        conn.close()
+    vendor_number = cache.vendor_number(cur, vendor_name)
+    if vendor_number is None:
         return {"error": f"Vendor '{vendor_name}' not found."}
-    vendor_number = row[0]
 
     # Product
-    cur.execute("SELECT ProductId FROM Products WHERE ProductName = ? AND Size = ?;", (product_name, size))
-    row = cur.fetchone()
-    if not row:
-        conn.close()
+    product = cache.product(cur, product_name, size)
+    if not product:
         return {"error": f"Product '{product_name}' ({size}) not found."}
-    product_id = row[0]
+    product_id = product[0]
 
     # Invoice
-    cur.execute("""
-        SELECT InvoiceId FROM Invoices
-        WHERE StoreId = ? AND VendorNumber = ? AND InvoiceDate = ?;
-    """, (store_id, vendor_number, invoice_date))
+    cur.execute(sql.INVOICE_BY_KEY, (store_id, vendor_number, invoice_date))
     row = cur.fetchone()
     if not row:
-        conn.close()
         return {"error": "Invoice not found for the given store, vendor, and date."}
     invoice_id = row[0]
 
     # Purchase line
-    cur.execute("""
-        SELECT InvoiceLineId, Quantity, PurchasePrice, LineTotal
-        FROM InvoiceLines
-        WHERE InvoiceId = ? AND ProductId = ?;
-    """, (invoice_id, product_id))
+    cur.execute(sql.INVOICE_LINE_BY_INVOICE_PRODUCT, (invoice_id, product_id))
     line = cur.fetchone()
     if not line:
-        conn.close()
         return {"error": "No matching invoice line found for that product on the invoice."}
 
     line_id, qty, price, total = line
 
     # Delete line
-    cur.execute("DELETE FROM InvoiceLines WHERE InvoiceLineId = ?;", (line_id,))
+    cur.execute(sql.INVOICE_LINE_DELETE, (line_id,))
+    adjust_stock(cur, store_id, product_id, -qty, line_delta=-1)
 
     # If invoice now empty, delete it
-    cur.execute("SELECT COUNT(*) FROM InvoiceLines WHERE InvoiceId = ?;", (invoice_id,))
+    cur.execute(sql.INVOICE_LINE_COUNT, (invoice_id,))
     remaining_lines = cur.fetchone()[0]
     invoice_deleted = False
     if remaining_lines == 0:
-        cur.execute("DELETE FROM Invoices WHERE InvoiceId = ?;", (invoice_id,))
+        cur.execute(sql.INVOICE_DELETE, (invoice_id,))
         invoice_deleted = True
+    log_change(cur, "delete_purchase_line", store_id, product_id, invoice_date, stock=-qty, lines=-1,
+               detail={"InvoiceId": invoice_id, "InvoiceDeleted": invoice_deleted})
 
-    conn.commit()
-    conn.close()
+    tx.after_commit(notify_write, "delete_purchase_line", [product_id])
 
     return {
         "deleted_line": {
@@ -449,33 +535,445 @@ def delete_purchase_line(city, store_id, vendor_name, product_name, size, invoic
 
 
 # ---------- 6️⃣ Delete Product (only if not referenced by sales or invoices) ----------
-def delete_product_safe(product_id):
+@queued_mutation
+def delete_product_safe(tx, product_id):
     """
     Deletes a product ONLY if it has no references in InvoiceLines or Sales.
     """
-    conn = get_connection()
-    cur = conn.cursor()
+    cur = tx.cursor(tuples=True)
 
-    cur.execute("SELECT ProductId, ProductName, Size FROM Products WHERE ProductId = ?;", (product_id,))
+    cur.execute(sql.PRODUCT_BY_ID, (product_id,))
     prod = cur.fetchone()
     if not prod:
-        conn.close()
         return {"error": f"ProductId {product_id} not found."}
     _, product_name, size = prod
 
-    cur.execute("SELECT COUNT(*) FROM InvoiceLines WHERE ProductId = ?;", (product_id,))
+    cur.execute(sql.INVOICE_LINE_REFS, (product_id,))
     inv_refs = cur.fetchone()[0]
 
-    cur.execute("SELECT COUNT(*) FROM Sales WHERE ProductId = ?;", (product_id,))
+    cur.execute(sql.SALE_REFS, (product_id,))
     sale_refs = cur.fetchone()[0]
 
     if inv_refs > 0 or sale_refs > 0:
-        conn.close()
         return {"error": f"Cannot delete ProductId {product_id}: referenced by invoices={inv_refs}, sales={sale_refs}."}
 
-    cur.execute("DELETE FROM Products WHERE ProductId = ?;", (product_id,))
-    conn.commit()
-    conn.close()
+    cur.execute(sql.PRODUCT_DELETE, (product_id,))
+    log_change(cur, "delete_product", product_id=product_id, detail={"ProductName": product_name, "Size": size})
+    tx.after_commit(ref_cache().invalidate_product, product_name, size)
+    tx.after_commit(notify_write, "delete_product", [product_id])
 
     return {"deleted_product": {"ProductId": product_id, "ProductName": product_name, "Size": size}}
 
+
+# ---------- Bulk helpers ----------
+def _resolve_store_products(cur, staging_table):
+    """
+    One set-based pass over a temp staging table (RowNo, City, StoreId,
+    ProductName, Size, ...). Yields (RowNo, CityId, store_found, StoreCityId, ProductId).
+    """
+    cur.execute(f"""
+        SELECT r.RowNo, c.CityId, s.StoreId IS NOT NULL, s.CityId,
+               (SELECT MIN(p.ProductId) FROM Products p
+                WHERE p.ProductName = r.ProductName AND p.Size = r.Size)
+        FROM temp.{staging_table} r
+        LEFT JOIN Cities c ON c.CityName = r.City
+        LEFT JOIN Stores s ON s.StoreId = r.StoreId;
+    """)
+    return cur.fetchall()
+
+
+# ---------- 7️⃣ Bulk Purchase Ingestion ----------
+BULK_PURCHASE_FIELDS = ("city", "store_id", "vendor_name", "product_name", "size",
+                        "invoice_date", "quantity")
+
+
+def _parse_purchase_row(row):
+    missing = [f for f in BULK_PURCHASE_FIELDS if row.get(f) in (None, "")]
+    if missing:
+        raise ValueError(f"Missing field(s): {', '.join(missing)}.")
+    price = row.get("purchase_price")
+    quantity = int(row["quantity"])
+    if quantity <= 0:
+        raise ValueError("quantity must be positive.")
+    return (
+        str(row["city"]).strip(),
+        int(row["store_id"]),
+        str(row["vendor_name"]).strip(),
+        str(row["product_name"]).strip(),
+        str(row["size"]).strip(),
+        str(row["invoice_date"]).strip(),
+        quantity,
+        float(price) if price not in (None, "") else None,
+    )
+
+
+@queued_mutation
+def bulk_add_purchases(tx, rows):
+    """
+    Records many purchase lines (same fields as update_existing_purchase, plus an
+    optional purchase_price) in ONE transaction.
+    Names are resolved to ids with a handful of set-based queries over a temp
+    table; Vendors, Invoices and InvoiceLines are written with executemany.
+    Lines for the same invoice and product are merged, as update_existing_purchase does.
+    Rows that fail validation are reported and skipped; the rest are committed.
+    Returns per-row status plus rows-per-second throughput.
+    """
+    started = time.perf_counter()
+    statuses = []
+    parsed = []
+    for row_no, row in enumerate(rows):
+        try:
+            parsed.append((row_no,) + _parse_purchase_row(row))
+            statuses.append(None)
+        except (TypeError, ValueError, AttributeError) as e:
+            statuses.append({"row": row_no, "status": "error", "error": str(e)})
+
+    cur = tx.cursor()
+    try:
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS BulkPurchaseRows (
+                RowNo INTEGER PRIMARY KEY, City TEXT, StoreId INTEGER, VendorName TEXT,
+                ProductName TEXT, Size TEXT, InvoiceDate TEXT, Quantity INTEGER,
+                PurchasePrice REAL
+            );
+        """)
+        cur.execute("DELETE FROM temp.BulkPurchaseRows;")
+        cur.executemany("INSERT INTO temp.BulkPurchaseRows VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);", parsed)
+
+        # Resolve City / Store / Product in one pass
+        product_of = {}
+        parsed_by_row = {r[0]: r for r in parsed}
+        for row_no, city_id, store_found, store_city, product_id in _resolve_store_products(cur, "BulkPurchaseRows"):
+            city, store_id, _, product_name, size = parsed_by_row[row_no][1:6]
+            if city_id is None:
+                error = f"City '{city}' does not exist."
+            elif not store_found or store_city != city_id:
+                error = f"Store {store_id} not found in city '{city}'."
+            elif product_id is None:
+                error = f"Product '{product_name}' ({size}) not found."
+            else:
+                product_of[row_no] = product_id
+                continue
+            statuses[row_no] = {"row": row_no, "status": "error", "error": error}
+        good = [r for r in parsed if r[0] in product_of]
+
+        # Vendors: create any that are missing, then resolve all by name
+        vendor_names = sorted({r[3] for r in good})
+        cur.execute("""
+            SELECT VendorName, MIN(VendorNumber) FROM Vendors
+            WHERE VendorName IN (SELECT VendorName FROM temp.BulkPurchaseRows)
+            GROUP BY VendorName;
+        """)
+        vendor_of = dict(cur.fetchall())
+        new_vendors = [(name,) for name in vendor_names if name not in vendor_of]
+        if new_vendors:
+            cur.executemany(sql.VENDOR_INSERT, new_vendors)
+            cur.execute("""
+                SELECT VendorName, MIN(VendorNumber) FROM Vendors
+                WHERE VendorName IN (SELECT VendorName FROM temp.BulkPurchaseRows)
+                GROUP BY VendorName;
+            """)
+            vendor_of = dict(cur.fetchall())
+
+        # Latest purchase price per product, for rows that did not send one
+        cur.execute("""
+            SELECT il.ProductId, CAST(il.PurchasePrice AS REAL)
+            FROM InvoiceLines il
+            WHERE il.InvoiceLineId IN (
+                SELECT MAX(InvoiceLineId) FROM InvoiceLines
+                WHERE ProductId IN (
+                    SELECT p.ProductId FROM Products p
+                    JOIN temp.BulkPurchaseRows r
+                      ON p.ProductName = r.ProductName AND p.Size = r.Size
+                    WHERE r.PurchasePrice IS NULL
+                )
+                GROUP BY ProductId
+            );
+        """)
+        last_price = dict(cur.fetchall())
+
+        # Invoices: create missing headers, then resolve ids
+        lines = {}
+        for row_no, city, store_id, vendor_name, product_name, size, invoice_date, qty, price in good:
+            product_id = product_of[row_no]
+            if price is None:
+                price = last_price.get(product_id)
+                if price is None:
+                    statuses[row_no] = {"row": row_no, "status": "error",
+                                        "error": f"No previous purchase price for '{product_name}'."}
+                    continue
+            key = (store_id, vendor_of[vendor_name], invoice_date, product_id)
+            agg = lines.setdefault(key, {"quantity": 0, "price": price, "rows": []})
+            agg["quantity"] += qty
+            agg["price"] = price
+            agg["rows"].append(row_no)
+
+        invoice_keys = sorted({k[:3] for k in lines})
+        restore_archived(cur, "Invoices", invoice_keys)
+        cur.executemany("INSERT OR IGNORE INTO Invoices (StoreId, VendorNumber, InvoiceDate) VALUES (?, ?, ?);",
+                        invoice_keys)
+        cur.execute("CREATE TEMP TABLE IF NOT EXISTS BulkInvoiceKeys (StoreId INTEGER, VendorNumber INTEGER, InvoiceDate TEXT);")
+        cur.execute("DELETE FROM temp.BulkInvoiceKeys;")
+        cur.executemany("INSERT INTO temp.BulkInvoiceKeys VALUES (?, ?, ?);", invoice_keys)
+        cur.execute("""
+            SELECT i.StoreId, i.VendorNumber, i.InvoiceDate, i.InvoiceId
+            FROM temp.BulkInvoiceKeys k
+            JOIN Invoices i
+              ON i.StoreId = k.StoreId AND i.VendorNumber = k.VendorNumber AND i.InvoiceDate = k.InvoiceDate;
+        """)
+        invoice_of = {(store, vendor, date): invoice_id for store, vendor, date, invoice_id in cur.fetchall()}
+
+        # Existing lines on those invoices get merged, the rest inserted
+        cur.execute("""
+            SELECT il.InvoiceId, il.ProductId, il.InvoiceLineId, il.Quantity
+            FROM InvoiceLines il
+            WHERE il.InvoiceId IN (
+                SELECT i.InvoiceId FROM temp.BulkInvoiceKeys k
+                JOIN Invoices i
+                  ON i.StoreId = k.StoreId AND i.VendorNumber = k.VendorNumber AND i.InvoiceDate = k.InvoiceDate
+            );
+        """)
+        existing = {(invoice_id, product_id): (line_id, qty) for invoice_id, product_id, line_id, qty in cur.fetchall()}
+
+        updates, inserts, stock_deltas, changes = [], [], [], []
+        for (store_id, vendor_number, invoice_date, product_id), agg in lines.items():
+            invoice_id = invoice_of[(store_id, vendor_number, invoice_date)]
+            price = agg["price"]
+            line = existing.get((invoice_id, product_id))
+            if line:
+                line_id, old_qty = line
+                new_qty = old_qty + agg["quantity"]
+                updates.append((new_qty, price, new_qty * price, line_id))
+                stock_deltas.append((store_id, product_id, agg["quantity"], 0))
+                status = "updated"
+            else:
+                inserts.append((invoice_id, product_id, price, agg["quantity"], price * agg["quantity"]))
+                stock_deltas.append((store_id, product_id, agg["quantity"], 1))
+                status = "inserted"
+            changes.append(("purchase", store_id, product_id, invoice_date, agg["quantity"], stock_deltas[-1][3], 0,
+                            {"InvoiceId": invoice_id, "Quantity": agg["quantity"], "PurchasePrice": price}))
+            for row_no in agg["rows"]:
+                statuses[row_no] = {"row": row_no, "status": status, "InvoiceId": invoice_id,
+                                    "ProductId": product_id, "PurchasePrice": round(price, 2)}
+
+        cur.executemany(sql.INVOICE_LINE_UPDATE, updates)
+        cur.executemany(sql.INVOICE_LINE_INSERT, inserts)
+        adjust_stock_many(cur, stock_deltas)
+        log_changes(cur, changes)
+
+        cur.execute("DELETE FROM temp.BulkPurchaseRows;")
+        cur.execute("DELETE FROM temp.BulkInvoiceKeys;")
+    except Exception as e:
+        # The write queue rolls this batch back to its savepoint
+        return {"error": f"Bulk purchase load failed and was rolled back: {e}"}
+    cache = ref_cache()
+    for (name,) in new_vendors:
+        tx.after_commit(cache.invalidate_vendor, name)
+    tx.after_commit(notify_write, "purchase", [product_id for _, product_id, _, _ in stock_deltas])
+
+    elapsed = time.perf_counter() - started
+    accepted = sum(1 for st in statuses if st["status"] != "error")
+    return {
+        "rows": statuses,
+        "accepted": accepted,
+        "rejected": len(statuses) - accepted,
+        "invoice_lines_inserted": len(inserts),
+        "invoice_lines_updated": len(updates),
+        "elapsed_seconds": round(elapsed, 4),
+        "rows_per_second": round(len(statuses) / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+# ---------- 8️⃣ Batched Sales (end-of-day point-of-sale feeds) ----------
+BULK_SALE_FIELDS = ("city", "store_id", "product_name", "size", "sale_date", "quantity")
+
+
+def _parse_sale_row(row):
+    missing = [f for f in BULK_SALE_FIELDS if row.get(f) in (None, "")]
+    if missing:
+        raise ValueError(f"Missing field(s): {', '.join(missing)}.")
+    price = row.get("sale_price")
+    quantity = int(row["quantity"])
+    if quantity <= 0:
+        raise ValueError("quantity must be positive.")
+    return (
+        str(row["city"]).strip(),
+        int(row["store_id"]),
+        str(row["product_name"]).strip(),
+        str(row["size"]).strip(),
+        str(row["sale_date"]).strip(),
+        quantity,
+        float(price) if price not in (None, "") else None,
+    )
+
+
+@queued_mutation
+def bulk_record_sales(tx, sales):
+    """
+    Records a batch of sales (same fields as update_sales) in ONE transaction.
+    Stores and products are validated in bulk, quantities are aggregated per
+    (store, product, sale_date) before upserting Sales, and FIFO depletion runs
+    once per (store, product) for the whole batch.
+    Lines that fail validation or exceed the stock left (in batch order) are
+    rejected individually; the rest of the batch is still committed.
+    """
+    started = time.perf_counter()
+    statuses = []
+    parsed = []
+    for row_no, row in enumerate(sales):
+        try:
+            parsed.append((row_no,) + _parse_sale_row(row))
+            statuses.append(None)
+        except (TypeError, ValueError, AttributeError) as e:
+            statuses.append({"row": row_no, "status": "error", "error": str(e)})
+
+    cur = tx.cursor()
+    try:
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS BulkSaleRows (
+                RowNo INTEGER PRIMARY KEY, City TEXT, StoreId INTEGER, ProductName TEXT,
+                Size TEXT, SaleDate TEXT, Quantity INTEGER, SalePrice REAL
+            );
+        """)
+        cur.execute("DELETE FROM temp.BulkSaleRows;")
+        cur.executemany("INSERT INTO temp.BulkSaleRows VALUES (?, ?, ?, ?, ?, ?, ?, ?);", parsed)
+
+        # Validate City / Store / Product in one pass
+        product_of = {}
+        parsed_by_row = {r[0]: r for r in parsed}
+        for row_no, city_id, store_found, store_city, product_id in _resolve_store_products(cur, "BulkSaleRows"):
+            city, store_id, product_name, size = parsed_by_row[row_no][1:5]
+            if city_id is None:
+                error = f"City '{city}' not found."
+            elif not store_found or store_city != city_id:
+                error = f"Store {store_id} invalid for city '{city}'."
+            elif product_id is None:
+                error = f"Product '{product_name}' ({size}) not found."
+            else:
+                product_of[row_no] = product_id
+                continue
+            statuses[row_no] = {"row": row_no, "status": "error", "error": error}
+        good = [r for r in parsed if r[0] in product_of]
+
+        # Latest sale price per product, for lines that did not send one
+        cur.execute("""
+            SELECT ProductId, CAST(SalePrice AS REAL) FROM Sales
+            WHERE SaleId IN (
+                SELECT MAX(SaleId) FROM Sales
+                WHERE ProductId IN (
+                    SELECT p.ProductId FROM Products p
+                    JOIN temp.BulkSaleRows r ON p.ProductName = r.ProductName AND p.Size = r.Size
+                    WHERE r.SalePrice IS NULL
+                )
+                GROUP BY ProductId
+            );
+        """)
+        last_price = dict(cur.fetchall())
+
+        # Stock on hand for every (store, product) in the batch
+        cur.execute("""
+            SELECT sl.StoreId, sl.ProductId, sl.Quantity
+            FROM StockLevels sl
+            JOIN (SELECT DISTINCT r.StoreId, p.ProductId
+                  FROM temp.BulkSaleRows r
+                  JOIN Products p ON p.ProductName = r.ProductName AND p.Size = r.Size) b
+              ON sl.StoreId = b.StoreId AND sl.ProductId = b.ProductId;
+        """)
+        available = {(store_id, product_id): qty for store_id, product_id, qty in cur.fetchall()}
+
+        # Accept lines in batch order while stock lasts; aggregate per sale day
+        daily = {}
+        depletion = {}
+        for row_no, city, store_id, product_name, size, sale_date, qty, price in good:
+            product_id = product_of[row_no]
+            if price is None:
+                price = last_price.get(product_id)
+                if price is None:
+                    statuses[row_no] = {"row": row_no, "status": "error",
+                                        "error": f"No previous sale price found for '{product_name}'."}
+                    continue
+            on_hand = available.get((store_id, product_id), 0)
+            if on_hand < qty:
+                statuses[row_no] = {"row": row_no, "status": "error",
+                                    "error": f"Not enough stock. Available: {on_hand}, Requested: {qty}"}
+                continue
+            available[(store_id, product_id)] = on_hand - qty
+            depletion[(store_id, product_id)] = depletion.get((store_id, product_id), 0) + qty
+            agg = daily.setdefault((store_id, product_id, sale_date), {"quantity": 0, "price": price, "rows": []})
+            agg["quantity"] += qty
+            agg["price"] = price
+            agg["rows"].append(row_no)
+
+        # Upsert Sales: one row per (store, product, day), archived rows included
+        restore_archived(cur, "Sales", list(daily))
+        cur.execute("CREATE TEMP TABLE IF NOT EXISTS BulkSaleKeys (StoreId INTEGER, ProductId INTEGER, SaleDate TEXT);")
+        cur.execute("DELETE FROM temp.BulkSaleKeys;")
+        cur.executemany("INSERT INTO temp.BulkSaleKeys VALUES (?, ?, ?);", list(daily))
+        cur.execute("""
+            SELECT sa.StoreId, sa.ProductId, sa.SaleDate, sa.SaleId, sa.Quantity, sa.TotalAmount
+            FROM temp.BulkSaleKeys k
+            JOIN Sales sa
+              ON sa.StoreId = k.StoreId AND sa.ProductId = k.ProductId AND sa.SaleDate = k.SaleDate;
+        """)
+        existing = {}
+        for store_id, product_id, sale_date, sale_id, qty, total in cur.fetchall():
+            existing.setdefault((store_id, product_id, sale_date), (sale_id, qty, total))
+
+        updates, inserts, rollup = [], [], []
+        for key, agg in daily.items():
+            price = agg["price"]
+            store_id, product_id, sale_date = key
+            if key in existing:
+                sale_id, old_qty, old_total = existing[key]
+                new_qty = old_qty + agg["quantity"]
+                updates.append((new_qty, price, new_qty * price, sale_id))
+                rollup.append((sale_date, store_id, product_id, agg["quantity"], new_qty * price - float(old_total)))
+            else:
+                inserts.append(key + (agg["quantity"], price, agg["quantity"] * price))
+                rollup.append((sale_date, store_id, product_id, agg["quantity"], agg["quantity"] * price))
+            for row_no in agg["rows"]:
+                statuses[row_no] = {"row": row_no, "status": "recorded", "StoreId": key[0],
+                                    "ProductId": key[1], "SaleDate": key[2], "SalePrice": round(price, 2)}
+        cur.executemany(sql.SALE_UPDATE, updates)
+        cur.executemany(sql.SALE_INSERT, inserts)
+        adjust_sales_daily_many(cur, rollup)
+
+        # Deduct Inventory (FIFO), once per store/product for the whole batch
+        total_cogs = 0.0
+        stock_deltas = []
+        taken = {}
+        for (store_id, product_id), qty in depletion.items():
+            lots = deplete_fifo(cur, store_id, product_id, qty)
+            total_cogs += cost_of_goods(lots)
+            taken[(store_id, product_id)] = sum(lot["QuantityTaken"] for lot in lots)
+            stock_deltas.append((store_id, product_id, -taken[(store_id, product_id)], 0))
+        adjust_stock_many(cur, stock_deltas)
+
+        # One change per (store, product, day); the units taken are spread over the days in order
+        changes = []
+        for (sale_date, store_id, product_id, _, revenue), agg in zip(rollup, daily.values()):
+            units = min(agg["quantity"], taken[(store_id, product_id)])
+            taken[(store_id, product_id)] -= units
+            changes.append(("sale", store_id, product_id, sale_date, -units, 0, revenue,
+                            {"Quantity": agg["quantity"], "SalePrice": agg["price"]}))
+        log_changes(cur, changes)
+
+        cur.execute("DELETE FROM temp.BulkSaleRows;")
+        cur.execute("DELETE FROM temp.BulkSaleKeys;")
+    except Exception as e:
+        # The write queue rolls this batch back to its savepoint
+        return {"error": f"Bulk sales load failed and was rolled back: {e}"}
+    tx.after_commit(notify_write, "sale", [product_id for _, product_id in depletion])
+
+    elapsed = time.perf_counter() - started
+    accepted = sum(1 for st in statuses if st["status"] != "error")
+    return {
+        "rows": statuses,
+        "accepted": accepted,
+        "rejected": len(statuses) - accepted,
+        "sales_inserted": len(inserts),
+        "sales_updated": len(updates),
+        "cost_of_goods": round(total_cogs, 2),
+        "elapsed_seconds": round(elapsed, 4),
+        "rows_per_second": round(len(statuses) / elapsed, 1) if elapsed > 0 else None,
+    }
@@ -0,0 +1,125 @@
+import sqlite3
+import sys
+
+from archive import ensure_history_views
+from change_log import ensure_change_log
+from fifo import ensure_fifo_index
+from product_search import ensure_product_search
+from sales_rollup import ensure_sales_daily
+from stock_levels import ensure_stock_levels
+
+# Schema version lives in SQLite's own PRAGMA user_version.
+# Every step is idempotent (IF NOT EXISTS), so re-running after a crash is safe.
+
+SALES_DDL = """
+CREATE TABLE IF NOT EXISTS Sales (
+    SaleId       INTEGER PRIMARY KEY AUTOINCREMENT,
+    StoreId      INTEGER NOT NULL,
+    ProductId    INTEGER NOT NULL,
+    SaleDate     DATE NOT NULL,
+    Quantity     INTEGER NOT NULL,
+    SalePrice    NUMERIC NOT NULL,
+    TotalAmount  NUMERIC NOT NULL,
+    FOREIGN KEY (StoreId)   REFERENCES Stores(StoreId),
+    FOREIGN KEY (ProductId) REFERENCES Products(ProductId)
+);
+"""
+
+# Indexes for the lookups in inventory_crud.py and dashboard.py
+HOT_QUERY_INDEXES_DDL = """
+-- Baseline indexes from app.sql (databases built elsewhere may lack them)
+CREATE INDEX IF NOT EXISTS idx_invoices_store_vendor_date
+ON Invoices (StoreId, VendorNumber, InvoiceDate);
+
+CREATE INDEX IF NOT EXISTS idx_invoicelines_invoice
+ON InvoiceLines (InvoiceId);
+
+CREATE INDEX IF NOT EXISTS idx_invoicelines_product
+ON InvoiceLines (ProductId);
+
+-- Product validation by (ProductName, Size); Brand included so it is covering
+CREATE INDEX IF NOT EXISTS idx_products_name_size
+ON Products (ProductName, Size, Brand);
+
+-- Vendor lookup by name
+CREATE INDEX IF NOT EXISTS idx_vendors_name
+ON Vendors (VendorName);
+
+-- Stores of a city (city fan-out, sharding, reports)
+CREATE INDEX IF NOT EXISTS idx_stores_city
+ON Stores (CityId);
+
+-- Invoice line of a product on an invoice (update / delete purchase)
+CREATE INDEX IF NOT EXISTS idx_invoicelines_invoice_product
+ON InvoiceLines (InvoiceId, ProductId);
+
+-- Sale upsert key
+CREATE INDEX IF NOT EXISTS idx_sales_store_product_date
+ON Sales (StoreId, ProductId, SaleDate);
+
+-- Latest sale per product (rowid order within ProductId = ORDER BY SaleId)
+CREATE INDEX IF NOT EXISTS idx_sales_product
+ON Sales (ProductId);
+"""
+
+
+def _create_sales_and_indexes(conn):
+    conn.executescript(SALES_DDL + HOT_QUERY_INDEXES_DDL)
+
+
+def _index_inventory_id(conn):
+    # Delta loads match raw rows to existing lines by (InventoryId, InvoiceId)
+    conn.executescript("""
+        CREATE INDEX IF NOT EXISTS idx_invoicelines_inventory
+        ON InvoiceLines (InventoryId, InvoiceId);
+    """)
+
+
+# (version, description, step)
+MIGRATIONS = [
+    (1, "StockLevels summary table", ensure_stock_levels),
+    (2, "Partial index over open FIFO lots", ensure_fifo_index),
+    (3, "Sales table and indexes for hot query shapes", _create_sales_and_indexes),
+    (4, "InvoiceLines (InventoryId, InvoiceId) index for delta loads", _index_inventory_id),
+    (5, "Archival indexes and hot + archive history views", ensure_history_views),
+    (6, "SalesDaily revenue rollup", ensure_sales_daily),
+    (7, "ProductSearch trigram index over Products", ensure_product_search),
+    (8, "ChangeLog feed and consumer checkpoints", ensure_change_log),
+]
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def migrate(conn, target=None):
+    """
+    Applies every migration newer than the database's user_version.
+    Returns the list of (version, description) applied.
+    """
+    target = target if target is not None else MIGRATIONS[-1][0]
+    version = current_version(conn)
+    applied = []
+    for number, description, step in MIGRATIONS:
+        if version < number <= target:
+            step(conn)
+            if conn.in_transaction:
+                conn.commit()
+            conn.execute(f"PRAGMA user_version = {number};")
+            applied.append((number, description))
+    if applied:
+        conn.execute("PRAGMA optimize;")
+        conn.commit()
+    return applied
+
+
+# ---------- CLI ----------
+if __name__ == "__main__":
+    # python migrations.py [path/to/inventory.db]
+    db = sys.argv[1] if len(sys.argv) > 1 else "inventory.db"
+    conn = sqlite3.connect(db)
+    before = current_version(conn)
+    for number, description in migrate(conn):
+        print(f"Applied {number}: {description}")
+    print(f"Schema version {before} -> {current_version(conn)}")
+    conn.close()
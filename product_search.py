@@ -0,0 +1,258 @@
+import difflib
+import re
+import sqlite3
+import sys
+import threading
+
+# ProductSearch is an FTS5 index over Products (ProductName, Size) with the
+# trigram tokenizer, so any 3+ character substring of a name is a lookup.
+# It is an external-content table: the text lives only in Products, and the
+# triggers below keep the index in step with every insert, update and delete
+# (inventory_crud, etl and synthetic_data all write Products directly).
+PRODUCT_SEARCH_DDL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS ProductSearch USING fts5(
+    ProductName, Size,
+    content = 'Products', content_rowid = 'ProductId',
+    tokenize = 'trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_products_search_insert AFTER INSERT ON Products BEGIN
+    INSERT INTO ProductSearch (rowid, ProductName, Size) VALUES (new.ProductId, new.ProductName, new.Size);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_products_search_delete AFTER DELETE ON Products BEGIN
+    INSERT INTO ProductSearch (ProductSearch, rowid, ProductName, Size)
+    VALUES ('delete', old.ProductId, old.ProductName, old.Size);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_products_search_update AFTER UPDATE OF ProductName, Size ON Products BEGIN
+    INSERT INTO ProductSearch (ProductSearch, rowid, ProductName, Size)
+    VALUES ('delete', old.ProductId, old.ProductName, old.Size);
+    INSERT INTO ProductSearch (rowid, ProductName, Size) VALUES (new.ProductId, new.ProductName, new.Size);
+END;
+
+-- Case-insensitive name prefix (LIKE 'abc%') as an index range, for autocomplete
+CREATE INDEX IF NOT EXISTS idx_products_name_nocase
+ON Products (ProductName COLLATE NOCASE, Size);
+"""
+
+DEFAULT_LIMIT = 10
+# Unranked index hits examined per requested result when search() ranks them.
+# FTS5's own bm25 rank has to visit every match (tens of ms for a common word
+# on a large catalog), so ranking is done over this bounded window instead.
+SEARCH_CANDIDATES = 20
+# A misspelled word is replaced by the closest catalog word (difflib ratio)
+# among those sharing a trigram with it, if at least this close
+FUZZY_MIN_SIMILARITY = 0.75
+
+_WORD = re.compile(r"[^\W_]+(?:\.\d+)?", re.UNICODE)
+_vocabularies = {}
+_vocabulary_lock = threading.Lock()
+
+
+# ---------- Schema ----------
+def ensure_product_search(conn):
+    """
+    Creates ProductSearch, its sync triggers and the NOCASE name index, and
+    indexes existing products the first time. Returns True if it was created.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ProductSearch';"
+    ).fetchone()
+    conn.executescript(PRODUCT_SEARCH_DDL)
+    if not exists:
+        rebuild_product_search(conn)
+    return not exists
+
+
+def rebuild_product_search(conn):
+    """Re-indexes every product from the Products table."""
+    conn.execute("INSERT INTO ProductSearch (ProductSearch) VALUES ('rebuild');")
+    conn.commit()
+
+
+# ---------- Query helpers ----------
+def _normalize(text):
+    return " ".join(text.split())
+
+
+def _like_prefix(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def trigrams(text):
+    """Lower-cased character trigrams of each word (words shorter than 3 count whole)."""
+    grams = set()
+    for word in _WORD.findall(text.lower()):
+        if len(word) < 3:
+            grams.add(word)
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def _rows(cur):
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, row)) for row in cur.fetchall()]
+
+
+def _prefix_matches(conn, text, size, limit):
+    # Range scan on idx_products_name_nocase; stops after `limit` rows
+    return _rows(conn.execute(f"""
+        SELECT ProductId, ProductName, Size, Brand
+        FROM Products
+        WHERE ProductName LIKE ? ESCAPE '\\' {"AND Size = ?" if size else ""}
+        ORDER BY ProductName COLLATE NOCASE, Size
+        LIMIT ?;
+    """, [_like_prefix(text)] + ([size] if size else []) + [limit]))
+
+
+def _substring_matches(conn, text, size, limit, candidates):
+    """
+    Names containing every word of text (3+ character words via the index,
+    shorter ones by LIKE). Up to `candidates` hits are read in rowid order and
+    the best `limit` returned: word-start matches first, then shorter names.
+    """
+    words = text.split()
+    indexed = [w for w in words if len(w) >= 3]
+    if not indexed:
+        return []
+    where = ["ProductSearch MATCH ?"]
+    params = [" AND ".join(f"ProductName : {_phrase(w)}" for w in indexed)]
+    for w in words:
+        if len(w) < 3:
+            where.append("p.ProductName LIKE ? ESCAPE '\\'")
+            params.append("%" + _like_prefix(w))
+    if size:
+        where.append("p.Size = ?")
+        params.append(size)
+    rows = _rows(conn.execute(f"""
+        SELECT p.ProductId, p.ProductName, p.Size, p.Brand
+        FROM ProductSearch ps
+        JOIN Products p ON p.ProductId = ps.rowid
+        WHERE {" AND ".join(where)}
+        LIMIT ?;
+    """, params + [max(limit, candidates)]))
+    word_start = re.compile(r"\b" + re.escape(text), re.IGNORECASE)
+    rows.sort(key=lambda r: (word_start.search(r["ProductName"]) is None, len(r["ProductName"]),
+                             r["ProductName"], r["Size"]))
+    return rows[:limit]
+
+
+# ---------- Fuzzy matching ----------
+def _vocabulary(conn):
+    """
+    Distinct lower-cased words of all product names with a trigram -> words
+    index, per database. Rebuilt when MAX(ProductId) moves, i.e. after new
+    products; words of deleted products linger until then, which only costs
+    an empty corrected search.
+    """
+    db_path = conn.execute("PRAGMA database_list;").fetchone()[2]
+    version = conn.execute("SELECT MAX(ProductId) FROM Products;").fetchone()[0]
+    vocab = _vocabularies.get(db_path)
+    if vocab is not None and vocab[0] == version:
+        return vocab[1]
+    with _vocabulary_lock:
+        vocab = _vocabularies.get(db_path)
+        if vocab is None or vocab[0] != version:
+            words = set()
+            for (name,) in conn.execute("SELECT DISTINCT ProductName FROM Products;"):
+                words.update(_WORD.findall(name.lower()))
+            index = {}
+            for word in words:
+                for gram in trigrams(word):
+                    index.setdefault(gram, []).append(word)
+            vocab = _vocabularies[db_path] = (version, (words, index))
+    return vocab[1]
+
+
+def _correct(conn, text):
+    """text with each unknown word replaced by the closest catalog word, or None."""
+    words, index = _vocabulary(conn)
+    corrected, changed = [], False
+    for word in text.lower().split():
+        if word in words or len(word) < 3:
+            corrected.append(word)
+            continue
+        candidates = {c for gram in trigrams(word) for c in index.get(gram, ())}
+        best = difflib.get_close_matches(word, candidates, n=1, cutoff=FUZZY_MIN_SIMILARITY)
+        if not best:
+            return None
+        corrected.append(best[0])
+        changed = True
+    return " ".join(corrected) if changed else None
+
+
+def _fuzzy_matches(conn, text, size, limit, candidates):
+    """Substring matches for text with misspelled words corrected against the catalog."""
+    corrected = _correct(conn, text)
+    if corrected is None:
+        return []
+    return [dict(r, Corrected=corrected) for r in _substring_matches(conn, corrected, size, limit, candidates)]
+
+
+def _merge(limit, *groups):
+    seen, out = set(), []
+    for match, rows in groups:
+        for row in rows:
+            if row["ProductId"] not in seen and len(out) < limit:
+                seen.add(row["ProductId"])
+                out.append(dict(row, Match=match))
+    return out
+
+
+# ---------- Public API ----------
+def autocomplete(conn, text, size=None, limit=DEFAULT_LIMIT):
+    """
+    Suggestions while typing: names starting with text first (index range),
+    then names containing it. Both stop after `limit` index hits, so the cost
+    does not grow with how common the text is.
+    """
+    text = _normalize(text)
+    if not text:
+        return []
+    prefix = _prefix_matches(conn, text, size, limit)
+    if len(prefix) >= limit:
+        return _merge(limit, ("prefix", prefix))
+    return _merge(limit, ("prefix", prefix), ("substring", _substring_matches(conn, text, size, limit, limit)))
+
+
+def search(conn, text, size=None, limit=DEFAULT_LIMIT, fuzzy=True):
+    """
+    Ranked product search: prefix matches, then substring matches, then (if
+    that leaves room and fuzzy is set) matches for the query with misspelled
+    words corrected against the catalog vocabulary.
+    """
+    text = _normalize(text)
+    if not text:
+        return []
+    candidates = limit * SEARCH_CANDIDATES
+    groups = [("prefix", _prefix_matches(conn, text, size, limit)),
+              ("substring", _substring_matches(conn, text, size, limit, candidates))]
+    found = _merge(limit, *groups)
+    if fuzzy and len(found) < limit:
+        found = _merge(limit, *groups, ("fuzzy", _fuzzy_matches(conn, text, size, limit, candidates)))
+    return found
+
+
+# ---------- CLI ----------
+if __name__ == "__main__":
+    # python product_search.py "query" [size] [path/to/inventory.db]
+    #        python product_search.py --rebuild [path/to/inventory.db]
+    if len(sys.argv) < 2:
+        raise SystemExit("usage: python product_search.py (QUERY [SIZE] | --rebuild) [db_path]")
+    if sys.argv[1] == "--rebuild":
+        conn = sqlite3.connect(sys.argv[2] if len(sys.argv) > 2 else "inventory.db")
+        ensure_product_search(conn)
+        rebuild_product_search(conn)
+        print("ProductSearch rebuilt.")
+    else:
+        conn = sqlite3.connect(sys.argv[3] if len(sys.argv) > 3 else "inventory.db")
+        ensure_product_search(conn)
+        for r in search(conn, sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None):
+            print(f"  [{r['Match']:9}] {r['ProductId']:>7}  {r['ProductName']}  {r['Size']}"
+                  + (f"  (as '{r['Corrected']}')" if "Corrected" in r else ""))
+    conn.close()
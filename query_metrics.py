@@ -0,0 +1,290 @@
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+
+# Per-statement timing for every pooled connection (see db_pool.PooledConnection).
+QUERY_METRICS = os.getenv("QUERY_METRICS", "1") == "1"
+# Statements slower than this are logged with their EXPLAIN QUERY PLAN
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+# Histogram buckets (seconds) for the Prometheus duration metric
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+log = logging.getLogger("slow_query")
+
+# Route (Flask url rule) the current SQL is attributed to. db_executor and
+# write_queue copy the caller's context onto their threads.
+current_route = contextvars.ContextVar("current_route", default=None)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_normalized = {}
+
+
+def normalize(sql):
+    """Statement text with literals replaced by ? and whitespace collapsed."""
+    key = _normalized.get(sql)
+    if key is None:
+        text = _STRING_LITERAL.sub("?", sql)
+        text = _NUMBER_LITERAL.sub("?", text)
+        text = _WHITESPACE.sub(" ", text).strip().rstrip(";").strip()
+        key = _IN_LIST.sub("(?)", text)
+        if len(_normalized) < 10_000:
+            _normalized[sql] = key
+    return key
+
+
+# ---------- Counters ----------
+class _QueryStats:
+    __slots__ = ("count", "seconds", "max_seconds", "rows", "slow", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+
+
+class QueryMetrics:
+    """Statement counters grouped by normalized SQL, plus SQL time per route."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queries = {}
+        self._routes = {}
+
+    def record(self, key, seconds, rows=0, executed=True):
+        route = current_route.get()
+        with self._lock:
+            stats = self._queries.get(key)
+            if stats is None:
+                stats = self._queries[key] = _QueryStats()
+            stats.seconds += seconds
+            stats.rows += rows
+            if executed:
+                stats.count += 1
+            if route is not None:
+                per_route = self._routes.setdefault(route, {"requests": 0, "seconds": 0.0,
+                                                            "sql_seconds": 0.0, "sql_statements": 0})
+                per_route["sql_seconds"] += seconds
+                per_route["sql_statements"] += executed
+
+    def observe(self, key, total_seconds, slow):
+        """Final duration of one statement (execute + fetch) for max/histogram/slow counts."""
+        with self._lock:
+            stats = self._queries.get(key)
+            if stats is None:
+                return
+            stats.max_seconds = max(stats.max_seconds, total_seconds)
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if total_seconds <= bound:
+                    stats.buckets[i] += 1
+                    break
+            stats.slow += slow
+
+    def record_request(self, route, seconds):
+        with self._lock:
+            per_route = self._routes.setdefault(route, {"requests": 0, "seconds": 0.0,
+                                                        "sql_seconds": 0.0, "sql_statements": 0})
+            per_route["requests"] += 1
+            per_route["seconds"] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            queries = {k: {"count": s.count, "seconds": s.seconds, "max_seconds": s.max_seconds,
+                           "rows": s.rows, "slow": s.slow, "buckets": list(s.buckets)}
+                       for k, s in self._queries.items()}
+            routes = {k: dict(v) for k, v in self._routes.items()}
+        return {"queries": queries, "routes": routes}
+
+    def reset(self):
+        with self._lock:
+            self._queries.clear()
+            self._routes.clear()
+
+
+metrics = QueryMetrics()
+
+
+# ---------- Instrumented cursor ----------
+class InstrumentedCursor:
+    """
+    Proxy around sqlite3.Cursor that times execute() and the fetches that
+    follow it, counts rows returned, and logs slow statements with their plan.
+    """
+
+    def __init__(self, cursor, conn):
+        self._cur = cursor
+        self._conn = conn
+        self._key = None
+        self._sql = None
+        self._params = None
+        self._elapsed = 0.0
+        self._logged = False
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def _start(self, sql, params, elapsed, rows=0):
+        self._finish()
+        self._key = normalize(sql)
+        self._sql, self._params = sql, params
+        self._elapsed = elapsed
+        self._logged = False
+        metrics.record(self._key, elapsed, rows)
+        self._check_slow()
+
+    def _fetched(self, elapsed, rows):
+        if self._key is None:
+            return
+        self._elapsed += elapsed
+        metrics.record(self._key, elapsed, rows, executed=False)
+        self._check_slow()
+
+    def _check_slow(self):
+        if self._logged or self._elapsed * 1000.0 < SLOW_QUERY_MS:
+            return
+        self._logged = True
+        log.warning("Slow query (%.1f ms, route=%s): %s\n  plan: %s", self._elapsed * 1000.0,
+                    current_route.get(), self._key, " | ".join(self._explain()))
+
+    def _explain(self):
+        if self._params is None:
+            return ["(executemany)"]
+        try:
+            return [row[3] for row in self._conn.execute("EXPLAIN QUERY PLAN " + self._sql, self._params)]
+        except Exception as e:
+            return [f"(no plan: {e})"]
+
+    def _finish(self):
+        if self._key is not None:
+            metrics.observe(self._key, self._elapsed, self._logged)
+            self._key = None
+
+    # ----- statements -----
+    def execute(self, sql, params=()):
+        started = time.perf_counter()
+        try:
+            self._cur.execute(sql, params)
+        finally:
+            self._start(sql, params, time.perf_counter() - started)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        started = time.perf_counter()
+        try:
+            self._cur.executemany(sql, seq_of_params)
+        finally:
+            self._start(sql, None, time.perf_counter() - started, max(self._cur.rowcount, 0))
+        return self
+
+    def executescript(self, script):
+        started = time.perf_counter()
+        try:
+            self._cur.executescript(script)
+        finally:
+            self._start(script, None, time.perf_counter() - started)
+        return self
+
+    # ----- fetches -----
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cur.fetchone()
+        self._fetched(time.perf_counter() - started, row is not None)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = self._cur.fetchmany(size) if size is not None else self._cur.fetchmany()
+        self._fetched(time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cur.fetchall()
+        self._fetched(time.perf_counter() - started, len(rows))
+        self._finish()
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def close(self):
+        self._finish()
+        self._cur.close()
+
+
+# ---------- Route attribution ----------
+def begin_route(route):
+    """Attributes SQL on this context to `route`; returns a token for end_route()."""
+    return current_route.set(route), time.perf_counter()
+
+
+def end_route(token):
+    var_token, started = token
+    route = current_route.get()
+    current_route.reset(var_token)
+    if route is not None:
+        metrics.record_request(route, time.perf_counter() - started)
+
+
+# ---------- Prometheus text format ----------
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def render_prometheus(snapshot=None):
+    """Counters in the Prometheus text exposition format (version 0.0.4)."""
+    snapshot = snapshot or metrics.snapshot()
+    out = []
+
+    def family(name, kind, help_text):
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+
+    queries = sorted(snapshot["queries"].items())
+    family("inventory_sql_statements_total", "counter", "Statements executed, by normalized SQL.")
+    out += [f'inventory_sql_statements_total{{query="{_label(q)}"}} {s["count"]}' for q, s in queries]
+    family("inventory_sql_seconds_total", "counter", "Time in execute and fetch, by normalized SQL.")
+    out += [f'inventory_sql_seconds_total{{query="{_label(q)}"}} {s["seconds"]:.6f}' for q, s in queries]
+    family("inventory_sql_rows_total", "counter", "Rows fetched (or changed by executemany), by normalized SQL.")
+    out += [f'inventory_sql_rows_total{{query="{_label(q)}"}} {s["rows"]}' for q, s in queries]
+    family("inventory_sql_slow_total", "counter", f"Statements slower than {SLOW_QUERY_MS:g} ms.")
+    out += [f'inventory_sql_slow_total{{query="{_label(q)}"}} {s["slow"]}' for q, s in queries]
+    family("inventory_sql_max_seconds", "gauge", "Slowest single statement, by normalized SQL.")
+    out += [f'inventory_sql_max_seconds{{query="{_label(q)}"}} {s["max_seconds"]:.6f}' for q, s in queries]
+
+    family("inventory_sql_duration_seconds", "histogram", "Statement duration (execute + fetch).")
+    for q, s in queries:
+        label = _label(q)
+        cumulative = 0
+        for bound, n in zip(DURATION_BUCKETS, s["buckets"]):
+            cumulative += n
+            out.append(f'inventory_sql_duration_seconds_bucket{{query="{label}",le="{bound:g}"}} {cumulative}')
+        out.append(f'inventory_sql_duration_seconds_bucket{{query="{label}",le="+Inf"}} {s["count"]}')
+        out.append(f'inventory_sql_duration_seconds_sum{{query="{label}"}} {s["seconds"]:.6f}')
+        out.append(f'inventory_sql_duration_seconds_count{{query="{label}"}} {s["count"]}')
+
+    routes = sorted(snapshot["routes"].items())
+    family("inventory_route_requests_total", "counter", "Requests served, by Flask route.")
+    out += [f'inventory_route_requests_total{{route="{_label(r)}"}} {v["requests"]}' for r, v in routes]
+    family("inventory_route_seconds_total", "counter", "Request handling time, by Flask route.")
+    out += [f'inventory_route_seconds_total{{route="{_label(r)}"}} {v["seconds"]:.6f}' for r, v in routes]
+    family("inventory_route_sql_seconds_total", "counter", "SQL time attributed to each Flask route.")
+    out += [f'inventory_route_sql_seconds_total{{route="{_label(r)}"}} {v["sql_seconds"]:.6f}' for r, v in routes]
+    family("inventory_route_sql_statements_total", "counter", "Statements executed for each Flask route.")
+    out += [f'inventory_route_sql_statements_total{{route="{_label(r)}"}} {v["sql_statements"]}'
+            for r, v in routes]
+    return "\n".join(out) + "\n"
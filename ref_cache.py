@@ -0,0 +1,141 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Max entries per index (Cities, Stores, Products, Vendors)
+REF_CACHE_SIZE = int(os.getenv("REF_CACHE_SIZE", "50000"))
+
+_MISSING = object()
+
+
+# ---------- Bounded LRU index ----------
+class LRUIndex:
+    """Dict-backed LRU map with hit/miss/eviction counters. Thread-safe."""
+
+    def __init__(self, max_entries=REF_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return _MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+# ---------- Reference-data cache ----------
+class RefCache:
+    """
+    Read-through cache of the dimension lookups used by every write path.
+    Only rows that exist are cached (a miss always re-queries), so newly
+    loaded cities/stores show up without invalidation; inserts and deletes
+    done by inventory_crud invalidate the affected keys after commit.
+    """
+
+    def __init__(self, max_entries=REF_CACHE_SIZE):
+        self.cities = LRUIndex(max_entries)
+        self.city_names = LRUIndex(max_entries)
+        self.stores = LRUIndex(max_entries)
+        self.products = LRUIndex(max_entries)
+        self.vendors = LRUIndex(max_entries)
+
+    def _lookup(self, index, key, cur, sql, params):
+        value = index.get(key)
+        if value is not _MISSING:
+            return value
+        cur.execute(sql, params)
+        row = cur.fetchone()
+        if row is None:
+            return None
+        value = tuple(row) if len(row) > 1 else row[0]
+        index.put(key, value)
+        return value
+
+    def city_id(self, cur, city_name):
+        """CityId for a city name, or None."""
+        return self._lookup(self.cities, city_name, cur,
+                            "SELECT CityId FROM Cities WHERE CityName = ?;", (city_name,))
+
+    def city_name(self, cur, city_id):
+        """CityName for a CityId, or None."""
+        return self._lookup(self.city_names, city_id, cur,
+                            "SELECT CityName FROM Cities WHERE CityId = ?;", (city_id,))
+
+    def store_city_id(self, cur, store_id):
+        """CityId the store belongs to, or None if the store does not exist."""
+        return self._lookup(self.stores, store_id, cur,
+                            "SELECT CityId FROM Stores WHERE StoreId = ?;", (store_id,))
+
+    def product(self, cur, product_name, size):
+        """(ProductId, Brand) for a product name and size, or None."""
+        return self._lookup(self.products, (product_name, size), cur,
+                            "SELECT ProductId, Brand FROM Products WHERE ProductName = ? AND Size = ?;",
+                            (product_name, size))
+
+    def vendor_number(self, cur, vendor_name):
+        """VendorNumber for a vendor name, or None."""
+        return self._lookup(self.vendors, vendor_name, cur,
+                            "SELECT VendorNumber FROM Vendors WHERE VendorName = ?;", (vendor_name,))
+
+    # ----- invalidation -----
+    def invalidate_product(self, product_name, size):
+        self.products.pop((product_name, size))
+
+    def invalidate_vendor(self, vendor_name):
+        self.vendors.pop(vendor_name)
+
+    def invalidate_all(self):
+        for index in (self.cities, self.city_names, self.stores, self.products, self.vendors):
+            index.clear()
+
+    def stats(self):
+        return {"cities": self.cities.stats(), "city_names": self.city_names.stats(), "stores": self.stores.stats(),
+                "products": self.products.stats(), "vendors": self.vendors.stats()}
+
+
+# ---------- Per-database registry ----------
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_ref_cache(db_path):
+    """Returns the shared RefCache for db_path."""
+    cache = _caches.get(db_path)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.setdefault(db_path, RefCache())
+    return cache
+
+
+def ref_cache_stats():
+    """Counters for every cache, keyed by database path."""
+    return {path: cache.stats() for path, cache in list(_caches.items())}
@@ -0,0 +1,199 @@
+import mmap
+import os
+import threading
+import zlib
+
+from ref_cache import LRUIndex, _MISSING
+
+# Max cached product-name lookups per process (0 disables the cache)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "10000"))
+# "1": keep invalidation counters in a file next to the database, shared by
+# every worker process that opens it (gunicorn workers, CLI tools, ...)
+RESULT_CACHE_SHARED = os.getenv("RESULT_CACHE_SHARED", "0") == "1"
+# Number of invalidation counters; products and names hash onto them
+GENERATION_BUCKETS = 1 << 16
+
+
+# ---------- Invalidation counters ----------
+# Every cached entry remembers the counters of the products (and the name)
+# it was built from, read *before* its query ran. Writers bump the counters
+# after commit, so an entry is served only while none of them has moved.
+# Counters only ever grow; a lost update from two concurrent bumps still
+# moves the counter, so no locking is needed, even across processes.
+class LocalGenerations:
+    """Invalidation counters for this process only."""
+
+    shared = False
+
+    def __init__(self, buckets=GENERATION_BUCKETS):
+        self._counters = [0] * buckets
+
+    def get(self, bucket):
+        return self._counters[bucket]
+
+    def bump(self, bucket):
+        self._counters[bucket] += 1
+
+
+class SharedGenerations:
+    """Invalidation counters in a memory-mapped file shared between processes."""
+
+    shared = True
+
+    def __init__(self, path, buckets=GENERATION_BUCKETS):
+        self.path = path
+        size = buckets * 8
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Only ever grown: resetting counters could revive stale entries elsewhere
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self._counters = memoryview(self._map).cast("Q")
+
+    def get(self, bucket):
+        return self._counters[bucket]
+
+    def bump(self, bucket):
+        self._counters[bucket] += 1
+
+
+def _bucket(kind, value):
+    # Stable across processes (unlike hash())
+    return zlib.crc32(f"{kind}:{value}".encode()) % GENERATION_BUCKETS
+
+
+def shared_generations(db_path):
+    """
+    The shared counters of db_path for a process that writes the database
+    directly (etl.py), or None when no process shares counters for it.
+    """
+    path = db_path + "-cachegen"
+    if RESULT_CACHE_SHARED or os.path.exists(path):
+        return SharedGenerations(path)
+    return None
+
+
+def process_generations(db_path):
+    """
+    This process's own counters for db_path, or None when it caches nothing
+    for it or its cache already uses the shared counters.
+    """
+    cache = _caches.get(db_path)
+    if cache is None or cache.generations.shared:
+        return None
+    return cache.generations
+
+
+def bump_generations(generations, product_ids=(), product_names=()):
+    """Invalidates cached results built from these products / names, wherever they are cached."""
+    for pid in product_ids:
+        generations.bump(_bucket("id", pid))
+    for name in product_names:
+        generations.bump(_bucket("name", name))
+
+
+# ---------- Product lookup cache ----------
+class ProductResultCache:
+    """
+    LRU memo of read_product_across_locations() results, keyed by product
+    name. Entries are invalidated per product: write listeners bump the
+    counters of the ProductIds they touched, and creating a product bumps its
+    name (so a cached "not found" or a new size shows up).
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, generations=None):
+        self.generations = generations or LocalGenerations()
+        self._entries = LRUIndex(max_entries)
+        self._lock = threading.Lock()
+        self.enabled = max_entries > 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.invalidations = 0
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stamp(self, product_name=None, product_ids=()):
+        """
+        Current counters for a name and/or products. Take them before the
+        query they cover and hand them to put(); the result is then dropped
+        as soon as a write to any of them lands.
+        """
+        buckets = ([_bucket("name", product_name)] if product_name is not None else []) \
+            + [_bucket("id", pid) for pid in product_ids]
+        return tuple((b, self.generations.get(b)) for b in buckets)
+
+    def get(self, product_name):
+        """Cached records for a product name (shared; do not mutate), or None."""
+        if not self.enabled:
+            return None
+        entry = self._entries.get(product_name)
+        if entry is _MISSING:
+            self._count("misses")
+            return None
+        stamp, rows = entry
+        if any(self.generations.get(b) != gen for b, gen in stamp):
+            self._entries.pop(product_name)
+            self._count("stale")
+            return None
+        self._count("hits")
+        return rows
+
+    def put(self, product_name, stamp, rows):
+        if self.enabled:
+            self._entries.put(product_name, (stamp, tuple(rows)))
+
+    # ----- invalidation -----
+    def invalidate_products(self, product_ids):
+        for pid in product_ids:
+            self.generations.bump(_bucket("id", pid))
+        with self._lock:
+            self.invalidations += len(product_ids)
+
+    def invalidate_name(self, product_name):
+        self.generations.bump(_bucket("name", product_name))
+        self._count("invalidations")
+
+    def on_write(self, event, product_ids):
+        """inventory_crud write listener."""
+        self.invalidate_products(product_ids)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        entries = self._entries.stats()
+        with self._lock:
+            lookups = self.hits + self.misses + self.stale
+            return {"enabled": self.enabled, "shared": self.generations.shared,
+                    "size": entries["size"], "max_entries": entries["max_entries"],
+                    "evictions": entries["evictions"], "hits": self.hits, "misses": self.misses,
+                    "stale": self.stale, "invalidations": self.invalidations,
+                    "hit_ratio": round(self.hits / lookups, 4) if lookups else None}
+
+
+# ---------- Per-database registry ----------
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_result_cache(db_path):
+    """Returns the ProductResultCache for db_path (shared counters if RESULT_CACHE_SHARED)."""
+    cache = _caches.get(db_path)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(db_path)
+            if cache is None:
+                generations = SharedGenerations(db_path + "-cachegen") if RESULT_CACHE_SHARED else None
+                cache = _caches[db_path] = ProductResultCache(generations=generations)
+    return cache
+
+
+def result_cache_stats():
+    """Counters for every result cache, keyed by database path."""
+    return {path: cache.stats() for path, cache in list(_caches.items())}
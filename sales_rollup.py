@@ -0,0 +1,203 @@
+import sqlite3
+import sys
+
+# SalesDaily holds one row per (SaleDate, StoreId, ProductId) with the day's
+# quantity and revenue, kept in step with Sales by update_sales and
+# bulk_record_sales. Archived sales stay counted: the rollup covers SalesAll.
+SALES_DAILY_DDL = """
+CREATE TABLE IF NOT EXISTS SalesDaily (
+    SaleDate   DATE NOT NULL,
+    StoreId    INTEGER NOT NULL,
+    ProductId  INTEGER NOT NULL,
+    Quantity   INTEGER NOT NULL DEFAULT 0,
+    Revenue    NUMERIC NOT NULL DEFAULT 0,
+    PRIMARY KEY (SaleDate, StoreId, ProductId)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_salesdaily_store_date
+ON SalesDaily (StoreId, SaleDate);
+
+CREATE INDEX IF NOT EXISTS idx_salesdaily_product_date
+ON SalesDaily (ProductId, SaleDate);
+"""
+
+EXPECTED_DAILY_SQL = """
+    SELECT SaleDate, StoreId, ProductId, SUM(Quantity) AS Quantity, SUM(TotalAmount) AS Revenue
+    FROM SalesAll
+    GROUP BY SaleDate, StoreId, ProductId
+"""
+
+UPSERT_DAILY_SQL = """
+    INSERT INTO SalesDaily (SaleDate, StoreId, ProductId, Quantity, Revenue)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (SaleDate, StoreId, ProductId) DO UPDATE
+    SET Quantity = Quantity + excluded.Quantity,
+        Revenue = Revenue + excluded.Revenue;
+"""
+
+
+# ---------- Schema ----------
+def ensure_sales_daily(conn):
+    """Creates SalesDaily and backfills it when empty. Returns True if it was backfilled."""
+    conn.executescript(SALES_DAILY_DDL)
+    if conn.execute("SELECT 1 FROM SalesDaily LIMIT 1;").fetchone() is None:
+        rebuild_sales_daily(conn)
+        return True
+    return False
+
+
+# ---------- Incremental maintenance ----------
+def adjust_sales_daily(cur, sale_date, store_id, product_id, quantity_delta, revenue_delta):
+    """Applies one sale's change to its day row, inside the caller's transaction."""
+    cur.execute(UPSERT_DAILY_SQL, (sale_date, store_id, product_id, quantity_delta, revenue_delta))
+
+
+def adjust_sales_daily_many(cur, deltas):
+    """Batched adjust_sales_daily: (sale_date, store_id, product_id, quantity_delta, revenue_delta) tuples."""
+    cur.executemany(UPSERT_DAILY_SQL, list(deltas))
+
+
+# ---------- Backfill / verification ----------
+def rebuild_sales_daily(conn):
+    """Recomputes SalesDaily from Sales and its archives. Returns the number of rows written."""
+    cur = conn.cursor()
+    cur.execute("DELETE FROM SalesDaily;")
+    cur.execute(f"""
+        INSERT INTO SalesDaily (SaleDate, StoreId, ProductId, Quantity, Revenue)
+        {EXPECTED_DAILY_SQL};
+    """)
+    count = cur.rowcount
+    conn.commit()
+    return count
+
+
+def verify_sales_daily(conn):
+    """Day rows whose quantity or revenue differs from a fresh GROUP BY over SalesAll."""
+    cur = conn.cursor()
+    cur.execute(f"""
+        WITH expected AS ({EXPECTED_DAILY_SQL})
+        SELECT e.SaleDate, e.StoreId, e.ProductId, e.Quantity, d.Quantity, e.Revenue, d.Revenue
+        FROM expected e
+        LEFT JOIN SalesDaily d
+               ON d.SaleDate = e.SaleDate AND d.StoreId = e.StoreId AND d.ProductId = e.ProductId
+        WHERE d.Quantity IS NULL OR d.Quantity != e.Quantity OR ABS(d.Revenue - e.Revenue) > 0.005
+        UNION ALL
+        SELECT d.SaleDate, d.StoreId, d.ProductId, NULL, d.Quantity, NULL, d.Revenue
+        FROM SalesDaily d
+        WHERE NOT EXISTS (
+            SELECT 1 FROM SalesAll s
+            WHERE s.SaleDate = d.SaleDate AND s.StoreId = d.StoreId AND s.ProductId = d.ProductId
+        );
+    """)
+    return [
+        {"SaleDate": sale_date, "StoreId": store_id, "ProductId": product_id,
+         "ExpectedQuantity": eq, "Quantity": q, "ExpectedRevenue": er, "Revenue": r}
+        for sale_date, store_id, product_id, eq, q, er, r in cur.fetchall()
+    ]
+
+
+# ---------- Reporting ----------
+# group name -> (select expressions, needs the Stores/Cities join)
+REPORT_GROUPS = {
+    "date": (("sd.SaleDate AS SaleDate",), False),
+    "month": (("substr(sd.SaleDate, 1, 7) AS Month",), False),
+    "product": (("sd.ProductId AS ProductId", "p.ProductName AS ProductName", "p.Size AS Size"), False),
+    "store": (("sd.StoreId AS StoreId",), False),
+    "city": (("c.CityName AS City",), True),
+}
+
+
+def revenue_report_sql(group_by, store_id=None, product_id=None, city=None, order="revenue"):
+    """
+    SQL and the filter names it expects for a revenue report over SalesDaily.
+    group_by is a sequence of REPORT_GROUPS keys (empty = grand total).
+    """
+    unknown = [g for g in group_by if g not in REPORT_GROUPS]
+    if unknown:
+        raise ValueError(f"Unknown group(s): {', '.join(unknown)}. Available: {', '.join(REPORT_GROUPS)}.")
+    select, keys = [], []
+    needs_city = city is not None
+    for g in group_by:
+        exprs, joins_city = REPORT_GROUPS[g]
+        select += exprs
+        keys += [e.split(" AS ")[0] for e in exprs]
+        needs_city |= joins_city
+
+    joins = ["JOIN Products p ON sd.ProductId = p.ProductId"] if "product" in group_by else []
+    if needs_city:
+        joins += ["JOIN Stores s ON sd.StoreId = s.StoreId", "JOIN Cities c ON s.CityId = c.CityId"]
+    where, params = ["sd.SaleDate >= :date_from", "sd.SaleDate <= :date_to"], ["date_from", "date_to"]
+    for column, name, value in (("sd.StoreId", "store_id", store_id), ("sd.ProductId", "product_id", product_id),
+                                ("c.CityName", "city", city)):
+        if value is not None:
+            where.append(f"{column} = :{name}")
+            params.append(name)
+
+    order_by = "Revenue DESC" if order == "revenue" or not keys else ", ".join(keys)
+    sql = (f"SELECT {', '.join(select + ['SUM(sd.Quantity) AS Quantity', 'ROUND(SUM(sd.Revenue), 2) AS Revenue'])} "
+           f"FROM SalesDaily sd {' '.join(joins)} WHERE {' AND '.join(where)}"
+           + (f" GROUP BY {', '.join(keys)}" if keys else "")
+           + f" ORDER BY {order_by} LIMIT :limit;")
+    return sql, params
+
+
+def revenue_report(conn, date_from, date_to, group_by=("product",), store_id=None, product_id=None,
+                   city=None, order="revenue", limit=100):
+    """Revenue and quantity per group between two ISO dates (inclusive), as dicts."""
+    sql, _ = revenue_report_sql(group_by, store_id, product_id, city, order)
+    params = {"date_from": date_from, "date_to": date_to, "store_id": store_id,
+              "product_id": product_id, "city": city, "limit": limit}
+    cur = conn.execute(sql, params)
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, row)) for row in cur.fetchall()]
+
+
+
+def _add(total, value):
+    # SUM over no rows is NULL; keep it NULL unless some part has a value
+    return value if total is None else total if value is None else total + value
+
+
+def merge_revenue_reports(reports, order="revenue", limit=100):
+    """
+    Combines revenue_report() rows from several databases (shards), each run
+    with limit=-1: groups present in more than one are summed, then the rows
+    are ordered as revenue_report() orders them and limited.
+    """
+    totals = {}
+    for rows in reports:
+        for r in rows:
+            key = tuple((k, v) for k, v in r.items() if k not in ("Quantity", "Revenue"))
+            total = totals.setdefault(key, [None, None])
+            total[0] = _add(total[0], r["Quantity"])
+            total[1] = _add(total[1], r["Revenue"])
+    rows = [dict(key, Quantity=quantity, Revenue=round(revenue, 2) if revenue is not None else None)
+            for key, (quantity, revenue) in totals.items()]
+    if order == "revenue" or not any(key for key in totals):
+        rows.sort(key=lambda r: -(r["Revenue"] or 0))
+    else:
+        rows.sort(key=lambda r: tuple(v for k, v in r.items() if k not in ("Quantity", "Revenue")))
+    return rows[:limit]
+
+# ---------- CLI ----------
+if __name__ == "__main__":
+    # python sales_rollup.py [verify|rebuild] [path/to/inventory.db]
+    command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+    db = sys.argv[2] if len(sys.argv) > 2 else "inventory.db"
+    if command not in ("verify", "rebuild"):
+        raise SystemExit("usage: python sales_rollup.py [verify|rebuild] [db_path]")
+
+    conn = sqlite3.connect(db)
+    if ensure_sales_daily(conn):
+        print("SalesDaily created and backfilled.")
+    if command == "rebuild":
+        print(f"SalesDaily rebuilt: {rebuild_sales_daily(conn)} rows.")
+    else:
+        drift = verify_sales_daily(conn)
+        for d in drift:
+            print(f"  {d['SaleDate']} store={d['StoreId']} product={d['ProductId']} "
+                  f"quantity {d['ExpectedQuantity']} != {d['Quantity']}, revenue {d['ExpectedRevenue']} != {d['Revenue']}")
+        print(f"{len(drift)} drifted rows.")
+        conn.close()
+        raise SystemExit(1 if drift else 0)
+    conn.close()
@@ -0,0 +1,277 @@
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Schema snapshots: tables, columns, indexes, foreign keys and row-count
+# estimates of one database, captured with a handful of queries over
+# SQLite's table-valued pragmas (instead of PRAGMA table_info per table)
+# and cached in <db>-schema.json. The cache is keyed by PRAGMA
+# schema_version (bumped by SQLite on every DDL) and user_version (the
+# migration level), so a start against an unchanged schema reads one small
+# JSON file. Used by startup validation (inventory_crud), the ER diagram
+# (generate_er_from_sqlite.py) and index_advisor.
+
+# "0": always introspect, never read or write the cache file
+SCHEMA_CACHE = os.getenv("SCHEMA_CACHE", "1") == "1"
+
+log = logging.getLogger(__name__)
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+class SchemaError(RuntimeError):
+    """Raised at startup when the database lacks tables or columns the app uses."""
+
+
+# Tables and columns the request paths read or write. Checked against the
+# snapshot after migrations, so a database built by an older ETL fails fast.
+REQUIRED_COLUMNS = {
+    "Cities": ("CityId", "CityName"),
+    "Stores": ("StoreId", "CityId"),
+    "Products": ("ProductId", "Brand", "ProductName", "Size"),
+    "Vendors": ("VendorNumber", "VendorName"),
+    "Invoices": ("InvoiceId", "StoreId", "VendorNumber", "InvoiceDate"),
+    "InvoiceLines": ("InvoiceLineId", "InvoiceId", "ProductId", "PurchasePrice", "Quantity", "LineTotal"),
+    "Sales": ("SaleId", "StoreId", "ProductId", "SaleDate", "Quantity", "SalePrice", "TotalAmount"),
+    "StockLevels": ("StoreId", "ProductId", "Quantity", "LineCount"),
+    "SalesDaily": ("SaleDate", "StoreId", "ProductId", "Quantity", "Revenue"),
+    "ProductSearch": ("ProductName", "Size"),
+    "ChangeLog": ("Seq", "Event", "StoreId", "ProductId", "Day", "StockDelta", "LineDelta", "RevenueDelta", "Detail"),
+    "ChangeConsumers": ("Consumer", "Seq"),
+}
+
+
+# ---------- Capture ----------
+def schema_key(conn):
+    """What a cached snapshot must match: (schema_version, user_version)."""
+    return [conn.execute("PRAGMA schema_version;").fetchone()[0],
+            conn.execute("PRAGMA user_version;").fetchone()[0]]
+
+
+def _row_estimates(conn, indexes):
+    """Rows per table from sqlite_stat1 (None for tables ANALYZE has not seen)."""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1';").fetchone():
+        return {}
+    estimates = {}
+    for table, index, stat in conn.execute("SELECT tbl, idx, stat FROM sqlite_stat1;"):
+        # The first number is the row count of the table (idx NULL) or index;
+        # a partial index only covers some rows
+        if index is not None and indexes.get(index, {}).get("partial"):
+            continue
+        rows = int(stat.split()[0])
+        estimates[table] = max(rows, estimates.get(table, 0))
+    return estimates
+
+
+def capture(conn, analyze=False):
+    """
+    Introspects the whole schema. analyze=True runs ANALYZE first, so every
+    table gets a row estimate (it writes sqlite_stat1).
+    """
+    started = time.perf_counter()
+    if analyze:
+        conn.execute("ANALYZE;")
+        conn.commit()
+    cur = conn.cursor()
+    cur.row_factory = None
+    key = schema_key(conn)
+
+    tables = {}
+    cur.execute("""
+        SELECT name, type, sql FROM sqlite_master
+        WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'
+        ORDER BY rowid;
+    """)
+    for name, kind, ddl in cur.fetchall():
+        if kind == "table" and (ddl or "").upper().startswith("CREATE VIRTUAL TABLE"):
+            kind = "virtual"
+        tables[name] = {"type": kind, "columns": [], "foreign_keys": [], "indexes": [], "rows": None}
+
+    cur.execute("""
+        SELECT m.name, p.name, p.type, p."notnull", p.dflt_value, p.pk
+        FROM sqlite_master m JOIN pragma_table_info(m.name) p
+        WHERE m.type IN ('table', 'view') AND m.name NOT LIKE 'sqlite_%'
+        ORDER BY m.name, p.cid;
+    """)
+    for table, name, ctype, notnull, default, pk in cur.fetchall():
+        tables[table]["columns"].append({"name": name, "type": ctype, "notnull": bool(notnull),
+                                         "default": default, "pk": pk})
+
+    cur.execute("""
+        SELECT m.name, f."table", f."from", f."to"
+        FROM sqlite_master m JOIN pragma_foreign_key_list(m.name) f
+        WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'
+        ORDER BY m.name, f.id, f.seq;
+    """)
+    for table, parent, column_from, column_to in cur.fetchall():
+        tables[table]["foreign_keys"].append({"table": parent, "from": column_from, "to": column_to})
+
+    indexes = {}
+    cur.execute("""
+        SELECT m.name, il.name, il."unique", il.origin, il.partial, ii.name
+        FROM sqlite_master m
+        JOIN pragma_index_list(m.name) il
+        JOIN pragma_index_info(il.name) ii
+        WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'
+        ORDER BY m.name, il.name, ii.seqno;
+    """)
+    for table, index, unique, origin, partial, column in cur.fetchall():
+        entry = indexes.get(index)
+        if entry is None:
+            entry = indexes[index] = {"table": table, "columns": [], "unique": bool(unique),
+                                      "origin": origin, "partial": bool(partial)}
+            tables[table]["indexes"].append(index)
+        # Expression index terms have no column name
+        entry["columns"].append(column if column is not None else "<expr>")
+
+    for table, rows in _row_estimates(conn, indexes).items():
+        if table in tables:
+            tables[table]["rows"] = rows
+
+    return {"key": key, "captured_at": time.time(),
+            "capture_seconds": round(time.perf_counter() - started, 4),
+            "tables": tables, "indexes": indexes}
+
+
+# ---------- Cache ----------
+def cache_path(db_path):
+    return f"{db_path}-schema.json"
+
+
+def _read_cache(path, key):
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return snapshot if snapshot.get("key") == key else None
+
+
+def _write_cache(path, snapshot):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, path)
+    except OSError:
+        # A read-only directory only costs the next start an introspection
+        log.warning("Could not write schema cache %s", path, exc_info=True)
+
+
+def load_schema(conn, db_path, refresh=False, analyze=False):
+    """
+    The schema snapshot of conn's database: from memory or <db>-schema.json
+    while the schema key matches, otherwise captured and cached.
+    """
+    key = schema_key(conn)
+    if not (refresh or analyze):
+        snapshot = _snapshots.get(db_path)
+        if snapshot is not None and snapshot["key"] == key:
+            return snapshot
+        snapshot = _read_cache(cache_path(db_path), key) if SCHEMA_CACHE else None
+        if snapshot is not None:
+            with _snapshots_lock:
+                _snapshots[db_path] = snapshot
+            return snapshot
+    snapshot = capture(conn, analyze=analyze)
+    if SCHEMA_CACHE and db_path != ":memory:":
+        _write_cache(cache_path(db_path), snapshot)
+    with _snapshots_lock:
+        _snapshots[db_path] = snapshot
+    return snapshot
+
+
+def load_schemas(db_paths, refresh=False, analyze=False):
+    """load_schema for several databases (e.g. every shard) in parallel. Returns {path: snapshot}."""
+    def one(path):
+        conn = sqlite3.connect(path)
+        try:
+            return load_schema(conn, path, refresh, analyze)
+        finally:
+            conn.close()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(len(db_paths), 8))) as pool:
+        return dict(zip(db_paths, pool.map(one, db_paths)))
+
+
+# ---------- Consumers ----------
+def validate(snapshot, required=REQUIRED_COLUMNS):
+    """Missing tables / columns as messages (empty when the schema has everything)."""
+    problems = []
+    tables = snapshot["tables"]
+    for table, columns in required.items():
+        if table not in tables:
+            problems.append(f"missing table {table}")
+            continue
+        have = {c["name"] for c in tables[table]["columns"]}
+        missing = [c for c in columns if c not in have]
+        if missing:
+            problems.append(f"{table} is missing column(s) {', '.join(missing)}")
+    return problems
+
+
+def check_schema(conn, db_path):
+    """Startup check: loads (or captures) the snapshot and raises SchemaError if the app cannot run on it."""
+    snapshot = load_schema(conn, db_path)
+    problems = validate(snapshot)
+    if problems:
+        raise SchemaError(f"{db_path}: " + "; ".join(problems))
+    return snapshot
+
+
+def to_mermaid(snapshot):
+    """Mermaid erDiagram of the snapshot's tables (not views) and foreign keys."""
+    def norm(t):
+        return (t or "text").split()[0].lower()
+
+    tables = [(name, t) for name, t in snapshot["tables"].items() if t["type"] != "view"]
+    lines = ["erDiagram"]
+    for name, table in tables:
+        lines.append(f"  {name.upper()} {{")
+        for c in table["columns"]:
+            lines.append(f"    {norm(c['type'])} {c['name']}{' PK' if c['pk'] else ''}")
+        lines.append("  }")
+    for name, table in tables:
+        for fk in table["foreign_keys"]:
+            lines.append(f"  {fk['table'].upper()} ||--o{{ {name.upper()} : references")
+    return "\n".join(lines)
+
+
+def summary(snapshot):
+    """Table name -> (kind, column count, index count, estimated rows)."""
+    return {name: (t["type"], len(t["columns"]), len(t["indexes"]), t["rows"])
+            for name, t in snapshot["tables"].items()}
+
+
+def schema_stats():
+    """Loaded snapshots, keyed by database path (for /health/schema)."""
+    return {path: {"schema_version": snapshot["key"][0], "user_version": snapshot["key"][1],
+                   "tables": len(snapshot["tables"]), "indexes": len(snapshot["indexes"]),
+                   "captured_at": snapshot["captured_at"], "capture_seconds": snapshot["capture_seconds"]}
+            for path, snapshot in list(_snapshots.items())}
+
+
+# ---------- CLI ----------
+if __name__ == "__main__":
+    # python schema_catalog.py [--refresh] [--analyze] [db_path ...]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")] or ["inventory.db"]
+    missing = [p for p in args if not os.path.exists(p)]
+    if missing:
+        raise SystemExit(f"DB not found: {', '.join(missing)}")
+    started = time.perf_counter()
+    snapshots = load_schemas(args, refresh="--refresh" in sys.argv, analyze="--analyze" in sys.argv)
+    for path, snapshot in snapshots.items():
+        print(f"{path}: schema_version {snapshot['key'][0]}, user_version {snapshot['key'][1]}, "
+              f"{len(snapshot['tables'])} tables, {len(snapshot['indexes'])} indexes "
+              f"(captured in {snapshot['capture_seconds']}s)")
+        for name, (kind, columns, indexes, rows) in summary(snapshot).items():
+            print(f"  {name:32} {kind:8} {columns:3} cols {indexes:3} idx  ~{rows if rows is not None else '?'} rows")
+        for problem in validate(snapshot):
+            print(f"  ! {problem}")
+    print(f"{len(snapshots)} database(s) in {time.perf_counter() - started:.3f}s")
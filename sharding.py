@@ -0,0 +1,742 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import inventory_crud
+import statements as sql
+from archive import archive_tables
+from inventory_crud import get_connection, queued_mutation, ref_cache, result_cache, use_database
+
+# Sharding splits the transactional data across SQLite files, one write lane
+# (writer connection + write queue) each. Every store belongs to one shard,
+# chosen by its city or by StoreId range; its Invoices, InvoiceLines, Sales,
+# StockLevels and SalesDaily rows live only there. Cities, Stores, Products
+# and Vendors are replicated to every shard, so each shard validates and
+# joins locally. Writes are routed by their store_id; reads that span stores
+# (product lookups across locations, dashboard aggregates, the API's sales
+# and invoice lists and revenue report) fan out to all shards on a thread
+# pool and merge.
+#
+# The shard map is a JSON file named by DB_SHARDS:
+#   {"by": "city", "shards": {"north": "north.db", "south": "south.db"},
+#    "cities": {"BOLTON": "north", "CARDEND": "south"}, "primary": "north"}
+#   {"by": "store", "shards": {...}, "stores": [[1, 40, "north"], [41, 80, "south"]]}
+# Stores the map does not place go to the primary shard, which also claims
+# new ProductIds (and caller-chosen VendorNumbers); other new vendors are
+# written with the first purchase that uses them, then replicated.
+# Without DB_SHARDS the functions below are inventory_crud's own.
+# Per-group inventory metrics (/api/analytics/inventory) are refused when
+# sharded, since their ratios cannot be merged; maintenance CLIs (archive,
+# analytics export, ...) take one database and are run once per shard.
+
+SHARD_MAP_FILE = os.getenv("DB_SHARDS")
+# Threads that run per-shard reads, and that coordinate multi-shard writes
+SHARD_READ_THREADS = int(os.getenv("SHARD_READ_THREADS", "16"))
+SHARD_WRITE_THREADS = int(os.getenv("SHARD_WRITE_THREADS", "16"))
+# Least time between re-reads of Stores for a store_id the map has not seen
+SHARD_STORE_REFRESH_SECONDS = float(os.getenv("SHARD_STORE_REFRESH_SECONDS", "5"))
+
+
+class ShardMap:
+    """Shard names, their database files, and which shard each store belongs to."""
+
+    def __init__(self, shards, by="city", cities=None, stores=None, primary=None):
+        if by not in ("city", "store"):
+            raise ValueError(f"Unknown shard key: {by}. Use 'city' or 'store'.")
+        self.shards = dict(shards)
+        if not self.shards:
+            raise ValueError("A shard map needs at least one shard.")
+        self.by = by
+        self.cities = dict(cities or {})
+        self.ranges = sorted((int(lo), int(hi), name) for lo, hi, name in (stores or []))
+        self.primary = primary or next(iter(self.shards))
+        unknown = ({self.primary} | set(self.cities.values()) | {name for _, _, name in self.ranges}) - set(self.shards)
+        if unknown:
+            raise ValueError(f"Shard map names unknown shard(s): {', '.join(sorted(unknown))}.")
+        self._store_cities = None
+        self._store_cities_read = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            config = json.load(f)
+        base = os.path.dirname(os.path.abspath(path))
+        shards = {name: os.path.join(base, db) for name, db in config["shards"].items()}
+        return cls(shards, config.get("by", "city"), config.get("cities"), config.get("stores"),
+                   config.get("primary"))
+
+    @property
+    def primary_path(self):
+        return self.shards[self.primary]
+
+    def place(self, store_id, city=None):
+        """Shard name for a store (and, for city sharding, its city name)."""
+        if self.by == "store":
+            i = bisect.bisect_right(self.ranges, (store_id, float("inf"), "")) - 1
+            if i >= 0 and self.ranges[i][0] <= store_id <= self.ranges[i][1]:
+                return self.ranges[i][2]
+            return self.primary
+        return self.cities.get(city, self.primary)
+
+    def _city_of(self, store_id):
+        # Stores are replicated reference data; re-read on an unknown store,
+        # at most every SHARD_STORE_REFRESH_SECONDS so bad ids do not each
+        # scan Stores (a store the ETL adds is placed within that interval)
+        cities = self._store_cities
+        if cities is not None and (store_id in cities
+                                   or time.monotonic() - self._store_cities_read < SHARD_STORE_REFRESH_SECONDS):
+            return cities.get(store_id)
+        with self._lock:
+            cities = self._store_cities
+            if cities is None or (store_id not in cities
+                                  and time.monotonic() - self._store_cities_read >= SHARD_STORE_REFRESH_SECONDS):
+                with use_database(self.primary_path):
+                    conn = get_connection(readonly=True)
+                    try:
+                        rows = conn.cursor(tuples=True).execute("""
+                            SELECT s.StoreId, c.CityName FROM Stores s JOIN Cities c ON s.CityId = c.CityId;
+                        """).fetchall()
+                    finally:
+                        conn.close()
+                cities = self._store_cities = dict(rows)
+                self._store_cities_read = time.monotonic()
+        return cities.get(store_id)
+
+    def shard_of(self, store_id):
+        """Shard name for a store_id; malformed or unknown stores go to the primary."""
+        try:
+            store_id = int(store_id)
+        except (TypeError, ValueError):
+            return self.primary
+        return self.place(store_id, self._city_of(store_id) if self.by == "city" else None)
+
+    def path_of(self, store_id):
+        return self.shards[self.shard_of(store_id)]
+
+
+_shard_map = ShardMap.load(SHARD_MAP_FILE) if SHARD_MAP_FILE else None
+_pools = {}
+_pools_lock = threading.Lock()
+# Held from handing out (or claiming) new VendorNumbers until they are written
+# everywhere, so two requests never pick the same number for different vendors
+_vendor_lock = threading.Lock()
+
+# Drops a vendor that no invoice or product refers to
+VENDOR_RELEASE_SQL = """
+    DELETE FROM Vendors WHERE VendorNumber = ?
+    AND NOT EXISTS (SELECT 1 FROM Invoices WHERE VendorNumber = ?)
+    AND NOT EXISTS (SELECT 1 FROM Products WHERE Brand = ?);
+"""
+
+
+def shard_map():
+    """The configured ShardMap, or None when DB_SHARDS is not set."""
+    return _shard_map
+
+
+def _threads(kind):
+    # Separate pools: a coordinating write waiting on fan-out reads can never
+    # hold the threads those reads need
+    pool = _pools.get(kind)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(kind)
+            if pool is None:
+                workers = SHARD_READ_THREADS if kind == "read" else SHARD_WRITE_THREADS
+                pool = _pools[kind] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"shard-{kind}")
+    return pool
+
+
+def _on(db_path, fn, *args, **kwargs):
+    with use_database(db_path):
+        return fn(*args, **kwargs)
+
+
+def fan_out(fn, *args, **kwargs):
+    """Runs fn(*args, **kwargs) against every shard in parallel. Returns {shard name: result}."""
+    futures = {name: _threads("read").submit(contextvars.copy_context().run, _on, path, fn, *args, **kwargs)
+               for name, path in _shard_map.shards.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+
+def _submit_on(db_path, mutation, *args, **kwargs):
+    with use_database(db_path):
+        return mutation.submit(*args, **kwargs)
+
+
+# ---------- Routed writes ----------
+def _routed(mutation):
+    """A queued mutation sent to the shard of its store_id argument."""
+    signature = inspect.signature(mutation)
+
+    def submit(*args, **kwargs):
+        store_id = signature.bind(None, *args, **kwargs).arguments["store_id"]
+        return _submit_on(_shard_map.path_of(store_id), mutation, *args, **kwargs)
+
+    @functools.wraps(mutation)
+    def run(*args, **kwargs):
+        return submit(*args, **kwargs).result()
+
+    run.submit = submit
+    return run
+
+
+def _coordinated(fn):
+    """
+    A write that spans shards. submit() runs it on the shard thread pool, so
+    the executor's writer thread never waits on one shard for another.
+    """
+    def submit(*args, **kwargs):
+        return _threads("write").submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+    fn.submit = submit
+    return fn
+
+
+class ReplicationConflict(RuntimeError):
+    """A shard already holds a different product or vendor under a replicated key."""
+
+
+@queued_mutation
+def _replicate(tx, products=(), vendors=()):
+    """
+    Copies dimension rows another shard created: (ProductId, Brand, ProductName, Size), (VendorNumber, VendorName).
+    A key this shard already uses for a different product or vendor is an error, and nothing is copied.
+    """
+    cur = tx.cursor(tuples=True)
+    conflicts = []
+    for product_id, brand, product_name, size in products:
+        cur.execute("INSERT OR IGNORE INTO Products (ProductId, Brand, ProductName, Size) VALUES (?, ?, ?, ?);",
+                    (product_id, brand, product_name, size))
+        if cur.rowcount == 0:
+            _, stored_name, stored_size = cur.execute(sql.PRODUCT_BY_ID, (product_id,)).fetchone()
+            if (stored_name, stored_size) != (product_name, size):
+                conflicts.append(f"ProductId {product_id} is '{stored_name}' ({stored_size}), "
+                                 f"not '{product_name}' ({size})")
+    for vendor_number, vendor_name in vendors:
+        cur.execute(sql.VENDOR_INSERT_OR_IGNORE, (vendor_number, vendor_name))
+        if cur.rowcount == 0:
+            stored_name = cur.execute(sql.VENDOR_NAME, (vendor_number,)).fetchone()[0]
+            if stored_name != vendor_name:
+                conflicts.append(f"VendorNumber {vendor_number} is '{stored_name}', not '{vendor_name}'")
+    if conflicts:
+        return {"error": "; ".join(conflicts)}
+    cache = ref_cache()
+    for _, _, product_name, size in products:
+        tx.after_commit(cache.invalidate_product, product_name, size)
+        tx.after_commit(result_cache().invalidate_name, product_name)
+    for _, vendor_name in vendors:
+        tx.after_commit(cache.invalidate_vendor, vendor_name)
+    return {"products": len(products), "vendors": len(vendors)}
+
+
+def _replicate_to(origin, products=(), vendors=()):
+    """Waits until every shard except origin has the dimension rows; raises ReplicationConflict if one cannot."""
+    futures = {name: _submit_on(path, _replicate, products, vendors)
+               for name, path in _shard_map.shards.items() if path != origin}
+    conflicts = []
+    for name, future in futures.items():
+        result = future.result()
+        if "error" in result:
+            conflicts.append(f"shard '{name}': {result['error']}")
+    if conflicts:
+        raise ReplicationConflict("; ".join(conflicts))
+
+
+def _vendor_numbers_on(vendor_names):
+    conn = get_connection(readonly=True)
+    try:
+        cur = conn.cursor(tuples=True)
+        numbers = {name: ref_cache().vendor_number(cur, name) for name in vendor_names}
+        top = cur.execute("SELECT MAX(VendorNumber) FROM Vendors;").fetchone()[0] or 0
+    finally:
+        conn.close()
+    return {name: number for name, number in numbers.items() if number is not None}, top
+
+
+def _vendor_numbers(vendor_names):
+    """
+    VendorNumber for each name: the primary shard's for known vendors, the
+    next numbers above every shard's highest for new ones. Nothing is written;
+    hold _vendor_lock until the new vendors are.
+    """
+    found = fan_out(_vendor_numbers_on, vendor_names)
+    numbers = dict(found[_shard_map.primary][0])
+    new = [name for name in vendor_names if name not in numbers]
+    top = max(top for _, top in found.values())
+    numbers.update((name, top + i) for i, name in enumerate(new, 1))
+    return numbers
+
+
+def _known_vendors(db_path, vendor_names):
+    with use_database(db_path):
+        conn = get_connection(readonly=True)
+        try:
+            cur = conn.cursor(tuples=True)
+            return {name for name in vendor_names if ref_cache().vendor_number(cur, name) is not None}
+        finally:
+            conn.close()
+
+
+@queued_mutation
+def _with_vendors(tx, vendors, mutation, *args, **kwargs):
+    """
+    Runs a queued mutation's body after inserting the vendors
+    [(VendorNumber, VendorName)] it may need, in the same savepoint: a
+    rejected write rolls them back, and those its new invoices do not use are
+    deleted again, so only vendors that were written to stay.
+    """
+    cur = tx.cursor(tuples=True)
+    cache = ref_cache()
+    last_invoice = cur.execute("SELECT MAX(InvoiceId) FROM Invoices;").fetchone()[0] or 0
+    added = []
+    try:
+        for vendor_number, vendor_name in vendors:
+            cur.execute(sql.VENDOR_INSERT_OR_IGNORE, (vendor_number, vendor_name))
+            if cur.rowcount:
+                added.append((vendor_number, vendor_name))
+            elif cur.execute(sql.VENDOR_NAME, (vendor_number,)).fetchone()[0] != vendor_name:
+                return {"error": f"VendorNumber {vendor_number} names another vendor on this shard."}
+        result = mutation.__wrapped__(tx, *args, **kwargs)
+        if isinstance(result, dict) and "error" in result:
+            return result
+        # New vendors can only be on invoices this mutation created
+        used = {number for (number,) in cur.execute(
+            "SELECT DISTINCT VendorNumber FROM Invoices WHERE InvoiceId > ?;", (last_invoice,))}
+        for vendor_number, vendor_name in added:
+            if vendor_number in used:
+                tx.after_commit(cache.invalidate_vendor, vendor_name)
+            else:
+                cur.execute("DELETE FROM Vendors WHERE VendorNumber = ?;", (vendor_number,))
+        return result
+    finally:
+        # The mutation's lookups may have cached vendors that are rolled back or deleted
+        for _, vendor_name in added:
+            cache.invalidate_vendor(vendor_name)
+
+
+def _write_with_vendors(writes, vendor_names):
+    """
+    Runs queued mutations {shard path: (mutation, args)} concurrently and
+    returns {shard path: result, or the exception it raised}.
+    Vendor names one of those shards does not know are numbered on the fly
+    and inserted by the mutations themselves (see _with_vendors); the ones
+    that got written are then replicated to every shard, so a VendorNumber
+    means the same vendor everywhere and rejected writes leave none behind.
+    """
+    names = sorted(set(vendor_names))
+    if all(_known_vendors(path, names) == set(names) for path in writes):
+        return _results({path: _submit_on(path, mutation, *args) for path, (mutation, args) in writes.items()})
+    with _vendor_lock:
+        vendors = sorted((number, name) for name, number in _vendor_numbers(names).items())
+        results = _results({path: _submit_on(path, _with_vendors, vendors, mutation, *args)
+                            for path, (mutation, args) in writes.items()})
+        written = set().union(*(_known_vendors(path, names) for path in writes))
+        _replicate_to(None, vendors=[(number, name) for number, name in vendors if name in written])
+    return results
+
+
+def _results(futures):
+    results = {}
+    for path, future in futures.items():
+        try:
+            results[path] = future.result()
+        except Exception as e:
+            results[path] = e
+    return results
+
+
+def _new_product_refs(product_id, vendor_number):
+    """(ProductId already used, name stored for vendor_number or None) on the current shard."""
+    conn = get_connection(readonly=True)
+    try:
+        cur = conn.cursor(tuples=True)
+        taken = cur.execute(sql.PRODUCT_EXISTS, (product_id,)).fetchone()[0] > 0
+        vendor = cur.execute(sql.VENDOR_NAME, (vendor_number,)).fetchone()
+    finally:
+        conn.close()
+    return taken, vendor[0] if vendor else None
+
+
+@queued_mutation
+def _claim_product(tx, product_id, vendor_number, vendor_name, product_name, size):
+    """
+    On the primary shard: creates the product, and its vendor when the
+    VendorNumber is new. The primary's write queue orders concurrent claims,
+    so two shards cannot take the same ProductId or give one VendorNumber two
+    names. Returns the vendor's stored name.
+    """
+    cur = tx.cursor(tuples=True)
+    cur.execute(sql.PRODUCT_EXISTS, (product_id,))
+    if cur.fetchone()[0] > 0:
+        return {"error": f"ProductId {product_id} already exists. Please use a new ProductId."}
+    cache = ref_cache()
+    # An existing number keeps its stored name, as in add_new_product_purchase
+    cur.execute(sql.VENDOR_INSERT_OR_IGNORE, (vendor_number, vendor_name))
+    vendor_created = cur.rowcount > 0
+    if vendor_created:
+        tx.after_commit(cache.invalidate_vendor, vendor_name)
+    else:
+        vendor_name = cur.execute(sql.VENDOR_NAME, (vendor_number,)).fetchone()[0]
+    cur.execute(sql.PRODUCT_INSERT, (product_id, vendor_number, product_name, size))
+    tx.after_commit(cache.invalidate_product, product_name, size)
+    return {"VendorName": vendor_name, "vendor_created": vendor_created}
+
+
+@queued_mutation
+def _release_product(tx, product_id, product_name, size, vendor_number=None, vendor_name=None):
+    """On the primary shard: drops a claimed product (and vendor) no purchase went through for."""
+    cur = tx.cursor(tuples=True)
+    cur.execute("DELETE FROM Products WHERE ProductId = ? AND NOT EXISTS "
+                "(SELECT 1 FROM InvoiceLines WHERE ProductId = ?);", (product_id, product_id))
+    tx.after_commit(ref_cache().invalidate_product, product_name, size)
+    if vendor_number is not None:
+        cur.execute(VENDOR_RELEASE_SQL, (vendor_number, vendor_number, vendor_number))
+        tx.after_commit(ref_cache().invalidate_vendor, vendor_name)
+
+
+def _release_claim(claim, product_id, product_name, size, vendor_number, vendor_name):
+    if claim is not None:
+        vendor = (vendor_number, vendor_name) if claim["vendor_created"] else ()
+        _submit_on(_shard_map.primary_path, _release_product, product_id, product_name, size, *vendor).result()
+
+
+def _add_new_product_purchase(store_id, product_id, product_name, size, vendor_number, vendor_name,
+                              invoice_date, purchase_price, quantity):
+    """
+    inventory_crud.add_new_product_purchase on the store's shard, then the new
+    product (and vendor) copied to the other shards. The ProductId must be
+    unused on every shard and the VendorNumber, if known anywhere, must name
+    the same vendor everywhere. Both are claimed on the primary shard first,
+    under _vendor_lock, so concurrent requests cannot race.
+    """
+    with _vendor_lock:
+        refs = fan_out(_new_product_refs, product_id, vendor_number)
+        taken = sorted(name for name, (found, _) in refs.items() if found)
+        if taken:
+            return {"error": f"ProductId {product_id} already exists (shard(s) {', '.join(taken)}). "
+                             f"Please use a new ProductId."}
+        stored = {name: stored_name for name, (_, stored_name) in refs.items() if stored_name is not None}
+        vendor_name = stored.get(_shard_map.primary, next(iter(stored.values()), vendor_name))
+        differing = sorted(name for name, stored_name in stored.items() if stored_name != vendor_name)
+        if differing:
+            return {"error": f"VendorNumber {vendor_number} names different vendors on shard(s) "
+                             f"{', '.join(sorted(stored))}; fix the Vendors tables first."}
+
+        origin, primary = _shard_map.path_of(store_id), _shard_map.primary_path
+        # On the primary itself, the purchase's own checks are the claim
+        claim = None
+        if origin != primary:
+            claim = _submit_on(primary, _claim_product, product_id, vendor_number, vendor_name,
+                               product_name, size).result()
+            if "error" in claim:
+                return claim
+            vendor_name = claim["VendorName"]
+        try:
+            result = _submit_on(origin, inventory_crud.add_new_product_purchase, store_id, product_id,
+                                product_name, size, vendor_number, vendor_name, invoice_date, purchase_price,
+                                quantity).result()
+        except Exception:
+            _release_claim(claim, product_id, product_name, size, vendor_number, vendor_name)
+            raise
+        if "error" in result:
+            _release_claim(claim, product_id, product_name, size, vendor_number, vendor_name)
+            return result
+        _replicate_to(origin, products=[(product_id, vendor_number, product_name, size)],
+                      vendors=[(vendor_number, result["VendorName"])])
+        return result
+
+
+# Latest price of a product on one shard, with the date it was paid
+LATEST_PURCHASE_SQL = """
+    SELECT i.InvoiceDate, CAST(il.PurchasePrice AS REAL)
+    FROM InvoiceLines il JOIN Invoices i ON il.InvoiceId = i.InvoiceId
+    WHERE il.ProductId = ? ORDER BY il.InvoiceLineId DESC LIMIT 1;
+"""
+LATEST_SALE_SQL = """
+    SELECT SaleDate, CAST(SalePrice AS REAL) FROM Sales
+    WHERE ProductId = ? ORDER BY SaleId DESC LIMIT 1;
+"""
+
+
+def _shard_latest_price(query, product_name, size):
+    conn = get_connection(readonly=True)
+    try:
+        cur = conn.cursor(tuples=True)
+        product = ref_cache().product(cur, product_name, size)
+        return cur.execute(query, (product[0],)).fetchone() if product else None
+    finally:
+        conn.close()
+
+
+def _price_from_any_shard(db_path, query, product_name, size):
+    """
+    None when db_path has a price history for the product (the shard then
+    picks its own latest price, as a single database would); otherwise the
+    most recent price on any other shard, so a store's first purchase or
+    sale of a product is priced like it would be without sharding.
+    """
+    if _on(db_path, _shard_latest_price, query, product_name, size) is not None:
+        return None
+    latest = [row for row in fan_out(_shard_latest_price, query, product_name, size).values() if row]
+    return max(latest)[1] if latest else None
+
+
+def _update_existing_purchase(city, store_id, vendor_name, product_name, size, invoice_date, quantity,
+                              purchase_price=None):
+    """inventory_crud.update_existing_purchase on the store's shard (a new vendor it writes goes to all shards)."""
+    path = _shard_map.path_of(store_id)
+    if purchase_price is None:
+        purchase_price = _price_from_any_shard(path, LATEST_PURCHASE_SQL, product_name, size)
+    args = (city, store_id, vendor_name, product_name, size, invoice_date, quantity, purchase_price)
+    result = _write_with_vendors({path: (inventory_crud.update_existing_purchase, args)}, [vendor_name])[path]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def _update_sales(city, store_id, product_name, size, sale_date, quantity, sale_price=None):
+    """inventory_crud.update_sales on the store's shard."""
+    path = _shard_map.path_of(store_id)
+    if sale_price is None:
+        sale_price = _price_from_any_shard(path, LATEST_SALE_SQL, product_name, size)
+    return _submit_on(path, inventory_crud.update_sales, city, store_id, product_name, size, sale_date,
+                      quantity, sale_price).result()
+
+
+def _sales_router():
+    # Priced sales go straight to their shard's queue; unpriced ones may need
+    # other shards' price history first, so a coordinator thread handles them
+    routed = _routed(inventory_crud.update_sales)
+    signature = inspect.signature(_update_sales)
+    coordinated = _coordinated(_update_sales)
+
+    def submit(*args, **kwargs):
+        if signature.bind(*args, **kwargs).arguments.get("sale_price") is None:
+            return coordinated.submit(*args, **kwargs)
+        return routed.submit(*args, **kwargs)
+
+    @functools.wraps(inventory_crud.update_sales)
+    def run(*args, **kwargs):
+        return submit(*args, **kwargs).result()
+
+    run.submit = submit
+    return run
+
+
+def _delete_product_safe(product_id):
+    """
+    inventory_crud.delete_product_safe on every shard, once no shard has
+    purchase lines or sales for the product.
+    """
+    refs = fan_out(_product_refs, product_id)
+    if not any(found for found, _, _ in refs.values()):
+        return {"error": f"ProductId {product_id} not found."}
+    inv_refs = sum(r[1] for r in refs.values())
+    sale_refs = sum(r[2] for r in refs.values())
+    if inv_refs > 0 or sale_refs > 0:
+        return {"error": f"Cannot delete ProductId {product_id}: referenced by invoices={inv_refs}, sales={sale_refs}."}
+    futures = {name: _submit_on(path, inventory_crud.delete_product_safe, product_id)
+               for name, path in _shard_map.shards.items() if refs[name][0]}
+    results = {name: future.result() for name, future in futures.items()}
+    # Each shard re-checks in its own transaction; report a shard that refused
+    for name, result in results.items():
+        if "error" in result:
+            return {"error": f"Shard '{name}': {result['error']}"}
+    return next(iter(results.values()))
+
+
+def _product_refs(product_id):
+    conn = get_connection(readonly=True)
+    try:
+        cur = conn.cursor(tuples=True)
+        found = cur.execute(sql.PRODUCT_EXISTS, (product_id,)).fetchone()[0] > 0
+        inv_refs = cur.execute(sql.INVOICE_LINE_REFS, (product_id,)).fetchone()[0]
+        sale_refs = cur.execute(sql.SALE_REFS, (product_id,)).fetchone()[0]
+    finally:
+        conn.close()
+    return found, inv_refs, sale_refs
+
+
+def _split_rows(rows):
+    """{shard path: [(original row number, row)]} by each row's store_id."""
+    parts = {}
+    for row_no, row in enumerate(rows):
+        store_id = row.get("store_id") if isinstance(row, dict) else None
+        parts.setdefault(_shard_map.path_of(store_id), []).append((row_no, row))
+    return parts
+
+
+def _bulk(mutation, rows, totals, failure, vendor_names=()):
+    """
+    Runs a bulk mutation per shard concurrently and merges the per-row
+    statuses. Each shard commits or rolls back on its own: when some fail,
+    their rows are reported as errors next to the rows the others committed
+    (and listed in failed_shards), so a retry can resend just those rows.
+    """
+    started = time.perf_counter()
+    rows = list(rows)
+    parts = _split_rows(rows)
+    names = {path: name for name, path in _shard_map.shards.items()}
+    results = _write_with_vendors({path: (mutation, ([row for _, row in part],)) for path, part in parts.items()},
+                                  vendor_names)
+    statuses = [None] * len(rows)
+    merged = dict.fromkeys(totals, 0)
+    failed = []
+    for path, result in results.items():
+        numbers = [row_no for row_no, _ in parts[path]]
+        if isinstance(result, Exception):
+            result = {"error": f"{failure}: {result}"}
+        if "error" in result:
+            failed.append({"shard": names[path], "error": result["error"]})
+            for row_no in numbers:
+                statuses[row_no] = {"row": row_no, "status": "error",
+                                    "error": f"Shard '{names[path]}': {result['error']}"}
+            continue
+        for status in result["rows"]:
+            status["row"] = numbers[status["row"]]
+            statuses[status["row"]] = status
+        for key in totals:
+            merged[key] += result[key]
+    if failed and len(failed) == len(results):
+        # Nothing committed anywhere
+        return {"error": f"{failure} on every shard: {'; '.join(f['shard'] + ': ' + f['error'] for f in failed)}"}
+
+    elapsed = time.perf_counter() - started
+    accepted = sum(1 for st in statuses if st["status"] != "error")
+    merged.update({"rows": statuses, "accepted": accepted, "rejected": len(statuses) - accepted,
+                   "elapsed_seconds": round(elapsed, 4),
+                   "rows_per_second": round(len(statuses) / elapsed, 1) if elapsed > 0 else None})
+    if failed:
+        merged["failed_shards"] = failed
+    if "cost_of_goods" in merged:
+        merged["cost_of_goods"] = round(merged["cost_of_goods"], 2)
+    return merged
+
+
+def _bulk_add_purchases(rows):
+    """inventory_crud.bulk_add_purchases split by shard (new vendors of rows it writes go to all shards)."""
+    rows = list(rows)
+    names = {str(r.get("vendor_name")).strip() for r in rows if isinstance(r, dict) and r.get("vendor_name")}
+    return _bulk(inventory_crud.bulk_add_purchases, rows, ("invoice_lines_inserted", "invoice_lines_updated"),
+                 "Bulk purchase load failed", names)
+
+
+def _bulk_record_sales(sales):
+    """inventory_crud.bulk_record_sales split by shard."""
+    return _bulk(inventory_crud.bulk_record_sales, sales, ("sales_inserted", "sales_updated", "cost_of_goods"),
+                 "Bulk sales load failed")
+
+
+# ---------- Fan-out reads ----------
+def _product_locations(product_name):
+    """inventory_crud.product_locations from every shard, in the single-database order."""
+    records = [r for part in fan_out(inventory_crud.product_locations, product_name).values() for r in part]
+    records.sort(key=lambda r: (r.City, r.Store, r.Size))
+    return tuple(records)
+
+
+def _read_product_across_locations(product_name):
+    return [r.as_dict() for r in _product_locations(product_name)]
+
+
+def _on_primary(fn):
+    """A read of replicated dimensions only; the primary shard answers it."""
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        return _on(_shard_map.primary_path, fn, *args, **kwargs)
+    return run
+
+
+# ---------- Public API (inventory_crud's functions when not sharded) ----------
+if _shard_map is None:
+    add_new_product_purchase = inventory_crud.add_new_product_purchase
+    update_existing_purchase = inventory_crud.update_existing_purchase
+    update_sales = inventory_crud.update_sales
+    delete_purchase_line = inventory_crud.delete_purchase_line
+    delete_product_safe = inventory_crud.delete_product_safe
+    bulk_add_purchases = inventory_crud.bulk_add_purchases
+    bulk_record_sales = inventory_crud.bulk_record_sales
+    product_locations = inventory_crud.product_locations
+    read_product_across_locations = inventory_crud.read_product_across_locations
+    search_products = inventory_crud.search_products
+    autocomplete_products = inventory_crud.autocomplete_products
+else:
+    add_new_product_purchase = _coordinated(_add_new_product_purchase)
+    update_existing_purchase = _coordinated(_update_existing_purchase)
+    update_sales = _sales_router()
+    delete_purchase_line = _routed(inventory_crud.delete_purchase_line)
+    delete_product_safe = _coordinated(_delete_product_safe)
+    bulk_add_purchases = _coordinated(_bulk_add_purchases)
+    bulk_record_sales = _coordinated(_bulk_record_sales)
+    product_locations = _product_locations
+    read_product_across_locations = _read_product_across_locations
+    search_products = _on_primary(inventory_crud.search_products)
+    autocomplete_products = _on_primary(inventory_crud.autocomplete_products)
+
+
+# ---------- Splitting an existing database ----------
+def split_database(source, shards):
+    """
+    Copies source into every shard file of a ShardMap and deletes, from each
+    copy, the transactional rows of stores placed on other shards.
+    Returns {shard name: number of stores kept}.
+    """
+    conn = sqlite3.connect(source)
+    placement = {}
+    for store_id, city in conn.execute("""
+        SELECT s.StoreId, c.CityName FROM Stores s LEFT JOIN Cities c ON s.CityId = c.CityId;
+    """):
+        placement.setdefault(shards.place(store_id, city), []).append(store_id)
+    conn.close()
+
+    kept = {}
+    for name, path in shards.shards.items():
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        with sqlite3.connect(source) as src, sqlite3.connect(path) as dst:
+            src.backup(dst)
+        conn = sqlite3.connect(path)
+        cur = conn.cursor()
+        cur.execute("CREATE TEMP TABLE KeepStores (StoreId INTEGER PRIMARY KEY);")
+        cur.executemany("INSERT INTO temp.KeepStores VALUES (?);", [(s,) for s in placement.get(name, [])])
+        gone = "StoreId NOT IN (SELECT StoreId FROM temp.KeepStores)"
+        for table in ["InvoiceLines"] + archive_tables(cur, "InvoiceLines"):
+            cur.execute(f"DELETE FROM {table} WHERE InvoiceId IN (SELECT InvoiceId FROM InvoicesAll WHERE {gone});")
+        for base in ("Invoices", "Sales"):
+            for table in [base] + archive_tables(cur, base):
+                cur.execute(f"DELETE FROM {table} WHERE {gone};")
+        for table in ("StockLevels", "SalesDaily"):
+            cur.execute(f"DELETE FROM {table} WHERE {gone};")
+        conn.commit()
+        conn.execute("VACUUM;")
+        conn.close()
+        kept[name] = len(placement.get(name, []))
+    return kept
+
+
+# ---------- CLI ----------
+if __name__ == "__main__":
+    # DB_SHARDS=shards.json python sharding.py split [path/to/inventory.db]
+    #        DB_SHARDS=shards.json python sharding.py show
+    command = sys.argv[1] if len(sys.argv) > 1 else "show"
+    if _shard_map is None or command not in ("split", "show"):
+        raise SystemExit("usage: DB_SHARDS=shards.json python sharding.py (split [db_path] | show)")
+    if command == "split":
+        source = sys.argv[2] if len(sys.argv) > 2 else "inventory.db"
+        for name, stores in split_database(source, _shard_map).items():
+            print(f"  {name}: {stores} stores -> {_shard_map.shards[name]}")
+    else:
+        print(f"Sharded by {_shard_map.by}; primary shard '{_shard_map.primary}'.")
+        for name, path in _shard_map.shards.items():
+            print(f"  {name}: {path}")
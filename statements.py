@@ -0,0 +1,91 @@
+# Statements run by the inventory_crud request paths, defined once.
+# sqlite3 keeps prepared statements per connection in an LRU keyed by the SQL
+# text (db_pool sizes it with DB_STATEMENT_CACHE); pooled connections live
+# for the whole process, so each statement here is compiled once per
+# connection and then only rebound. index_advisor checks these exact strings.
+
+# name -> (sql, sample params for index_advisor or None, allowed advisor findings)
+STATEMENTS = {}
+
+
+def statement(name, sql, sample=None, allow=()):
+    """Registers a statement (whitespace collapsed) and returns its SQL text."""
+    text = " ".join(sql.split())
+    STATEMENTS[name] = (text, sample, tuple(allow))
+    return text
+
+
+# ---------- Products / Vendors ----------
+PRODUCT_EXISTS = statement("product_by_id", "SELECT COUNT(*) FROM Products WHERE ProductId = ?;", (1,))
+PRODUCT_BY_ID = statement("product_row_by_id",
+                          "SELECT ProductId, ProductName, Size FROM Products WHERE ProductId = ?;", (1,))
+PRODUCT_IDS_BY_NAME = statement("product_ids_by_name",
+                                "SELECT ProductId FROM Products WHERE ProductName = ?;", ("X",))
+PRODUCT_INSERT = statement("product_insert", """
+    INSERT INTO Products (ProductId, Brand, ProductName, Size) VALUES (?, ?, ?, ?);
+""")
+PRODUCT_DELETE = statement("product_delete", "DELETE FROM Products WHERE ProductId = ?;", (1,))
+
+VENDOR_NAME = statement("vendor_by_number", "SELECT VendorName FROM Vendors WHERE VendorNumber = ?;", (1,))
+VENDOR_INSERT = statement("vendor_insert", "INSERT INTO Vendors (VendorName) VALUES (?);")
+VENDOR_INSERT_OR_IGNORE = statement("vendor_insert_or_ignore", """
+    INSERT OR IGNORE INTO Vendors (VendorNumber, VendorName) VALUES (?, ?);
+""")
+
+# ---------- Invoices / InvoiceLines ----------
+INVOICE_BY_KEY = statement("invoice_by_key", """
+    SELECT InvoiceId FROM Invoices
+    WHERE StoreId = ? AND VendorNumber = ? AND InvoiceDate = ?;
+""", (1, 1, "2016-01-01"))
+INVOICE_INSERT = statement("invoice_insert", """
+    INSERT INTO Invoices (StoreId, VendorNumber, InvoiceDate) VALUES (?, ?, ?);
+""")
+INVOICE_DELETE = statement("invoice_delete", "DELETE FROM Invoices WHERE InvoiceId = ?;", (1,))
+
+LATEST_PURCHASE_PRICE = statement("latest_purchase_price", """
+    SELECT CAST(PurchasePrice AS REAL) FROM InvoiceLines
+    WHERE ProductId = ? ORDER BY InvoiceLineId DESC LIMIT 1;
+""", (1,))
+INVOICE_LINE_BY_INVOICE_PRODUCT = statement("invoice_line_by_invoice_product", """
+    SELECT InvoiceLineId, Quantity, PurchasePrice, LineTotal FROM InvoiceLines
+    WHERE InvoiceId = ? AND ProductId = ?;
+""", (1, 1))
+INVOICE_LINE_INSERT = statement("invoice_line_insert", """
+    INSERT INTO InvoiceLines (InvoiceId, ProductId, PurchasePrice, Quantity, LineTotal)
+    VALUES (?, ?, ?, ?, ?);
+""")
+INVOICE_LINE_UPDATE = statement("invoice_line_update", """
+    UPDATE InvoiceLines SET Quantity = ?, PurchasePrice = ?, LineTotal = ?
+    WHERE InvoiceLineId = ?;
+""", (1, 1.0, 1.0, 1))
+INVOICE_LINE_DELETE = statement("invoice_line_delete", "DELETE FROM InvoiceLines WHERE InvoiceLineId = ?;", (1,))
+INVOICE_LINE_COUNT = statement("invoice_line_count", "SELECT COUNT(*) FROM InvoiceLines WHERE InvoiceId = ?;", (1,))
+INVOICE_LINE_REFS = statement("invoice_line_refs", "SELECT COUNT(*) FROM InvoiceLines WHERE ProductId = ?;", (1,))
+
+# ---------- Sales ----------
+LATEST_SALE_PRICE = statement("latest_sale_price", """
+    SELECT SalePrice FROM Sales WHERE ProductId = ? ORDER BY SaleId DESC LIMIT 1;
+""", (1,))
+SALE_BY_KEY = statement("sale_by_key", """
+    SELECT SaleId, Quantity, TotalAmount FROM Sales
+    WHERE StoreId = ? AND ProductId = ? AND SaleDate = ?;
+""", (1, 1, "2016-01-01"))
+SALE_INSERT = statement("sale_insert", """
+    INSERT INTO Sales (StoreId, ProductId, SaleDate, Quantity, SalePrice, TotalAmount)
+    VALUES (?, ?, ?, ?, ?, ?);
+""")
+SALE_UPDATE = statement("sale_update", """
+    UPDATE Sales SET Quantity = ?, SalePrice = ?, TotalAmount = ? WHERE SaleId = ?;
+""", (1, 1.0, 1.0, 1))
+SALE_REFS = statement("sale_refs", "SELECT COUNT(*) FROM Sales WHERE ProductId = ?;", (1,))
+
+# ---------- Reads ----------
+PRODUCT_LOCATIONS = statement("product_across_locations", """
+    SELECT s.StoreId, c.CityName, p.ProductName, p.Size, sl.Quantity
+    FROM Products p
+    JOIN StockLevels sl ON sl.ProductId = p.ProductId
+    JOIN Stores s ON sl.StoreId = s.StoreId
+    JOIN Cities c ON s.CityId = c.CityId
+    WHERE p.ProductName = ?
+    ORDER BY c.CityName, s.StoreId, p.Size;
+""", ("X",), allow=("temp_btree",))
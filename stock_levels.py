@@ -0,0 +1,155 @@
+import sqlite3
+import sys
+
+# StockLevels mirrors SUM(InvoiceLines.Quantity) per (store, product).
+# LineCount tracks how many invoice lines back the row, so a row exists
+# exactly when the store has purchase lines for the product (same rows the
+# old GROUP BY over InvoiceLines produced, including zero-stock ones).
+STOCK_LEVELS_DDL = """
+CREATE TABLE IF NOT EXISTS StockLevels (
+    StoreId    INTEGER NOT NULL,
+    ProductId  INTEGER NOT NULL,
+    Quantity   INTEGER NOT NULL DEFAULT 0,
+    LineCount  INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (StoreId, ProductId)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_stocklevels_product
+ON StockLevels (ProductId, StoreId);
+"""
+
+EXPECTED_LEVELS_SQL = """
+    SELECT i.StoreId, il.ProductId,
+           COALESCE(SUM(il.Quantity), 0) AS Quantity,
+           COUNT(*) AS LineCount
+    FROM InvoiceLines il
+    JOIN Invoices i ON il.InvoiceId = i.InvoiceId
+    GROUP BY i.StoreId, il.ProductId
+"""
+
+
+# ---------- Schema ----------
+def ensure_stock_levels(conn):
+    """
+    Creates StockLevels if missing and fills it from InvoiceLines the first time.
+    Returns True if the table was created.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'StockLevels';"
+    ).fetchone()
+    if exists:
+        return False
+    conn.executescript(STOCK_LEVELS_DDL)
+    rebuild_stock_levels(conn)
+    return True
+
+
+# ---------- Incremental maintenance (call inside the writer's transaction) ----------
+def adjust_stock(cur, store_id, product_id, quantity_delta, line_delta=0):
+    """
+    Applies a quantity (and line-count) change for one (store, product).
+    Drops the row once no invoice lines back it any more.
+    """
+    cur.execute("""
+        INSERT INTO StockLevels (StoreId, ProductId, Quantity, LineCount)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (StoreId, ProductId) DO UPDATE
+        SET Quantity = Quantity + excluded.Quantity,
+            LineCount = LineCount + excluded.LineCount;
+    """, (store_id, product_id, quantity_delta, line_delta))
+    if line_delta < 0:
+        cur.execute("DELETE FROM StockLevels WHERE StoreId = ? AND ProductId = ? AND LineCount <= 0;",
+                    (store_id, product_id))
+
+
+def adjust_stock_many(cur, deltas):
+    """
+    Batched adjust_stock: deltas is an iterable of
+    (store_id, product_id, quantity_delta, line_delta) tuples.
+    """
+    deltas = list(deltas)
+    cur.executemany("""
+        INSERT INTO StockLevels (StoreId, ProductId, Quantity, LineCount)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (StoreId, ProductId) DO UPDATE
+        SET Quantity = Quantity + excluded.Quantity,
+            LineCount = LineCount + excluded.LineCount;
+    """, deltas)
+    emptied = [(store_id, product_id) for store_id, product_id, _, line_delta in deltas if line_delta < 0]
+    if emptied:
+        cur.executemany("DELETE FROM StockLevels WHERE StoreId = ? AND ProductId = ? AND LineCount <= 0;",
+                        emptied)
+
+
+def get_stock(cur, store_id, product_id):
+    """Point lookup of on-hand quantity; 0 when the store never stocked it."""
+    cur.execute("SELECT Quantity FROM StockLevels WHERE StoreId = ? AND ProductId = ?;",
+                (store_id, product_id))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+# ---------- Rebuild / verify ----------
+def rebuild_stock_levels(conn):
+    """Recomputes StockLevels from InvoiceLines. Returns the number of rows written."""
+    cur = conn.cursor()
+    cur.execute("DELETE FROM StockLevels;")
+    cur.execute(f"""
+        INSERT INTO StockLevels (StoreId, ProductId, Quantity, LineCount)
+        {EXPECTED_LEVELS_SQL};
+    """)
+    count = cur.rowcount
+    conn.commit()
+    return count
+
+
+def verify_stock_levels(conn):
+    """
+    Compares StockLevels with a fresh SUM over InvoiceLines.
+    Returns a list of drifted rows: StoreId, ProductId, Expected, Actual.
+    """
+    cur = conn.cursor()
+    cur.execute(f"""
+        WITH expected AS ({EXPECTED_LEVELS_SQL})
+        SELECT e.StoreId, e.ProductId, e.Quantity AS Expected, sl.Quantity AS Actual
+        FROM expected e
+        LEFT JOIN StockLevels sl
+               ON sl.StoreId = e.StoreId AND sl.ProductId = e.ProductId
+        WHERE sl.Quantity IS NULL OR sl.Quantity != e.Quantity OR sl.LineCount != e.LineCount
+        UNION ALL
+        SELECT sl.StoreId, sl.ProductId, NULL AS Expected, sl.Quantity AS Actual
+        FROM StockLevels sl
+        WHERE NOT EXISTS (
+            SELECT 1 FROM InvoiceLines il
+            JOIN Invoices i ON il.InvoiceId = i.InvoiceId
+            WHERE i.StoreId = sl.StoreId AND il.ProductId = sl.ProductId
+        );
+    """)
+    return [
+        {"StoreId": store_id, "ProductId": product_id, "Expected": expected, "Actual": actual}
+        for store_id, product_id, expected, actual in cur.fetchall()
+    ]
+
+
+# ---------- CLI ----------
+if __name__ == "__main__":
+    # python stock_levels.py [verify|rebuild] [path/to/inventory.db]
+    command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+    db = sys.argv[2] if len(sys.argv) > 2 else "inventory.db"
+    if command not in ("verify", "rebuild"):
+        raise SystemExit("usage: python stock_levels.py [verify|rebuild] [db_path]")
+
+    conn = sqlite3.connect(db)
+    if ensure_stock_levels(conn):
+        print("StockLevels created and populated.")
+    if command == "rebuild":
+        print(f"StockLevels rebuilt: {rebuild_stock_levels(conn)} rows.")
+    else:
+        drift = verify_stock_levels(conn)
+        for d in drift:
+            print(f"  store={d['StoreId']} product={d['ProductId']} "
+                  f"expected={d['Expected']} actual={d['Actual']}")
+        print(f"{len(drift)} drifted rows.")
+        conn.close()
+        raise SystemExit(1 if drift else 0)
+    conn.close()
@@ -0,0 +1,190 @@
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+from etl import open_target
+from sales_rollup import rebuild_sales_daily
+from stock_levels import rebuild_stock_levels
+
+# Deterministic synthetic inventory for benchmarks: the same (lines, seed)
+# always produces the same database. Purchases are written straight into the
+# final tables; a share of each line is marked sold (Sales row + reduced
+# InvoiceLines.Quantity, as update_sales would leave it), then StockLevels
+# and SalesDaily are rebuilt once at the end.
+
+CITY_NAMES = [
+    "HARDERSFIELD", "BOLTON", "AYLESBURY", "BURNHAM", "CARDEND", "DONCASTER", "EANVERNESS",
+    "FURNESS", "GOULCREST", "HORNSEY", "IRVINE", "LEESIDE", "MOUNTMEND", "PAENTMARWY",
+    "SWORDBREAK", "TARMSWORTH", "WANBORNE", "ABERDEEN", "BALERNO", "CALDER",
+]
+ADJECTIVES = ["Old", "Royal", "Black", "Silver", "Golden", "Wild", "Smoky", "Crown", "Red", "Blue",
+              "Highland", "Coastal", "Barrel", "Reserve", "Estate", "Valley", "Stone", "River"]
+KINDS = ["Vodka", "Gin", "Rum", "Whiskey", "Bourbon", "Tequila", "Brandy", "Merlot", "Chardonnay",
+         "Cabernet", "Pinot Noir", "Syrah", "Riesling", "Prosecco", "Lager", "Porter"]
+SIZES = ["750mL", "1L", "1.75L", "375mL", "50mL", "1.5L"]
+BASE_DATE = datetime.date(2016, 1, 1)
+
+
+def default_scale(lines):
+    """Dimension sizes for a given number of invoice lines."""
+    return {
+        "cities": min(len(CITY_NAMES) * 10, max(5, lines // 20_000)),
+        "stores": min(5_000, max(10, lines // 5_000)),
+        "vendors": min(10_000, max(10, lines // 10_000)),
+        "products": min(500_000, max(100, lines // 50)),
+    }
+
+
+def _city_name(i):
+    base = CITY_NAMES[i % len(CITY_NAMES)]
+    return base if i < len(CITY_NAMES) else f"{base} {i // len(CITY_NAMES)}"
+
+
+def _product(product_id, vendors):
+    group, size_no = divmod(product_id - 1, 3)
+    name = f"{ADJECTIVES[group % len(ADJECTIVES)]} {KINDS[(group // len(ADJECTIVES)) % len(KINDS)]}"
+    series = group // (len(ADJECTIVES) * len(KINDS))
+    if series:
+        name += f" No.{series}"
+    brand = group % vendors + 1
+    return (product_id, brand, name, SIZES[(group + size_no) % len(SIZES)])
+
+
+def _remove_db(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def generate(db_path, lines=10_000, seed=42, lines_per_invoice=8, sold_share=0.5,
+             chunk=50_000, overwrite=False, progress=None, **scale):
+    """
+    Builds a synthetic database with `lines` InvoiceLines.
+    Dimension sizes default to default_scale(lines); pass cities=, stores=,
+    vendors= or products= to override. Returns a summary dict.
+    """
+    if os.path.exists(db_path):
+        if not overwrite:
+            raise FileExistsError(f"{db_path} exists; pass overwrite=True (--force) to replace it.")
+        _remove_db(db_path)
+    sizes = dict(default_scale(lines), **scale)
+    rng = random.Random(seed)
+    started = time.perf_counter()
+
+    conn = open_target(db_path)
+    cur = conn.cursor()
+    cur.executemany("INSERT INTO Cities (CityId, CityName) VALUES (?, ?);",
+                    [(i + 1, _city_name(i)) for i in range(sizes["cities"])])
+    cur.executemany("INSERT INTO Stores (StoreId, CityId) VALUES (?, ?);",
+                    [(s, rng.randint(1, sizes["cities"])) for s in range(1, sizes["stores"] + 1)])
+    cur.executemany("INSERT INTO Vendors (VendorNumber, VendorName) VALUES (?, ?);",
+                    [(v, f"VENDOR {v:05d} LLC") for v in range(1, sizes["vendors"] + 1)])
+    cur.executemany("INSERT INTO Products (ProductId, Brand, ProductName, Size) VALUES (?, ?, ?, ?);",
+                    [_product(p, sizes["vendors"]) for p in range(1, sizes["products"] + 1)])
+    conn.commit()
+
+    per_invoice = max(1, min(lines_per_invoice, sizes["products"]))
+    keys_per_day = sizes["stores"] * sizes["vendors"]
+    invoices, invoice_lines, sales = [], [], []
+    written = {"invoices": 0, "lines": 0, "sales": 0}
+
+    def flush():
+        cur.executemany("INSERT INTO Invoices (InvoiceId, StoreId, VendorNumber, InvoiceDate) VALUES (?, ?, ?, ?);",
+                        invoices)
+        cur.executemany("""
+            INSERT INTO InvoiceLines (InvoiceId, ProductId, InventoryId, PurchasePrice, Quantity, LineTotal)
+            VALUES (?, ?, ?, ?, ?, ?);
+        """, invoice_lines)
+        cur.executemany("""
+            INSERT INTO Sales (StoreId, ProductId, SaleDate, Quantity, SalePrice, TotalAmount)
+            VALUES (?, ?, ?, ?, ?, ?);
+        """, sales)
+        conn.commit()
+        written["invoices"] += len(invoices)
+        written["lines"] += len(invoice_lines)
+        written["sales"] += len(sales)
+        invoices.clear()
+        invoice_lines.clear()
+        sales.clear()
+        if progress:
+            progress(written["lines"], lines)
+
+    invoice_id = 0
+    remaining = lines
+    while remaining > 0:
+        # (StoreId, VendorNumber, InvoiceDate) is unique by construction
+        store_id = invoice_id % sizes["stores"] + 1
+        vendor = (invoice_id // sizes["stores"]) % sizes["vendors"] + 1
+        invoice_date = BASE_DATE + datetime.timedelta(days=invoice_id // keys_per_day)
+        invoice_id += 1
+        invoices.append((invoice_id, store_id, vendor, invoice_date.isoformat()))
+
+        for product_id in rng.sample(range(1, sizes["products"] + 1), min(per_invoice, remaining)):
+            price = round(rng.uniform(2, 60), 2)
+            bought = rng.randint(1, 48)
+            sold = int(bought * rng.random()) if rng.random() < sold_share else 0
+            left = bought - sold
+            invoice_lines.append((invoice_id, product_id, f"{store_id}_{product_id}",
+                                  price, left, round(price * left, 2)))
+            if sold:
+                sale_price = round(price * 1.4, 2)
+                sale_date = invoice_date + datetime.timedelta(days=rng.randint(1, 30))
+                sales.append((store_id, product_id, sale_date.isoformat(), sold,
+                              sale_price, round(sale_price * sold, 2)))
+            remaining -= 1
+
+        if len(invoice_lines) >= chunk:
+            flush()
+    flush()
+
+    stock_rows = rebuild_stock_levels(conn)
+    rebuild_sales_daily(conn)
+    conn.execute("ANALYZE;")
+    conn.commit()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    conn.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "db_path": db_path,
+        "seed": seed,
+        **sizes,
+        "invoices": written["invoices"],
+        "invoice_lines": written["lines"],
+        "sales": written["sales"],
+        "stock_levels": stock_rows,
+        "elapsed_seconds": round(elapsed, 2),
+        "db_size_bytes": os.path.getsize(db_path),
+    }
+
+
+def _print_progress(done, total):
+    print(f"\r[synthetic] {done}/{total} lines ({100.0 * done / total:5.1f}%)",
+          end="", file=sys.stderr, flush=True)
+
+
+# ---------- CLI ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic inventory database for benchmarks.")
+    parser.add_argument("db", help="database file to create")
+    parser.add_argument("--lines", type=int, default=10_000, help="number of InvoiceLines (10k .. 50M)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--lines-per-invoice", type=int, default=8)
+    parser.add_argument("--sold-share", type=float, default=0.5, help="share of lines with a sale")
+    for name in ("cities", "stores", "vendors", "products"):
+        parser.add_argument(f"--{name}", type=int, help=f"override the number of {name}")
+    parser.add_argument("--force", action="store_true", help="replace an existing database")
+    args = parser.parse_args(argv)
+
+    scale = {k: getattr(args, k) for k in ("cities", "stores", "vendors", "products") if getattr(args, k)}
+    summary = generate(args.db, args.lines, args.seed, args.lines_per_invoice, args.sold_share,
+                       overwrite=args.force, progress=_print_progress, **scale)
+    print(file=sys.stderr)
+    print(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# test_analytics.py
+# python -m pytest -q test_analytics.py
+import numpy as np
+import pytest
+
+import analytics
+import db_pool
+from db_pool import get_pool
+from test_stock_levels import db, source  # noqa: F401 (fixtures)
+
+
+def export_columns(db_path):
+    conn = get_pool(db_path).acquire(readonly=True)
+    try:
+        return analytics._columns(conn)
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("query_metrics", [False, True])
+def test_export_reads_plain_tuples(db, monkeypatch, query_metrics):
+    monkeypatch.setattr(db_pool, "QUERY_METRICS", query_metrics)
+    read_columns = analytics._read_columns
+
+    def checked(cur, query, columns):
+        # Rows come back as tuples, not sqlite3.Row, whether or not the cursor is instrumented
+        assert type(cur.execute("SELECT 1, 2;").fetchone()) is tuple
+        return read_columns(cur, query, columns)
+
+    monkeypatch.setattr(analytics, "_read_columns", checked)
+    columns, change_seq = export_columns(db)
+    monkeypatch.undo()
+
+    expected, expected_seq = export_columns(db)
+    assert change_seq == expected_seq
+    assert columns.keys() == expected.keys()
+    for name, values in expected.items():
+        np.testing.assert_array_equal(columns[name], values, err_msg=name)
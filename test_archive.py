@@ -0,0 +1,165 @@
+# test_archive.py
+# python -m pytest -q test_archive.py
+import sqlite3
+
+import pytest
+
+import inventory_crud
+from archive import archive_before
+from etl import open_target, run_load
+from sales_rollup import verify_sales_daily
+from stock_levels import verify_stock_levels
+from test_stock_levels import db, source  # noqa: F401 (fixtures)
+
+CUTOFF = "2016-12-31"
+
+
+def query(db_path, sql, params=()):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def sell_out_first_invoice(db_path):
+    """Sells all stock of the first invoice's products at its store, which depletes every lot on it (FIFO)."""
+    for city, store_id, product_name, size, stock in query(db_path, """
+        SELECT c.CityName, i.StoreId, p.ProductName, p.Size, sl.Quantity
+        FROM InvoiceLines il JOIN Invoices i USING (InvoiceId) JOIN Products p USING (ProductId)
+        JOIN Stores s ON s.StoreId = i.StoreId JOIN Cities c USING (CityId)
+        JOIN StockLevels sl ON sl.StoreId = i.StoreId AND sl.ProductId = il.ProductId
+        WHERE il.InvoiceId = (SELECT MIN(InvoiceId) FROM Invoices) AND sl.Quantity > 0;
+    """):
+        inventory_crud.update_sales(city, store_id, product_name, size, "2016-06-01", stock, 10.0)
+
+
+@pytest.fixture
+def archived(db):
+    """The test database with every depleted line, emptied invoice and sale before CUTOFF archived."""
+    sell_out_first_invoice(db)
+    totals = archive_before(CUTOFF, batch=500)
+    assert totals["invoices"] > 0 and totals["sales"] > 0
+    return db
+
+
+def archived_invoice(db_path):
+    """(InvoiceId, city, store, vendor name, date) of an archived invoice header."""
+    table = query(db_path, "SELECT name FROM sqlite_master WHERE name GLOB 'Invoices_Archive_*';")[0][0]
+    return query(db_path, f"""
+        SELECT a.InvoiceId, c.CityName, a.StoreId, v.VendorName, a.InvoiceDate
+        FROM {table} a JOIN Vendors v USING (VendorNumber)
+        JOIN Stores s USING (StoreId) JOIN Cities c USING (CityId)
+        ORDER BY a.InvoiceId LIMIT 1;
+    """)[0]
+
+
+def archived_sale(db_path):
+    """(city, store, product name, size, date) of an archived sale the store still has stock for."""
+    table = query(db_path, "SELECT name FROM sqlite_master WHERE name GLOB 'Sales_Archive_*';")[0][0]
+    return query(db_path, f"""
+        SELECT c.CityName, a.StoreId, p.ProductName, p.Size, a.SaleDate
+        FROM {table} a JOIN Products p USING (ProductId)
+        JOIN Stores s USING (StoreId) JOIN Cities c USING (CityId)
+        JOIN StockLevels sl ON sl.StoreId = a.StoreId AND sl.ProductId = a.ProductId
+        WHERE sl.Quantity >= 3
+        ORDER BY a.SaleId LIMIT 1;
+    """)[0]
+
+
+def some_product(db_path):
+    return query(db_path, "SELECT ProductName, Size FROM Products ORDER BY ProductId LIMIT 1;")[0]
+
+
+def invoices_for(db_path, store_id, vendor_name, invoice_date):
+    return query(db_path, """
+        SELECT i.InvoiceId FROM InvoicesAll i JOIN Vendors v USING (VendorNumber)
+        WHERE i.StoreId = ? AND v.VendorName = ? AND i.InvoiceDate = ?;
+    """, (store_id, vendor_name, invoice_date))
+
+
+def sales_for(db_path, store_id, product_name, size, sale_date):
+    return query(db_path, """
+        SELECT sa.Quantity FROM SalesAll sa JOIN Products p USING (ProductId)
+        WHERE sa.StoreId = ? AND p.ProductName = ? AND p.Size = ? AND sa.SaleDate = ?;
+    """, (store_id, product_name, size, sale_date))
+
+
+def no_drift(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return verify_stock_levels(conn) == [] and verify_sales_daily(conn) == []
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("bulk", [False, True])
+def test_purchase_on_archived_invoice_reuses_it(archived, bulk):
+    invoice_id, city, store_id, vendor_name, invoice_date = archived_invoice(archived)
+    product_name, size = some_product(archived)
+    if bulk:
+        result = inventory_crud.bulk_add_purchases([{
+            "city": city, "store_id": store_id, "vendor_name": vendor_name, "product_name": product_name,
+            "size": size, "invoice_date": invoice_date, "quantity": 2, "purchase_price": 3.0}])
+        assert result["rows"][0]["InvoiceId"] == invoice_id
+    else:
+        result = inventory_crud.update_existing_purchase(city, store_id, vendor_name, product_name, size,
+                                                         invoice_date, 2, 3.0)
+        assert "error" not in result
+    assert invoices_for(archived, store_id, vendor_name, invoice_date) == [(invoice_id,)]
+    assert no_drift(archived)
+
+
+def test_new_product_on_archived_invoice_reuses_it(archived):
+    invoice_id, _, store_id, vendor_name, invoice_date = archived_invoice(archived)
+    (vendor_number,), = query(archived, "SELECT VendorNumber FROM Vendors WHERE VendorName = ?;", (vendor_name,))
+    result = inventory_crud.add_new_product_purchase(store_id, 990001, "Test Gin", "1L", vendor_number,
+                                                     vendor_name, invoice_date, 9.5, 4)
+    assert "error" not in result
+    assert invoices_for(archived, store_id, vendor_name, invoice_date) == [(invoice_id,)]
+
+
+@pytest.mark.parametrize("bulk", [False, True])
+def test_sale_on_archived_day_adds_to_it(archived, bulk):
+    city, store_id, product_name, size, sale_date = archived_sale(archived)
+    (before,), = sales_for(archived, store_id, product_name, size, sale_date)
+    if bulk:
+        result = inventory_crud.bulk_record_sales([{
+            "city": city, "store_id": store_id, "product_name": product_name, "size": size,
+            "sale_date": sale_date, "quantity": 2, "sale_price": 10.0}])
+        assert result["sales_updated"] == 1
+    else:
+        result = inventory_crud.update_sales(city, store_id, product_name, size, sale_date, 2, 10.0)
+        assert "error" not in result
+    assert sales_for(archived, store_id, product_name, size, sale_date) == [(before + 2,)]
+    assert no_drift(archived)
+
+    # The restored row goes back to the archive on the next run, still once
+    archive_before(CUTOFF, batch=500)
+    assert sales_for(archived, store_id, product_name, size, sale_date) == [(before + 2,)]
+    assert query(archived, "SELECT COUNT(*) FROM Sales WHERE SaleDate < ?;", (CUTOFF,)) == [(0,)]
+
+
+def test_delta_load_skips_archived_lines(archived):
+    table = query(archived, "SELECT name FROM sqlite_master WHERE name GLOB 'InvoiceLines_Archive_*';")[0][0]
+    (inventory_id, store_id, city, brand, product_name, size, vendor_number, vendor_name,
+     invoice_date, price), = query(archived, f"""
+        SELECT a.InventoryId, i.StoreId, c.CityName, p.Brand, p.ProductName, p.Size, v.VendorNumber,
+               v.VendorName, i.InvoiceDate, a.PurchasePrice
+        FROM {table} a JOIN InvoicesAll i USING (InvoiceId) JOIN Products p USING (ProductId)
+        JOIN Vendors v ON v.VendorNumber = i.VendorNumber
+        JOIN Stores s ON s.StoreId = i.StoreId JOIN Cities c USING (CityId)
+        WHERE a.InventoryId IS NOT NULL
+        ORDER BY a.InvoiceLineId LIMIT 1;
+    """)
+    record = {"InventoryId": inventory_id, "Store": store_id, "City": city, "Brand": brand,
+              "ProductName": product_name, "Size": size, "VendorNumber": vendor_number,
+              "VendorName": vendor_name, "InvoiceDate": invoice_date, "PurchasePrice": price, "Quantity": 5}
+    target = open_target(archived)
+    try:
+        result = run_load(target, [(1, record)], "test_archive", delta=True)
+    finally:
+        target.close()
+    assert (result["rows_loaded"], result["rows_already_loaded"]) == (0, 1)
+    assert len(invoices_for(archived, store_id, vendor_name, invoice_date)) == 1
+    assert no_drift(archived)
@@ -0,0 +1,55 @@
+# test_asgi.py
+# python -m pytest -q test_asgi.py
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("a2wsgi")
+
+from asgi import application, make_application
+
+
+def slow_wsgi_app(environ, start_response):
+    time.sleep(0.5)
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [b"done"]
+
+
+async def call(app, path="/"):
+    """One HTTP GET through an ASGI app; returns (status, body)."""
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+             "headers": [(b"host", b"test")], "client": ("127.0.0.1", 1), "server": ("test", 80)}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    status = next(m["status"] for m in sent if m["type"] == "http.response.start")
+    body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return status, body
+
+
+async def call_many(app, n):
+    return await asyncio.gather(*(call(app) for _ in range(n)))
+
+
+def test_concurrent_requests_overlap():
+    app = make_application(slow_wsgi_app, threads=4)
+    started = time.perf_counter()
+    results = asyncio.run(call_many(app, 4))
+    elapsed = time.perf_counter() - started
+    assert results == [(200, b"done")] * 4
+    # Four 0.5 s requests in sequence would take 2 s
+    assert elapsed < 1.2
+
+
+def test_flask_app_is_served():
+    status, body = asyncio.run(call(application, "/purchase"))
+    assert status == 200
+    assert b"<form" in body
@@ -0,0 +1,139 @@
+# test_bulk_purchases.py
+# python -m pytest -q test_bulk_purchases.py
+import io
+import json
+import sqlite3
+
+import pytest
+
+import inventory_crud
+from app import app
+from test_stock_levels import db, purchase_row, source, stocked_line  # noqa: F401 (fixtures)
+
+
+def query(db_path, sql, params=()):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def stock(db_path, r):
+    return query(db_path, """
+        SELECT sl.Quantity FROM StockLevels sl JOIN Products p USING (ProductId)
+        WHERE sl.StoreId = ? AND p.ProductName = ? AND p.Size = ?;
+    """, (r["store_id"], r["product_name"], r["size"]))[0][0]
+
+
+def line_quantity(db_path, r, invoice_date):
+    rows = query(db_path, """
+        SELECT il.Quantity FROM InvoiceLines il
+        JOIN Invoices i USING (InvoiceId) JOIN Vendors v USING (VendorNumber)
+        JOIN Products p USING (ProductId)
+        WHERE i.StoreId = ? AND v.VendorName = ? AND i.InvoiceDate = ? AND p.ProductName = ? AND p.Size = ?;
+    """, (r["store_id"], r["vendor_name"], invoice_date, r["product_name"], r["size"]))
+    return rows[0][0] if rows else None
+
+
+def counts(db_path):
+    return {t: query(db_path, f"SELECT COUNT(*) FROM {t};")[0][0]
+            for t in ("Vendors", "Invoices", "InvoiceLines", "ChangeLog")}
+
+
+def mixed_rows(r):
+    """Good rows for a new and an existing invoice line, between rows that must each be rejected."""
+    return [
+        purchase_row(r),                                           # 0 new line
+        purchase_row(r, quantity="0"),                             # 1 bad quantity
+        purchase_row(r, quantity=2),                               # 2 merged into row 0's line
+        purchase_row(r, city="Nowhere"),                           # 3 unknown city
+        purchase_row(r, store_id=99999),                           # 4 unknown store
+        purchase_row(r, product_name="No such product"),           # 5 unknown product
+        {k: v for k, v in purchase_row(r).items() if k != "size"},  # 6 missing field
+        purchase_row(r, invoice_date=r["invoice_date"], quantity=4),  # 7 existing line
+    ]
+
+
+def test_mixed_rows_are_accepted_or_rejected_one_by_one(db):
+    r = stocked_line(db)
+    stock_before = stock(db, r)
+    line_before = line_quantity(db, r, r["invoice_date"])
+
+    result = inventory_crud.bulk_add_purchases(mixed_rows(r))
+    assert [row["status"] for row in result["rows"]] == [
+        "inserted", "error", "inserted", "error", "error", "error", "error", "updated"]
+    assert "positive" in result["rows"][1]["error"]
+    assert "Nowhere" in result["rows"][3]["error"]
+    assert "99999" in result["rows"][4]["error"]
+    assert "No such product" in result["rows"][5]["error"]
+    assert "size" in result["rows"][6]["error"]
+    assert (result["accepted"], result["rejected"]) == (3, 5)
+    assert (result["invoice_lines_inserted"], result["invoice_lines_updated"]) == (1, 1)
+
+    assert line_quantity(db, r, "2017-01-05") == 5
+    assert line_quantity(db, r, r["invoice_date"]) == line_before + 4
+    assert stock(db, r) == stock_before + 9
+
+
+def test_failure_mid_load_rolls_back_the_whole_batch(db):
+    r = stocked_line(db)
+    conn = sqlite3.connect(db)
+    conn.execute("""
+        CREATE TRIGGER fail_lines BEFORE INSERT ON InvoiceLines
+        WHEN NEW.Quantity = 7 BEGIN SELECT RAISE(ABORT, 'disk full'); END;
+    """)
+    conn.commit()
+    conn.close()
+    stock_before, counts_before = stock(db, r), counts(db)
+
+    # A new vendor and a merged line come before the failing insert; neither stays
+    result = inventory_crud.bulk_add_purchases([
+        purchase_row(r, vendor_name="Brand New Vendor", quantity=7),
+        purchase_row(r, invoice_date=r["invoice_date"], quantity=1),
+    ])
+    assert result == {"error": "Bulk purchase load failed and was rolled back: disk full"}
+    assert counts(db) == counts_before
+    assert stock(db, r) == stock_before
+
+    # The staging tables hold nothing over: the next load sees only its own rows
+    result = inventory_crud.bulk_add_purchases([purchase_row(r, quantity=2)])
+    assert [row["status"] for row in result["rows"]] == ["inserted"]
+    assert stock(db, r) == stock_before + 2
+
+
+# ---------- Upload parsing (app._read_records) ----------
+def as_csv(rows):
+    fields = list(rows[0])
+    lines = [",".join(fields)] + [",".join(str(row.get(f, "")) for f in fields) for row in rows]
+    return "\n".join(lines) + "\n"
+
+
+@pytest.mark.parametrize("fmt", ["csv", "csv_file", "json", "ndjson", "format_arg"])
+def test_upload_formats(db, fmt):
+    r = stocked_line(db)
+    rows = [purchase_row(r), purchase_row(r, product_name="No such product")]
+    client = app.test_client()
+    if fmt == "csv":
+        response = client.post("/purchase/bulk", data=as_csv(rows), content_type="text/csv")
+    elif fmt == "csv_file":
+        # Excel-style byte order mark included
+        upload = (io.BytesIO(b"\xef\xbb\xbf" + as_csv(rows).encode()), "feed.csv")
+        response = client.post("/purchase/bulk", data={"file": upload}, content_type="multipart/form-data")
+    elif fmt == "json":
+        response = client.post("/purchase/bulk", data=json.dumps(rows), content_type="application/json")
+    elif fmt == "ndjson":
+        body = "\n".join(json.dumps(row) for row in rows) + "\n\n"
+        response = client.post("/purchase/bulk", data=body, content_type="application/x-ndjson")
+    else:
+        response = client.post("/purchase/bulk?format=csv", data=as_csv(rows), content_type="text/plain")
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert [row["status"] for row in payload["rows"]] == ["inserted", "error"]
+    assert line_quantity(db, r, "2017-01-05") == 3
+
+
+def test_unparseable_upload_is_rejected(db):
+    response = app.test_client().post("/purchase/bulk", data="[{not json", content_type="application/json")
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Could not parse upload")
@@ -0,0 +1,103 @@
+# test_bulk_sales.py
+# python -m pytest -q test_bulk_sales.py
+import json
+import sqlite3
+
+import pytest
+
+import inventory_crud
+from app import app
+from test_bulk_purchases import as_csv, query, stock
+from test_stock_levels import db, sale_row, source, stocked_line  # noqa: F401 (fixtures)
+
+
+def sale_quantity(db_path, r, sale_date):
+    rows = query(db_path, """
+        SELECT sa.Quantity FROM Sales sa JOIN Products p USING (ProductId)
+        WHERE sa.StoreId = ? AND sa.SaleDate = ? AND p.ProductName = ? AND p.Size = ?;
+    """, (r["store_id"], sale_date, r["product_name"], r["size"]))
+    return rows[0][0] if rows else None
+
+
+def counts(db_path):
+    totals = {t: query(db_path, f"SELECT COUNT(*) FROM {t};")[0][0] for t in ("Sales", "SalesDaily", "ChangeLog")}
+    # FIFO depletion draws down the purchase lots
+    totals["lots"] = query(db_path, "SELECT SUM(Quantity) FROM InvoiceLines;")[0][0]
+    return totals
+
+
+def test_mixed_rows_are_accepted_or_rejected_one_by_one(db):
+    r = stocked_line(db)
+    on_hand = stock(db, r)
+    result = inventory_crud.bulk_record_sales([
+        sale_row(r),                                   # 0 recorded
+        sale_row(r, quantity=-1),                      # 1 bad quantity
+        sale_row(r, city="Nowhere"),                   # 2 unknown city
+        sale_row(r, store_id=99999),                   # 3 unknown store
+        sale_row(r, size="no size"),                   # 4 unknown product
+        sale_row(r, quantity=on_hand),                 # 5 more than is left after row 0
+        sale_row(r, quantity=on_hand - 2),             # 6 same day as row 0: one Sales row
+        sale_row(r, sale_date="2017-01-07"),           # 7 takes the last unit
+        sale_row(r, sale_date="2017-01-08"),           # 8 nothing left
+    ])
+    assert [row["status"] for row in result["rows"]] == [
+        "recorded", "error", "error", "error", "error", "error", "recorded", "recorded", "error"]
+    assert "positive" in result["rows"][1]["error"]
+    assert "Nowhere" in result["rows"][2]["error"]
+    assert "99999" in result["rows"][3]["error"]
+    assert "not found" in result["rows"][4]["error"]
+    assert result["rows"][5]["error"] == f"Not enough stock. Available: {on_hand - 1}, Requested: {on_hand}"
+    assert result["rows"][8]["error"] == "Not enough stock. Available: 0, Requested: 1"
+    assert (result["accepted"], result["rejected"]) == (3, 6)
+    assert (result["sales_inserted"], result["sales_updated"]) == (2, 0)
+
+    assert sale_quantity(db, r, "2017-01-06") == on_hand - 1
+    assert sale_quantity(db, r, "2017-01-07") == 1
+    assert sale_quantity(db, r, "2017-01-08") is None
+    assert stock(db, r) == 0
+
+    # A later batch for a day already recorded adds to its Sales row
+    inventory_crud.update_existing_purchase(r["city"], r["store_id"], r["vendor_name"], r["product_name"],
+                                            r["size"], "2017-01-09", 5, 4.0)
+    result = inventory_crud.bulk_record_sales([sale_row(r, quantity=2)])
+    assert (result["sales_inserted"], result["sales_updated"]) == (0, 1)
+    assert sale_quantity(db, r, "2017-01-06") == on_hand + 1
+    assert stock(db, r) == 3
+
+
+def test_failure_mid_load_rolls_back_the_whole_batch(db):
+    r = stocked_line(db)
+    conn = sqlite3.connect(db)
+    conn.execute("""
+        CREATE TRIGGER fail_sales BEFORE INSERT ON Sales
+        WHEN NEW.SaleDate = '2017-01-07' BEGIN SELECT RAISE(ABORT, 'disk full'); END;
+    """)
+    conn.commit()
+    conn.close()
+    stock_before, counts_before = stock(db, r), counts(db)
+
+    result = inventory_crud.bulk_record_sales([sale_row(r), sale_row(r, sale_date="2017-01-07")])
+    assert result == {"error": "Bulk sales load failed and was rolled back: disk full"}
+    assert counts(db) == counts_before
+    assert stock(db, r) == stock_before
+
+    # The staging tables hold nothing over: the next load sees only its own rows
+    result = inventory_crud.bulk_record_sales([sale_row(r, quantity=2)])
+    assert [row["status"] for row in result["rows"]] == ["recorded"]
+    assert sale_quantity(db, r, "2017-01-06") == 2
+    assert stock(db, r) == stock_before - 2
+
+
+@pytest.mark.parametrize("content_type, encode", [
+    ("text/csv", as_csv),
+    ("application/json", json.dumps),
+    ("application/x-ndjson", lambda rows: "\n".join(json.dumps(row) for row in rows)),
+])
+def test_upload_formats(db, content_type, encode):
+    r = stocked_line(db)
+    # An empty sale_price falls back to the latest price for the product
+    rows = [sale_row(r, sale_price=""), sale_row(r, store_id=99999)]
+    response = app.test_client().post("/sale/bulk", data=encode(rows), content_type=content_type)
+    assert response.status_code == 200
+    assert [row["status"] for row in response.get_json()["rows"]] == ["recorded", "error"]
+    assert sale_quantity(db, r, "2017-01-06") == 1
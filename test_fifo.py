@@ -0,0 +1,71 @@
+# test_fifo.py
+# python -m pytest -q test_fifo.py
+import sqlite3
+
+import pytest
+
+from fifo import cost_of_goods, deplete_fifo, ensure_fifo_index
+
+SCHEMA = """
+CREATE TABLE Invoices (
+    InvoiceId     INTEGER PRIMARY KEY AUTOINCREMENT,
+    StoreId       INTEGER NOT NULL,
+    VendorNumber  INTEGER NOT NULL,
+    InvoiceDate   DATE NOT NULL
+);
+
+CREATE TABLE InvoiceLines (
+    InvoiceLineId  INTEGER PRIMARY KEY AUTOINCREMENT,
+    InvoiceId      INTEGER NOT NULL,
+    ProductId      INTEGER NOT NULL,
+    InventoryId    TEXT,
+    PurchasePrice  NUMERIC NOT NULL,
+    Quantity       INTEGER NOT NULL,
+    LineTotal      NUMERIC NOT NULL
+);
+"""
+
+
+@pytest.fixture
+def conn():
+    # Pooled connections hand out sqlite3.Row rows, so the tests do too
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    ensure_fifo_index(conn)
+    lots = [
+        # (store, date, product, price, quantity): store 1 has two lots of product 7
+        (1, "2024-01-01", 7, 10.0, 3),
+        (2, "2024-01-02", 7, 99.0, 50),
+        (1, "2024-01-03", 7, 12.0, 5),
+    ]
+    for store_id, day, product_id, price, quantity in lots:
+        cur = conn.execute("INSERT INTO Invoices (StoreId, VendorNumber, InvoiceDate) VALUES (?, 1, ?);",
+                           (store_id, day))
+        conn.execute("INSERT INTO InvoiceLines (InvoiceId, ProductId, PurchasePrice, Quantity, LineTotal) "
+                     "VALUES (?, ?, ?, ?, ?);", (cur.lastrowid, product_id, price, quantity, price * quantity))
+    yield conn
+    conn.close()
+
+
+def quantities(conn):
+    return [row[0] for row in conn.execute("SELECT Quantity FROM InvoiceLines ORDER BY InvoiceLineId;")]
+
+
+def test_sale_within_one_lot(conn):
+    lots = deplete_fifo(conn.cursor(), 1, 7, 2)
+    assert [(lot["InvoiceLineId"], lot["QuantityTaken"], lot["QuantityLeft"]) for lot in lots] == [(1, 2, 1)]
+    assert quantities(conn) == [1, 50, 5]
+
+
+def test_sale_across_two_lots(conn):
+    lots = deplete_fifo(conn.cursor(), 1, 7, 6)
+    # Oldest lot first, and only the selling store's lots
+    assert [(lot["InvoiceLineId"], lot["QuantityTaken"], lot["QuantityLeft"]) for lot in lots] == [(1, 3, 0), (3, 3, 2)]
+    assert cost_of_goods(lots) == 66.0
+    assert quantities(conn) == [0, 50, 2]
+
+    # The emptied lot drops out of the open-lot index on the next sale
+    lots = deplete_fifo(conn.cursor(), 1, 7, 2)
+    assert [(lot["InvoiceLineId"], lot["QuantityTaken"]) for lot in lots] == [(3, 2)]
+    assert quantities(conn) == [0, 50, 0]
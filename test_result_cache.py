@@ -0,0 +1,110 @@
+# test_result_cache.py
+# python -m pytest -q test_result_cache.py
+import sqlite3
+
+import pytest
+
+import inventory_crud
+import result_cache
+from archive import archive_before
+from etl import open_target, run_load
+from result_cache import ProductResultCache, SharedGenerations
+from test_stock_levels import db, source, stocked_line  # noqa: F401 (fixtures)
+
+
+@pytest.fixture(params=["local", "shared"])
+def cache(db, request, monkeypatch):
+    """The result cache of the test database, with per-process or memory-mapped counters."""
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_SHARED", request.param == "shared")
+    result_cache._caches.pop(db, None)
+    yield inventory_crud.result_cache()
+    result_cache._caches.pop(db, None)
+
+
+def query(db_path, sql, params=()):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def stocked_quantity(product_name, store_id):
+    return sum(r.Quantity for r in inventory_crud.product_locations(product_name) if r.Store == store_id)
+
+
+def warm(cache, product_name):
+    """Caches the product's locations and checks the next lookup is served from the cache."""
+    first = inventory_crud.product_locations(product_name)
+    hits = cache.hits
+    assert inventory_crud.product_locations(product_name) is first
+    assert cache.hits == hits + 1
+    return first
+
+
+def other_worker(db_path, product_name):
+    """A second process's cache over the same counter file, holding its own copy of the entry."""
+    other = ProductResultCache(generations=SharedGenerations(db_path + "-cachegen"))
+    product_ids = [pid for (pid,) in query(db_path, "SELECT ProductId FROM Products WHERE ProductName = ?;",
+                                           (product_name,))]
+    other.put(product_name, other.stamp(product_name, product_ids), ["cached"])
+    assert other.get(product_name) == ("cached",)
+    return other
+
+
+def assert_invalidated(cache, product_name, before, other=None):
+    stale = cache.stale
+    after = inventory_crud.product_locations(product_name)
+    assert cache.stale == stale + 1
+    assert after is not before
+    if other is not None:
+        assert other.get(product_name) is None
+
+
+def test_write_invalidates_cached_locations(db, cache):
+    r = stocked_line(db)
+    before = warm(cache, r["product_name"])
+    other = other_worker(db, r["product_name"]) if cache.generations.shared else None
+    quantity = stocked_quantity(r["product_name"], r["store_id"])
+
+    inventory_crud.update_existing_purchase(r["city"], r["store_id"], r["vendor_name"], r["product_name"],
+                                            r["size"], "2017-01-02", 5, 4.0)
+    assert_invalidated(cache, r["product_name"], before, other)
+    assert stocked_quantity(r["product_name"], r["store_id"]) == quantity + 5
+
+
+def test_etl_chunk_invalidates_cached_locations(db, cache):
+    r = stocked_line(db)
+    before = warm(cache, r["product_name"])
+    other = other_worker(db, r["product_name"]) if cache.generations.shared else None
+    quantity = stocked_quantity(r["product_name"], r["store_id"])
+    (brand, vendor_number), = query(db, """
+        SELECT p.Brand, v.VendorNumber FROM Products p, Vendors v
+        WHERE p.ProductName = ? AND p.Size = ? AND v.VendorName = ?;
+    """, (r["product_name"], r["size"], r["vendor_name"]))
+    record = {"InventoryId": "test-1", "Store": r["store_id"], "City": r["city"], "Brand": brand,
+              "ProductName": r["product_name"], "Size": r["size"],
+              "VendorNumber": vendor_number, "VendorName": r["vendor_name"], "InvoiceDate": "2017-01-02",
+              "PurchasePrice": "4.00", "Quantity": "6"}
+
+    # The load writes the database directly, not through the write queue
+    target = open_target(db)
+    try:
+        assert run_load(target, [(1, record)], "test_result_cache")["rows_loaded"] == 1
+    finally:
+        target.close()
+    assert_invalidated(cache, r["product_name"], before, other)
+    assert stocked_quantity(r["product_name"], r["store_id"]) == quantity + 6
+
+
+def test_archive_run_invalidates_cached_locations(db, cache):
+    cutoff = "2016-01-20"
+    (product_name,), = query(db, """
+        SELECT p.ProductName FROM Sales s JOIN Products p USING (ProductId)
+        WHERE s.SaleDate < ? ORDER BY s.SaleId LIMIT 1;
+    """, (cutoff,))
+    before = warm(cache, product_name)
+    other = other_worker(db, product_name) if cache.generations.shared else None
+
+    assert archive_before(cutoff, batch=50)["sales"] > 0
+    assert_invalidated(cache, product_name, before, other)
@@ -0,0 +1,68 @@
+# test_sales_daily.py
+# python -m pytest -q test_sales_daily.py
+import sqlite3
+
+import pytest
+
+import inventory_crud
+from archive import archive_before
+from sales_rollup import verify_sales_daily
+from test_stock_levels import db, sale_row, source, stocked_line  # noqa: F401 (fixtures)
+
+
+def drift(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return verify_sales_daily(conn)
+    finally:
+        conn.close()
+
+
+def day_row(db_path, r, sale_date):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("""
+            SELECT d.Quantity, d.Revenue FROM SalesDaily d JOIN Products p USING (ProductId)
+            WHERE d.SaleDate = ? AND d.StoreId = ? AND p.ProductName = ? AND p.Size = ?;
+        """, (sale_date, r["store_id"], r["product_name"], r["size"])).fetchone()
+    finally:
+        conn.close()
+
+
+def sell(r, sale_date, quantity, sale_price=10.0):
+    return inventory_crud.update_sales(
+        r["city"], r["store_id"], r["product_name"], r["size"], sale_date, quantity, sale_price)
+
+
+# name -> mutation(r) over the stocked line r; each must leave SalesDaily exact
+MUTATIONS = {
+    "new_sale": lambda r: sell(r, "2017-01-03", 1),
+    # Same sale key twice: the second call adds to the first
+    "repeated_sale": lambda r: (sell(r, "2017-01-04", 1), sell(r, "2017-01-04", 2, 12.5)),
+    "rejected_sale": lambda r: sell(r, "2017-01-05", r["stock"] + 1),
+    "bulk_sales": lambda r: inventory_crud.bulk_record_sales([
+        sale_row(r), sale_row(r, quantity=2, sale_price=11.0), sale_row(r, sale_date="2017-01-07"),
+        sale_row(r, quantity=r["stock"] + 1), sale_row(r, size="no size"),
+    ]),
+    "archive": lambda r: archive_before("2016-01-20", batch=50),
+}
+
+
+@pytest.mark.parametrize("name", MUTATIONS)
+def test_mutation_keeps_sales_daily_exact(db, name):
+    assert drift(db) == []
+    MUTATIONS[name](stocked_line(db))
+    assert drift(db) == []
+
+
+def test_repeated_and_bulk_sales_add_up_in_one_day_row(db):
+    r = stocked_line(db)
+    MUTATIONS["repeated_sale"](r)
+    # The sale row keeps the latest price for its whole quantity, and so does the day row
+    assert day_row(db, r, "2017-01-04") == (3, pytest.approx(37.5))
+    inventory_crud.bulk_record_sales([sale_row(r), sale_row(r, quantity=2, sale_price=11.0)])
+    assert day_row(db, r, "2017-01-06")[0] == 3
+    # A rejected sale leaves no day row behind
+    sell(r, "2017-01-08", 10 ** 6)
+    assert day_row(db, r, "2017-01-08") is None
+    assert drift(db) == []
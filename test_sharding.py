@@ -0,0 +1,215 @@
+# test_sharding.py
+# python -m pytest -q test_sharding.py
+import sqlite3
+import threading
+
+import pytest
+
+import sharding
+from app import app
+from db_pool import get_pool
+from inventory_crud import use_database
+from sharding import ShardMap, split_database
+from synthetic_data import generate
+
+
+@pytest.fixture(scope="module")
+def source(tmp_path_factory):
+    # 10 stores in 5 cities; the single database every sharded read is compared with
+    path = str(tmp_path_factory.mktemp("source") / "inventory.db")
+    generate(path, lines=3000, seed=7)
+    return path
+
+
+def store_cities(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return dict(conn.execute("SELECT s.StoreId, c.CityName FROM Stores s JOIN Cities c USING (CityId);"))
+    finally:
+        conn.close()
+
+
+def split(source, tmp_path, monkeypatch, **placement):
+    shards = ShardMap({"a": str(tmp_path / "a.db"), "b": str(tmp_path / "b.db")}, primary="a", **placement)
+    split_database(source, shards)
+    monkeypatch.setattr(sharding, "_shard_map", shards)
+    return shards
+
+
+@pytest.fixture
+def shards(source, tmp_path, monkeypatch):
+    """Stores 1-5 on shard a (the primary), 6-10 on shard b."""
+    shards = split(source, tmp_path, monkeypatch, by="store", stores=[[1, 5, "a"], [6, 10, "b"]])
+    yield shards
+    for path in shards.shards.values():
+        get_pool(path).close()
+
+
+def query(db_path, sql, params=()):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def on_each(shards, sql, params=()):
+    return {name: query(path, sql, params) for name, path in shards.shards.items()}
+
+
+def stores_on(db_path, table):
+    return {store for (store,) in query(db_path, f"SELECT DISTINCT StoreId FROM {table};")}
+
+
+# ---------- Routing ----------
+def test_routing_by_store_range(shards):
+    assert [shards.shard_of(s) for s in (1, 5, 6, 10)] == ["a", "a", "b", "b"]
+    # Outside every range, or not a store id at all: the primary
+    assert shards.shard_of(11) == "a"
+    assert shards.shard_of("x") == "a"
+    assert shards.shard_of(None) == "a"
+    assert stores_on(shards.shards["a"], "Invoices") <= {1, 2, 3, 4, 5}
+    assert stores_on(shards.shards["b"], "Sales") <= {6, 7, 8, 9, 10}
+
+
+def test_routing_by_city(source, tmp_path, monkeypatch):
+    cities = store_cities(source)
+    on_b = sorted(set(cities.values()))[:2]
+    shards = split(source, tmp_path, monkeypatch, by="city", cities={city: "b" for city in on_b})
+    for store_id, city in cities.items():
+        assert shards.shard_of(store_id) == ("b" if city in on_b else "a")
+    assert shards.shard_of(99999) == "a"
+    expected_b = {s for s, c in cities.items() if c in on_b}
+    assert stores_on(shards.shards["b"], "Invoices") == expected_b & stores_on(source, "Invoices")
+    assert not stores_on(shards.shards["a"], "Invoices") & expected_b
+    for path in shards.shards.values():
+        get_pool(path).close()
+
+
+# ---------- Fan-out reads ----------
+def read_all(url):
+    """Every row of a list endpoint, following the `next` links."""
+    client = app.test_client()
+    rows = []
+    while url:
+        payload = client.get(url).get_json()
+        rows.extend(payload["data"])
+        url = payload["next"]
+    return rows
+
+
+def unsharded(monkeypatch, fn, *args):
+    with monkeypatch.context() as m:
+        m.setattr(sharding, "_shard_map", None)
+        return fn(*args)
+
+
+@pytest.mark.parametrize("url", [
+    "/api/invoices?limit=37",
+    "/api/sales?limit=29",
+    "/api/sales?limit=50&store_id=7",
+    "/api/invoices?limit=1000&date_from=2016-01-03",
+])
+def test_fan_out_lists_match_one_database(source, shards, monkeypatch, url):
+    with use_database(source):
+        expected = unsharded(monkeypatch, read_all, url)
+    with use_database(shards.primary_path):
+        merged = read_all(url)
+    assert expected
+    # Sharded pages carry the store column; the rows are the same, in the same order
+    assert [{k: r[k] for k in e} for r, e in zip(merged, expected)] == expected
+    assert len(merged) == len(expected)
+
+
+@pytest.mark.parametrize("group_by", ["product", "store", "city", "month", "store,date"])
+def test_fan_out_revenue_report_matches_one_database(source, shards, monkeypatch, group_by):
+    client = app.test_client()
+    url = f"/api/reports/revenue?from=2016-01-01&to=2030-12-31&group_by={group_by}&limit=25"
+    with use_database(source):
+        expected = unsharded(monkeypatch, lambda: client.get(url).get_json())
+    with use_database(shards.primary_path):
+        merged = client.get(url).get_json()
+    assert expected["data"]
+    assert merged == expected
+
+
+# ---------- Cross-shard writes ----------
+def stocked(db_path, store_id):
+    """(city, product name, size, quantity) of a product the store has in stock."""
+    return query(db_path, """
+        SELECT c.CityName, p.ProductName, p.Size, sl.Quantity
+        FROM StockLevels sl JOIN Products p USING (ProductId)
+        JOIN Stores s USING (StoreId) JOIN Cities c USING (CityId)
+        WHERE sl.StoreId = ? AND sl.Quantity >= 2 ORDER BY sl.ProductId LIMIT 1;
+    """, (store_id,))[0]
+
+
+def sale(db_path, store_id):
+    city, product_name, size, _ = stocked(db_path, store_id)
+    return {"city": city, "store_id": store_id, "product_name": product_name, "size": size,
+            "sale_date": "2031-01-01", "quantity": 1, "sale_price": 10}
+
+
+def test_bulk_reports_each_row_when_one_shard_fails(shards):
+    a, b = shards.shards["a"], shards.shards["b"]
+    conn = sqlite3.connect(b)
+    conn.execute("CREATE TRIGGER fail_sales BEFORE INSERT ON Sales BEGIN SELECT RAISE(ABORT, 'disk full'); END;")
+    conn.commit()
+    conn.close()
+    sales_before = on_each(shards, "SELECT COUNT(*) FROM Sales;")
+
+    result = sharding._bulk_record_sales([sale(a, 2), sale(b, 7), sale(a, 3), {"store_id": 8}])
+    assert [row["status"] for row in result["rows"]] == ["recorded", "error", "recorded", "error"]
+    assert result["rows"][1]["error"].startswith("Shard 'b': Bulk sales load failed")
+    assert (result["accepted"], result["rejected"]) == (2, 2)
+    assert [f["shard"] for f in result["failed_shards"]] == ["b"]
+    # What shard a committed stays; shard b has nothing
+    assert on_each(shards, "SELECT COUNT(*) FROM Sales;") == {"a": [(sales_before["a"][0][0] + 2,)],
+                                                              "b": sales_before["b"]}
+
+    # Nothing committed anywhere: one error
+    result = sharding._bulk_record_sales([sale(b, 7)])
+    assert result["error"].startswith("Bulk sales load failed on every shard")
+
+
+def test_concurrent_claims_of_one_product_id(shards):
+    def buy(store_id, product_id, results):
+        results.append(sharding._add_new_product_purchase(
+            store_id, product_id, f"Claimed {product_id} at {store_id}", "1L", 1, "V",
+            f"2031-02-{product_id % 28 + 1:02d}", 5.0, 1))
+
+    for product_id in range(90000, 90010):
+        results = []
+        threads = [threading.Thread(target=buy, args=(store_id, product_id, results)) for store_id in (2, 7, 8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert sum("error" not in r for r in results) == 1
+    products = on_each(shards, "SELECT ProductId, ProductName, Size FROM Products WHERE ProductId >= 90000;")
+    assert len(products["a"]) == 10
+    assert products["a"] == products["b"]
+
+
+def test_new_vendors_only_for_rows_written(shards):
+    a, b = shards.shards["a"], shards.shards["b"]
+    vendors = "SELECT VendorNumber, VendorName FROM Vendors WHERE VendorName LIKE 'New %' ORDER BY 1;"
+
+    rejected = sharding._update_existing_purchase("NOWHERE", 7, "New Ghost", "No such", "1L", "2031-03-01", 1, 2.0)
+    assert "error" in rejected
+    assert on_each(shards, vendors) == {"a": [], "b": []}
+
+    def purchase(db_path, store_id, vendor_name, product_name=None):
+        city, name, size, _ = stocked(db_path, store_id)
+        return {"city": city, "store_id": store_id, "vendor_name": vendor_name,
+                "product_name": product_name or name, "size": size, "invoice_date": "2031-03-02",
+                "quantity": 2, "purchase_price": 4}
+
+    result = sharding._bulk_add_purchases([
+        purchase(a, 2, "New Kept"), purchase(b, 7, "New Dropped", "No such"), purchase(b, 8, "New Kept"),
+    ])
+    assert [row["status"] for row in result["rows"]] == ["inserted", "error", "inserted"]
+    written = on_each(shards, vendors)
+    assert [name for _, name in written["a"]] == ["New Kept"]
+    # Same number on every shard
+    assert written["a"] == written["b"]
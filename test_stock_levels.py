@@ -0,0 +1,115 @@
+# test_stock_levels.py
+# python -m pytest -q test_stock_levels.py
+import sqlite3
+
+import pytest
+
+import inventory_crud
+from archive import archive_before
+from db_pool import get_pool
+from inventory_crud import use_database
+from stock_levels import verify_stock_levels
+from synthetic_data import generate
+
+
+@pytest.fixture(scope="module")
+def source(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("source") / "inventory.db")
+    generate(path, lines=1500, seed=3)
+    return path
+
+
+@pytest.fixture
+def db(source, tmp_path):
+    """A fresh copy of the synthetic database, used by inventory_crud for the test."""
+    path = str(tmp_path / "inventory.db")
+    with sqlite3.connect(source) as src, sqlite3.connect(path) as dst:
+        src.backup(dst)
+    with use_database(path):
+        yield path
+    get_pool(path).close()
+
+
+def stocked_line(db_path):
+    """An invoice line whose store still holds at least 4 units of the product."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        return dict(conn.execute("""
+            SELECT c.CityName AS city, i.StoreId AS store_id, v.VendorName AS vendor_name,
+                   p.ProductName AS product_name, p.Size AS size, i.InvoiceDate AS invoice_date,
+                   sl.Quantity AS stock
+            FROM InvoiceLines il
+            JOIN Invoices i ON il.InvoiceId = i.InvoiceId
+            JOIN Vendors v ON i.VendorNumber = v.VendorNumber
+            JOIN Products p ON il.ProductId = p.ProductId
+            JOIN Stores s ON i.StoreId = s.StoreId
+            JOIN Cities c ON s.CityId = c.CityId
+            JOIN StockLevels sl ON sl.StoreId = i.StoreId AND sl.ProductId = il.ProductId
+            WHERE il.Quantity > 0 AND sl.Quantity >= 4
+            ORDER BY il.InvoiceLineId LIMIT 1;
+        """).fetchone())
+    finally:
+        conn.close()
+
+
+def drift(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return verify_stock_levels(conn)
+    finally:
+        conn.close()
+
+
+def purchase_row(r, **changes):
+    row = {k: r[k] for k in ("city", "store_id", "vendor_name", "product_name", "size")}
+    row.update(invoice_date="2017-01-05", quantity=3, purchase_price=4.25)
+    row.update(changes)
+    return row
+
+
+def sale_row(r, **changes):
+    row = {k: r[k] for k in ("city", "store_id", "product_name", "size")}
+    row.update(sale_date="2017-01-06", quantity=1, sale_price=9.0)
+    row.update(changes)
+    return row
+
+
+# name -> mutation(r) over the stocked line r; each must leave StockLevels exact
+MUTATIONS = {
+    "new_product_purchase": lambda r: inventory_crud.add_new_product_purchase(
+        r["store_id"], 990001, "Test Gin", "1L", 1, "Test Vendor", "2017-01-01", 9.5, 12),
+    "purchase_new_line": lambda r: inventory_crud.update_existing_purchase(
+        r["city"], r["store_id"], r["vendor_name"], r["product_name"], r["size"], "2017-01-02", 5, 4.0),
+    "purchase_existing_line": lambda r: inventory_crud.update_existing_purchase(
+        r["city"], r["store_id"], r["vendor_name"], r["product_name"], r["size"], r["invoice_date"], 5),
+    "sale": lambda r: inventory_crud.update_sales(
+        r["city"], r["store_id"], r["product_name"], r["size"], "2017-01-03", 2, 10.0),
+    "sale_of_all_stock": lambda r: inventory_crud.update_sales(
+        r["city"], r["store_id"], r["product_name"], r["size"], "2017-01-03", r["stock"], 10.0),
+    "rejected_sale": lambda r: inventory_crud.update_sales(
+        r["city"], r["store_id"], r["product_name"], r["size"], "2017-01-03", r["stock"] + 1, 10.0),
+    "delete_purchase_line": lambda r: inventory_crud.delete_purchase_line(
+        r["city"], r["store_id"], r["vendor_name"], r["product_name"], r["size"], r["invoice_date"]),
+    "bulk_purchases": lambda r: inventory_crud.bulk_add_purchases([
+        purchase_row(r), purchase_row(r, quantity=2), purchase_row(r, product_name="No such product"),
+        purchase_row(r, invoice_date=r["invoice_date"]),
+    ]),
+    "bulk_sales": lambda r: inventory_crud.bulk_record_sales([
+        sale_row(r), sale_row(r, quantity=2), sale_row(r, quantity=r["stock"] + 1), sale_row(r, size="no size"),
+    ]),
+    "archive": lambda r: archive_before("2016-01-03", batch=50),
+}
+
+
+@pytest.mark.parametrize("name", MUTATIONS)
+def test_mutation_keeps_stock_levels_exact(db, name):
+    assert drift(db) == []
+    MUTATIONS[name](stocked_line(db))
+    assert drift(db) == []
+
+
+def test_mutations_in_sequence_keep_stock_levels_exact(db):
+    for name, mutation in MUTATIONS.items():
+        mutation(stocked_line(db))
+        assert drift(db) == [], name
@@ -0,0 +1,135 @@
+# test_write_queue.py
+# python -m pytest -q test_write_queue.py
+import sqlite3
+
+import pytest
+
+from db_pool import get_pool
+from ref_cache import RefCache
+from write_queue import WriteQueue
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "queue.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE Items (Name TEXT PRIMARY KEY);
+        CREATE TABLE Vendors (VendorNumber INTEGER PRIMARY KEY, VendorName TEXT NOT NULL);
+        CREATE TABLE Parents (Id INTEGER PRIMARY KEY);
+        CREATE TABLE Children (
+            Id INTEGER PRIMARY KEY,
+            ParentId INTEGER REFERENCES Parents(Id) DEFERRABLE INITIALLY DEFERRED
+        );
+    """)
+    conn.close()
+    yield path
+    get_pool(path).close()
+
+
+def committed_names(db_path):
+    # A separate connection only sees what has been committed
+    conn = sqlite3.connect(db_path)
+    try:
+        return sorted(row[0] for row in conn.execute("SELECT Name FROM Items;"))
+    finally:
+        conn.close()
+
+
+def insert(tx, name, hooks):
+    tx.cursor().execute("INSERT INTO Items (Name) VALUES (?);", (name,))
+    tx.after_commit(hooks.append, name)
+    return {"inserted": name}
+
+
+def insert_then_reject(tx, name, hooks):
+    insert(tx, name, hooks)
+    return {"error": f"{name} rejected"}
+
+
+def insert_then_raise(tx, name, hooks):
+    insert(tx, name, hooks)
+    raise ValueError(f"{name} failed")
+
+
+def submit_batch(wq, jobs):
+    # Submitted well within the batch window, so they share one transaction
+    return [wq.submit(fn, *args) for fn, *args in jobs]
+
+
+def test_mixed_batch_rolls_back_only_failed_mutations(db_path):
+    wq = WriteQueue(db_path, window_ms=200, max_batch=10)
+    hooks = []
+    futures = submit_batch(wq, [
+        (insert, "a", hooks),
+        (insert_then_reject, "b", hooks),
+        (insert_then_raise, "c", hooks),
+        (insert, "d", hooks),
+    ])
+    assert futures[0].result(5) == {"inserted": "a"}
+    assert futures[1].result(5) == {"error": "b rejected"}
+    with pytest.raises(ValueError, match="c failed"):
+        futures[2].result(5)
+    assert futures[3].result(5) == {"inserted": "d"}
+
+    assert committed_names(db_path) == ["a", "d"]
+    # Hooks of rolled-back mutations never fire
+    assert hooks == ["a", "d"]
+    stats = wq.stats()
+    assert (stats["batches"], stats["committed"], stats["rolled_back"], stats["failed"]) == (1, 2, 2, 0)
+    wq.close()
+
+
+def test_after_commit_runs_once_the_batch_is_durable(db_path):
+    wq = WriteQueue(db_path, window_ms=200, max_batch=10)
+    seen = []
+
+    def insert_and_look(tx, name):
+        insert(tx, name, [])
+        seen.append(("during", committed_names(db_path)))
+        tx.after_commit(lambda: seen.append(("after", committed_names(db_path))))
+        return {"inserted": name}
+
+    futures = submit_batch(wq, [(insert_and_look, "first"), (insert, "second", [])])
+    for future in futures:
+        future.result(5)
+    # Not visible while the batch runs; the hook sees the whole batch committed
+    assert seen == [("during", []), ("after", ["first", "second"])]
+    wq.close()
+
+
+def test_failed_commit_calls_on_abort_and_fails_the_batch(db_path):
+    # As in inventory_crud: an aborted batch clears the lookup cache
+    cache = RefCache()
+    wq = WriteQueue(db_path, window_ms=200, max_batch=10, on_abort=cache.invalidate_all)
+    hooks = []
+
+    def new_vendor(tx):
+        cur = tx.cursor()
+        cur.execute("INSERT INTO Vendors (VendorNumber, VendorName) VALUES (7, 'Acme');")
+        # The lookup caches a row the failed COMMIT will discard
+        assert cache.vendor_number(cur, "Acme") == 7
+        tx.after_commit(hooks.append, "vendor")
+        return {"inserted": "vendor"}
+
+    def orphan_child(tx):
+        # Deferred foreign key: the INSERT passes, COMMIT fails
+        tx.cursor().execute("INSERT INTO Children (Id, ParentId) VALUES (1, 42);")
+        tx.after_commit(hooks.append, "orphan")
+        return {"inserted": "orphan"}
+
+    futures = submit_batch(wq, [(insert, "innocent", hooks), (new_vendor,), (orphan_child,)])
+    for future in futures:
+        with pytest.raises(sqlite3.IntegrityError):
+            future.result(5)
+    assert hooks == []
+    assert committed_names(db_path) == []
+    assert wq.stats()["failed"] == 3
+    conn = sqlite3.connect(db_path)
+    assert cache.vendor_number(conn.cursor(), "Acme") is None
+    conn.close()
+
+    # The writer keeps going after an aborted batch
+    assert wq.submit(insert, "after", hooks).result(5) == {"inserted": "after"}
+    assert committed_names(db_path) == ["after"]
+    wq.close()
@@ -0,0 +1,221 @@
+import contextvars
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from db_pool import get_pool
+
+# How long the writer waits for more mutations before committing a batch
+WRITE_BATCH_WINDOW_MS = float(os.getenv("WRITE_BATCH_WINDOW_MS", "2"))
+# Most mutations committed in one transaction
+WRITE_BATCH_MAX = int(os.getenv("WRITE_BATCH_MAX", "64"))
+
+log = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class Tx:
+    """
+    What a queued mutation runs against: the writer connection, inside the
+    batch transaction and the mutation's own savepoint.
+    Side effects that must only happen once the data is durable (cache
+    invalidation, write listeners) are registered with after_commit().
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._after_commit = []
+
+    def cursor(self, tuples=False):
+        return self.conn.cursor(tuples=tuples)
+
+    def after_commit(self, fn, *args):
+        self._after_commit.append((fn, args))
+
+
+class _Job:
+    __slots__ = ("fn", "args", "kwargs", "future", "context")
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.context = contextvars.copy_context()
+
+
+# ---------- Single-writer queue with group commit ----------
+class WriteQueue:
+    """
+    Serializes every mutation for one database through a single thread.
+    Mutations queued within a few milliseconds of each other share one
+    BEGIN IMMEDIATE ... COMMIT; each runs in its own savepoint, so a
+    mutation that raises or returns {"error": ...} is rolled back alone.
+    Callers get a Future that resolves after the batch has committed.
+    """
+
+    def __init__(self, db_path, window_ms=WRITE_BATCH_WINDOW_MS, max_batch=WRITE_BATCH_MAX, on_abort=None):
+        self.db_path = db_path
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, int(max_batch))
+        self.on_abort = on_abort
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {"submitted": 0, "committed": 0, "rolled_back": 0, "failed": 0,
+                       "batches": 0, "batch_max": 0, "commit_seconds_total": 0.0}
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+                self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queues fn(tx, *args, **kwargs); returns a Future for its result."""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("A queued mutation cannot wait on another queued mutation.")
+        if self._thread is None:
+            self._start()
+        job = _Job(fn, args, kwargs)
+        with self._lock:
+            self._stats["submitted"] += 1
+        self._queue.put(job)
+        return job.future
+
+    # ----- writer thread -----
+    def _collect(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            try:
+                self._execute(batch)
+            except Exception as e:
+                log.exception("Write batch failed")
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+
+    def _execute(self, batch):
+        conn = get_pool(self.db_path).acquire()
+        try:
+            conn.execute("BEGIN IMMEDIATE;")
+            done = []
+            rolled_back = 0
+            for job in batch:
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                tx = Tx(conn)
+                conn.execute("SAVEPOINT mutation;")
+                try:
+                    result = job.context.run(job.fn, tx, *job.args, **job.kwargs)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO mutation;")
+                    conn.execute("RELEASE mutation;")
+                    rolled_back += 1
+                    job.future.set_exception(e)
+                    continue
+                if isinstance(result, dict) and "error" in result:
+                    conn.execute("ROLLBACK TO mutation;")
+                    conn.execute("RELEASE mutation;")
+                    rolled_back += 1
+                    job.future.set_result(result)
+                    continue
+                conn.execute("RELEASE mutation;")
+                done.append((job, tx, result))
+
+            started = time.perf_counter()
+            try:
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                self._aborted(len(done))
+                raise
+            committed_in = time.perf_counter() - started
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+                self._aborted(0)
+            raise
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["committed"] += len(done)
+            self._stats["rolled_back"] += rolled_back
+            self._stats["batch_max"] = max(self._stats["batch_max"], len(batch))
+            self._stats["commit_seconds_total"] += committed_in
+
+        for job, tx, result in done:
+            for fn, args in tx._after_commit:
+                try:
+                    job.context.run(fn, *args)
+                except Exception:
+                    log.exception("after_commit hook %r failed", fn)
+            job.future.set_result(result)
+
+    def _aborted(self, jobs):
+        with self._lock:
+            self._stats["failed"] += jobs
+        if self.on_abort is not None:
+            self.on_abort()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot["db_path"] = self.db_path
+        snapshot["queued"] = self._queue.qsize()
+        snapshot["window_ms"] = self.window * 1000.0
+        snapshot["commit_seconds_total"] = round(snapshot["commit_seconds_total"], 6)
+        return snapshot
+
+    def close(self, timeout=5):
+        """Finishes queued mutations, then stops the writer thread."""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+
+# ---------- Per-database registry ----------
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_write_queue(db_path, on_abort=None):
+    """Returns the WriteQueue for db_path; on_abort only applies when it is created."""
+    wq = _queues.get(db_path)
+    if wq is None:
+        with _queues_lock:
+            wq = _queues.get(db_path)
+            if wq is None:
+                wq = _queues[db_path] = WriteQueue(db_path, on_abort=on_abort)
+    return wq
+
+
+def write_queue_stats():
+    return {path: wq.stats() for path, wq in list(_queues.items())}
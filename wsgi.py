@@ -0,0 +1,9 @@
+# wsgi.py
+# Production entry point for a threaded WSGI server, e.g.
+#   gunicorn -c gunicorn.conf.py wsgi:application
+#   waitress-serve --threads=8 wsgi:application
+# Run a single process: writes are serialized by the in-process database
+# executor, and SQLite allows only one writer per database anyway.
+from app import app
+
+application = app